@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class JoinConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'join'
+
+    def ready(self):
+        # Register the signal handlers
+        from join import signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from join.db import configure_sqlite_connection, install_unique_user_email
+        from join.middleware import install_query_recorder
+        from join.search import install_task_search, backfill_contact_search_keys
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='configure_sqlite_connection')
+        connection_created.connect(install_query_recorder, dispatch_uid='install_query_recorder')
+        # The FTS5 index is raw SQL outside of the models, create it once the tables exist
+        post_migrate.connect(install_task_search, sender=self, dispatch_uid='install_task_search')
+        post_migrate.connect(backfill_contact_search_keys, sender=self, dispatch_uid='backfill_contact_search_keys')
+        post_migrate.connect(install_unique_user_email, sender=self, dispatch_uid='install_unique_user_email')
@@ -0,0 +1,146 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from join.authentication import aauthenticate
+from join.etags import make_etag
+from join.fast_serializers import task_reader, subtask_reader, contact_reader, user_reader
+from join.models import TaskItem, ContactItem, SubTaskItem, ModelVersion
+from join.streaming import encode_json
+from join import views
+
+
+def json_response(data, status=200):
+    # Same bytes as the DRF views render
+    return HttpResponse(encode_json(data), content_type='application/json', status=status)
+
+
+class AsyncReadView(View):
+    """ Base class for the async read views, authenticates the token without leaving the event loop.
+
+    The rows are read with the FastReader of the sync view through the async ORM. Requests with query parameters
+    (pagination, streaming, filters, field selection) are answered by the sync view so both APIs stay the same.
+    """
+
+    http_method_names = ['get', 'head', 'options']
+    authentication_required = True
+    # Models of the ETag, the same ones as etag_for() of the sync view
+    etag_models = ()
+    sync_view = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await aauthenticate(request)
+        except AuthenticationFailed as exc:
+            return self.unauthorized(exc.detail)
+        if user is None and self.authentication_required:
+            return self.unauthorized('Authentication credentials were not provided.')
+        if user is not None:
+            request.user = user
+        if request.GET and request.method in ('GET', 'HEAD'):
+            return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+        versions = await ModelVersion.aget_versions(*self.etag_models)
+        etag = quote_etag(make_etag(request, versions, user.pk if user is not None else None))
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            response = HttpResponseNotModified()
+        else:
+            response = await super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+        return response
+
+    def unauthorized(self, detail):
+        response = json_response({'detail': detail}, status=401)
+        response['WWW-Authenticate'] = 'Token'
+        return response
+
+
+class AsyncListTasks(AsyncReadView):
+    """ Async view to load all tasks from the database """
+
+    etag_models = (TaskItem, SubTaskItem, ContactItem, User)
+    sync_view = staticmethod(views.ListTasks.as_view())
+
+    async def get(self, request):
+        return json_response(await task_reader.aread(TaskItem.objects.all()))
+
+
+class AsyncTaskDetailView(AsyncReadView):
+    """ Async view to load a single task by its ID from the database. """
+
+    authentication_required = False
+    etag_models = (TaskItem, SubTaskItem, ContactItem, User)
+    sync_view = staticmethod(views.TaskDetailView.as_view())
+
+    async def get(self, request, pk):
+        return json_response(await task_reader.aread(TaskItem.objects.filter(id=pk)))
+
+
+class AsyncListSubTasks(AsyncReadView):
+    """ Async view to load all subtasks from the database """
+
+    etag_models = (SubTaskItem,)
+    sync_view = staticmethod(views.ListSubTasks.as_view())
+
+    async def get(self, request):
+        return json_response(await subtask_reader.aread(SubTaskItem.objects.all()))
+
+
+class AsyncSubTaskDetailView(AsyncReadView):
+    """ Async view to load a single subtask by its ID from the database. """
+
+    authentication_required = False
+    etag_models = (SubTaskItem,)
+    sync_view = staticmethod(views.SubTaskDetailView.as_view())
+
+    async def get(self, request, pk):
+        return json_response(await subtask_reader.aread(SubTaskItem.objects.filter(id=pk)))
+
+
+class AsyncTaskSubtasksView(AsyncReadView):
+    """ Async view to list all subtasks for a specific task. """
+
+    authentication_required = False
+    etag_models = (SubTaskItem,)
+    sync_view = staticmethod(views.TaskSubtasksView.as_view())
+
+    async def get(self, request, task_id):
+        subtasks = await subtask_reader.aread(SubTaskItem.objects.filter(task_id=task_id))
+        if not subtasks:
+            return json_response({'detail': 'No subtasks found for this task.'}, status=404)
+        return json_response(subtasks)
+
+
+class AsyncListContacts(AsyncReadView):
+    """ Async view to load all contacts from the database """
+
+    etag_models = (ContactItem,)
+    sync_view = staticmethod(views.ListContacts.as_view())
+
+    async def get(self, request):
+        return json_response(await contact_reader.aread(ContactItem.objects.all()))
+
+
+class AsyncContactDetailView(AsyncReadView):
+    """ Async view to load a single contact by its ID from the database. """
+
+    authentication_required = False
+    etag_models = (ContactItem,)
+    sync_view = staticmethod(views.ContactDetailView.as_view())
+
+    async def get(self, request, pk):
+        return json_response(await contact_reader.aread(ContactItem.objects.filter(id=pk)))
+
+
+class AsyncListUsers(AsyncReadView):
+    """ Async view to load all users from the database. """
+
+    etag_models = (User,)
+    sync_view = staticmethod(views.ListUsers.as_view())
+
+    async def get(self, request):
+        return json_response(await user_reader.aread(User.objects.all()))
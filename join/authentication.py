@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class TokenCache:
+    """ Bounded LRU cache with a TTL mapping token keys to their resolved (user, token). """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'JOIN_TOKEN_CACHE_SIZE', 1024)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'JOIN_TOKEN_CACHE_TTL', 60)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_key(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (_, (user, _)) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# One cache per worker process, the signal handlers in join.signals keep it in sync with this process' writes
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ Drop-in TokenAuthentication that skips the token and user query for recently seen tokens. """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token))
+        return user, token
+
+
+async def aauthenticate(request):
+    """ Async counterpart of CachedTokenAuthentication, returns the user or None without credentials. """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed('Invalid token header.')
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed('Invalid token header. Token string should not contain invalid characters.')
+
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached[0]
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        raise AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise AuthenticationFailed('User inactive or deleted.')
+    token_cache.set(key, (token.user, token))
+    return token.user
+
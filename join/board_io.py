@@ -0,0 +1,282 @@
+import datetime
+import json
+import shutil
+import tempfile
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction, DEFAULT_DB_ALIAS
+from django.utils import timezone
+from join.db import read_snapshot, snapshot_blocks_writers
+from join.models import TaskItem, ContactItem, SubTaskItem, ModelVersion, STATES, PRIORITIES
+from join.streaming import encode_json
+
+BOARD_FORMAT_VERSION = 1
+
+# (field in the file, column) of every row type, foreign keys are written as the ids of the exporting database
+CONTACT_COLUMNS = (('id', 'id'), ('first_name', 'first_name'), ('last_name', 'last_name'), ('created_at', 'created_at'))
+TASK_COLUMNS = (
+    ('id', 'id'), ('title', 'title'), ('description', 'description'), ('contact', 'contact_id'),
+    # Users are not exported, tasks reference their author by username
+    ('author', 'author__username'), ('created_at', 'created_at'), ('priority', 'priority'), ('due_date', 'due_date'),
+    ('state', 'state'), ('position', 'position'),
+)
+SUBTASK_COLUMNS = (('id', 'id'), ('task', 'task_id'), ('title', 'title'), ('isDone', 'isDone'), ('created_at', 'created_at'))
+
+STATE_VALUES = {value for value, _ in STATES}
+PRIORITY_VALUES = {value for value, _ in PRIORITIES}
+
+
+def check_value(model, name, value, value_type=str):
+    """ Checks the type and the validators (max_length, integer range) of a field value of a board file.
+
+    Imported rows must pass the checks of the serializers when they are edited later.
+    """
+    # bool is an int subclass, it is no valid position and no number is a valid isDone
+    if type(value) is not value_type:
+        raise ValueError(f'{name} must be a {value_type.__name__}')
+    try:
+        model._meta.get_field(name).run_validators(value)
+    except ValidationError as error:
+        raise ValueError(f'{name}: {" ".join(error.messages)}')
+    return value
+
+
+def parse_date(value):
+    # Validates an ISO date and keeps the string, which is how SQLite stores dates anyway
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+class BoardImportError(Exception):
+    """ Raised for an invalid line of a board file, the import is rolled back. """
+
+    def __init__(self, line_number, message):
+        super().__init__(f'Line {line_number}: {message}')
+        self.line_number = line_number
+        self.message = message
+
+
+def iter_board_ndjson(chunk_size=2000):
+    """ Yields the contacts, tasks and subtasks as NDJSON lines with constant memory, referenced rows come first. """
+    yield encode_json({'type': 'board', 'version': BOARD_FORMAT_VERSION}) + '\n'
+    # All three tables are read from one snapshot, otherwise a concurrent write could export a subtask whose task
+    # was not exported
+    using = router.db_for_read(TaskItem)
+    with read_snapshot(connections[using]):
+        for type_name, model, columns in [
+            ('contact', ContactItem, CONTACT_COLUMNS),
+            ('task', TaskItem, TASK_COLUMNS),
+            ('subtask', SubTaskItem, SUBTASK_COLUMNS),
+        ]:
+            names = ('type',) + tuple(name for name, _ in columns)
+            rows = model.objects.using(using).order_by('id').values_list(*[column for _, column in columns])
+            for values in rows.iterator(chunk_size=chunk_size):
+                yield encode_json(dict(zip(names, (type_name,) + values))) + '\n'
+
+
+def iter_board_download(chunk_size=2000):
+    """ Yields the board file for a download, the snapshot is never held while waiting for a slow client.
+
+    Without WAL the snapshot keeps every writer from committing, so the file is written to a temporary file first
+    and sent from there.
+    """
+    if not snapshot_blocks_writers(connections[router.db_for_read(TaskItem)]):
+        yield from iter_board_ndjson(chunk_size)
+        return
+    with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, mode='w+', encoding='utf-8',
+                                       dir=settings.FILE_UPLOAD_TEMP_DIR) as spool:
+        spool.writelines(iter_board_ndjson(chunk_size))
+        spool.seek(0)
+        yield from iter(partial(spool.read, 64 * 1024), '')
+
+
+def iter_lines(stream):
+    """ Yields (line number, line) of the non-empty lines of a binary stream, read line by line. """
+    for line_number, line in enumerate(iter(stream.readline, b''), start=1):
+        line = line.strip()
+        if line:
+            yield line_number, line
+
+
+def spool_upload(stream):
+    """ Copies an uploaded stream to a temporary file, kept in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE.
+
+    The import transaction holds the write lock, it must not wait for a slow client to send the file.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, dir=settings.FILE_UPLOAD_TEMP_DIR)
+    shutil.copyfileobj(stream, spool)
+    spool.seek(0)
+    return spool
+
+
+def insert_rows(model, fields, rows, using=DEFAULT_DB_ALIAS):
+    """ Inserts rows of database-ready values with multi-row INSERT ... RETURNING, returns the new ids in row order. """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    per_statement = max(1, connection.features.max_query_params // len(fields))
+    placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), per_statement):
+            batch = rows[start:start + per_statement]
+            sql = (f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES {", ".join([placeholder] * len(batch))} '
+                   f'RETURNING {quote(model._meta.pk.column)}')
+            cursor.execute(sql, [value for row in batch for value in row])
+            ids.extend(row[0] for row in cursor.fetchall())
+    return ids
+
+
+class BoardImporter:
+    """ Inserts the rows of a board file in large batches, remapping the exported ids to the new ones. """
+
+    # Fields of the queued value tuples, every other field keeps its database default
+    FIELDS = {
+        ContactItem: ('first_name', 'last_name', 'created_at', 'name_key', 'reversed_name_key', 'updated_at'),
+        TaskItem: ('title', 'description', 'contact', 'author', 'created_at', 'priority', 'due_date', 'state',
+                   'position', 'subtask_count', 'subtask_done_count', 'updated_at'),
+        SubTaskItem: ('title', 'created_at', 'isDone', 'task', 'updated_at'),
+    }
+
+    def __init__(self, default_author, batch_size=5000):
+        self.default_author = default_author
+        self.batch_size = batch_size
+        # Shared by every row instead of an auto_now value per instance, finish() stamps the rows again at the end
+        self.now = connections[DEFAULT_DB_ALIAS].ops.adapt_datetimefield_value(timezone.now())
+        # Exported id -> new id, the only state growing with the size of the board
+        self.contact_ids = {}
+        self.task_ids = {}
+        self.authors = {}
+        self.pending = {ContactItem: [], TaskItem: [], SubTaskItem: []}
+        self.counts = {'contacts': 0, 'tasks': 0, 'subtasks': 0}
+        # Model -> (first, last) new id
+        self.id_ranges = {}
+
+    def run(self, lines):
+        with transaction.atomic():
+            seen_header = False
+            for line_number, line in lines:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    raise BoardImportError(line_number, 'Invalid JSON.')
+                if not isinstance(row, dict):
+                    raise BoardImportError(line_number, 'Expected a JSON object.')
+                if not seen_header:
+                    if row.get('type') != 'board' or row.get('version') != BOARD_FORMAT_VERSION:
+                        raise BoardImportError(line_number, f'Expected a board header of version {BOARD_FORMAT_VERSION}.')
+                    seen_header = True
+                    continue
+                self.add(line_number, row)
+            if not seen_header:
+                raise BoardImportError(1, 'The board file is empty.')
+            for model in self.pending:
+                self.flush(model)
+            self.finish()
+        return self.counts
+
+    def add(self, line_number, row):
+        try:
+            if row.get('type') == 'contact':
+                self.add_contact(row)
+            elif row.get('type') == 'task':
+                self.add_task(row)
+            elif row.get('type') == 'subtask':
+                self.add_subtask(row)
+            else:
+                raise BoardImportError(line_number, f'Unknown row type {row.get("type")!r}.')
+        except (KeyError, TypeError, ValueError) as error:
+            raise BoardImportError(line_number, f'Invalid {row.get("type")} row: {error!r}.')
+
+    def add_contact(self, row):
+        contact = ContactItem(first_name=check_value(ContactItem, 'first_name', row['first_name']),
+                              last_name=check_value(ContactItem, 'last_name', row['last_name']))
+        contact.set_name_keys()
+        self.queue(ContactItem, row['id'], (
+            contact.first_name, contact.last_name, parse_date(row['created_at']), contact.name_key,
+            contact.reversed_name_key, self.now,
+        ))
+
+    def add_task(self, row):
+        # Tasks may only reference contacts of earlier lines
+        self.flush(ContactItem)
+        contact_id = None
+        if row['contact'] is not None:
+            contact_id = self.contact_ids.get(row['contact'])
+            if contact_id is None:
+                raise ValueError(f'unknown contact {row["contact"]}')
+        if row['priority'] not in PRIORITY_VALUES or row['state'] not in STATE_VALUES:
+            raise ValueError('invalid priority or state')
+        # The subtask counters are recounted by finish()
+        self.queue(TaskItem, row['id'], (
+            check_value(TaskItem, 'title', row['title']), check_value(TaskItem, 'description', row['description']),
+            contact_id, self.get_author_id(row['author']), parse_date(row['created_at']), row['priority'],
+            parse_date(row['due_date']), row['state'], check_value(TaskItem, 'position', row['position'], int),
+            0, 0, self.now,
+        ))
+
+    def add_subtask(self, row):
+        self.flush(TaskItem)
+        task_id = self.task_ids.get(row['task'])
+        if task_id is None:
+            raise ValueError(f'unknown task {row["task"]}')
+        self.queue(SubTaskItem, row['id'], (
+            check_value(SubTaskItem, 'title', row['title']), parse_date(row['created_at']),
+            check_value(SubTaskItem, 'isDone', row['isDone'], bool), task_id, self.now,
+        ))
+
+    def get_author_id(self, username):
+        # Authors missing in this database become the importing user
+        if username not in self.authors:
+            user_id = User.objects.filter(username=username).values_list('id', flat=True).first()
+            self.authors[username] = user_id or self.default_author.pk
+        return self.authors[username]
+
+    def queue(self, model, old_id, values):
+        pending = self.pending[model]
+        pending.append((old_id, values))
+        if len(pending) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model):
+        pending = self.pending[model]
+        if not pending:
+            return
+        # Plain value tuples skip the per-field compilation of bulk_create(), which dominated the import time
+        created = insert_rows(model, self.FIELDS[model], [values for _, values in pending])
+        if model is ContactItem:
+            self.contact_ids.update((old_id, pk) for (old_id, _), pk in zip(pending, created))
+            self.counts['contacts'] += len(created)
+        elif model is TaskItem:
+            self.task_ids.update((old_id, pk) for (old_id, _), pk in zip(pending, created))
+            self.counts['tasks'] += len(created)
+        else:
+            self.counts['subtasks'] += len(created)
+        first, last = min(created), max(created)
+        if model in self.id_ranges:
+            first, last = min(first, self.id_ranges[model][0]), max(last, self.id_ranges[model][1])
+        self.id_ranges[model] = (first, last)
+        pending.clear()
+
+    def finish(self):
+        # Rows stamped with the start of a long import would be older than the overlap of the change feed by the
+        # time they are committed, so clients syncing meanwhile would never see them. Stamping them now with one
+        # UPDATE per model keeps them within it. The ranges cover all new rows, stamping or recounting any other
+        # row in them is harmless
+        now = timezone.now()
+        for model, id_range in self.id_ranges.items():
+            if model is TaskItem:
+                TaskItem.objects.filter(pk__range=id_range).recount_subtasks()
+            else:
+                model.objects.filter(pk__range=id_range).update(updated_at=now)
+        # One version bump per model instead of per row, it also changes the keys of the cached responses.
+        # No events are published for imports
+        for model in (ContactItem, TaskItem, SubTaskItem):
+            ModelVersion.bump(model)
+
+
+def import_board(lines, default_author, batch_size=5000):
+    """ Imports a board from (line number, line) pairs in one transaction, returns the number of created rows. """
+    return BoardImporter(default_author, batch_size).run(lines)
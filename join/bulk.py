@@ -0,0 +1,192 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, IntegerField
+from django.utils import timezone
+from join.models import TaskItem, SubTaskItem
+from join.serializers import TaskItemSerializer, NestedSubTaskItemSerializer, TaskMoveSerializer
+from join.signals import bulk_saved, bulk_deleted, deleting_in_bulk
+
+
+def check_bulk_items(items):
+    """ Returns an error response body if the request data is not a usable list of items, else None. """
+    max_items = getattr(settings, 'JOIN_BULK_MAX_ITEMS', 1000)
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return {'error': 'Expected a list of objects.'}
+    if not items:
+        return {'error': 'The list must not be empty.'}
+    if len(items) > max_items:
+        return {'error': f'At most {max_items} items are allowed per request.'}
+    return None
+
+
+def check_bulk_ids(ids):
+    """ Returns an error response body if the ids are not a usable list of integers, else None. """
+    max_items = getattr(settings, 'JOIN_BULK_MAX_ITEMS', 1000)
+    if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        return {'ids': 'Expected a non-empty list of ids.'}
+    if len(ids) > max_items:
+        return {'ids': f'At most {max_items} ids are allowed per request.'}
+    return None
+
+
+def validate_tasks_with_subtasks(items, author):
+    """ Validates new tasks and their nested subtasks, returns (validated tasks, validated subtask lists, errors). """
+    subtask_serializers = []
+    data = []
+    for item in items:
+        item = dict(item)
+        subtask_serializers.append(NestedSubTaskItemSerializer(data=item.pop('subtasks', []), many=True))
+        item['author'] = author.id  # Add the author using the current user
+        data.append(item)
+
+    serializer = TaskItemSerializer(data=data, many=True)
+    tasks_valid = serializer.is_valid()
+    subtasks_valid = [subtask_serializer.is_valid() for subtask_serializer in subtask_serializers]
+    if tasks_valid and all(subtasks_valid):
+        return serializer.validated_data, [subtask_serializer.validated_data for subtask_serializer in subtask_serializers], None
+
+    # One error entry per submitted task, empty for valid tasks
+    errors = list(serializer.errors) if not tasks_valid else [{} for _ in items]
+    for index, subtask_serializer in enumerate(subtask_serializers):
+        if not subtasks_valid[index]:
+            errors[index] = dict(errors[index], subtasks=subtask_serializer.errors)
+    return None, None, errors
+
+
+def create_tasks_with_subtasks(validated_tasks, validated_subtasks):
+    """ Inserts all tasks and their subtasks with two bulk inserts in one transaction. """
+    with transaction.atomic():
+        tasks = TaskItem.objects.bulk_create([TaskItem(**task) for task in validated_tasks])
+        subtasks = SubTaskItem.objects.bulk_create([
+            SubTaskItem(task=task, **subtask)
+            for task, subtasks in zip(tasks, validated_subtasks)
+            for subtask in subtasks
+        ])
+        bulk_saved.send(sender=TaskItem, ids=[task.pk for task in tasks], created=True)
+        if subtasks:
+            bulk_saved.send(sender=SubTaskItem, ids=[subtask.pk for subtask in subtasks], created=True, instances=subtasks)
+    return tasks
+
+
+def create_items(model, serializer_class, items):
+    """ Validates and inserts the items with one bulk insert, returns (instances, errors). """
+    serializer = serializer_class(data=items, many=True)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    with transaction.atomic():
+        instances = model.objects.bulk_create([model(**item) for item in serializer.validated_data])
+        bulk_saved.send(sender=model, ids=[instance.pk for instance in instances], created=True, instances=instances)
+    return instances, None
+
+
+def update_items(model, serializer_class, items):
+    """ Validates partial updates of existing rows and writes them with one bulk update, returns (instances, errors). """
+    ids = [item.get('id') for item in items]
+    with transaction.atomic():
+        instances = model.objects.select_for_update().in_bulk([pk for pk in ids if isinstance(pk, int)])
+        errors = []
+        updates = []
+        fields = set()
+        for pk, item in zip(ids, items):
+            instance = instances.get(pk) if isinstance(pk, int) else None
+            if instance is None:
+                errors.append({'id': f'Invalid pk "{pk}" - object does not exist.'})
+                continue
+            serializer = serializer_class(instance, data=item, partial=True)
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                continue
+            errors.append({})
+            for field, value in serializer.validated_data.items():
+                setattr(instance, field, value)
+                fields.add(field)
+            updates.append(instance)
+
+        if any(errors):
+            return None, errors
+        if fields:
+            # bulk_update() skips auto_now, set the modification time for the change feed ourselves
+            now = timezone.now()
+            for instance in updates:
+                instance.updated_at = now
+            model.objects.bulk_update(updates, sorted(fields) + ['updated_at'])
+            bulk_saved.send(sender=model, ids=[instance.pk for instance in updates], created=False, instances=updates)
+    return updates, None
+
+
+def delete_items(model, ids):
+    """ Deletes all rows with one queryset delete, returns the missing ids instead if any do not exist.
+
+    The per-row post_delete handlers are switched off, bulk_deleted sends the rows of each model once instead.
+    """
+    with transaction.atomic():
+        queryset = model.objects.filter(pk__in=ids)
+        if model is SubTaskItem:
+            rows = dict(queryset.values_list('pk', 'task_id'))
+        else:
+            rows = dict.fromkeys(queryset.values_list('pk', flat=True))
+        missing = [pk for pk in ids if pk not in rows]
+        if missing:
+            return missing
+        # Subtasks deleted along with their tasks
+        cascaded = list(SubTaskItem.objects.filter(task_id__in=ids).values_list('pk', flat=True)) if model is TaskItem else []
+
+        token = deleting_in_bulk.set(True)
+        try:
+            queryset.delete()
+        finally:
+            deleting_in_bulk.reset(token)
+        if cascaded:
+            bulk_deleted.send(sender=SubTaskItem, ids=cascaded)
+        if model is SubTaskItem:
+            bulk_deleted.send(sender=model, ids=list(rows), task_ids=set(rows.values()))
+        else:
+            bulk_deleted.send(sender=model, ids=list(rows))
+    return []
+
+
+def validate_moves(items):
+    """ Validates the card moves, returns (validated moves, errors). """
+    serializer = TaskMoveSerializer(data=items, many=True)
+    if not serializer.is_valid():
+        return None, serializer.errors
+
+    errors = []
+    seen = set()
+    for move in serializer.validated_data:
+        errors.append({'id': 'Task is moved more than once.'} if move['id'] in seen else {})
+        seen.add(move['id'])
+    if any(errors):
+        return None, errors
+    return serializer.validated_data, None
+
+
+def move_tasks(moves):
+    """ Applies the card moves with one set-based UPDATE per target state, returns the missing ids if any. """
+    moves_by_state = {}
+    for move in moves:
+        moves_by_state.setdefault(move['state'], []).append(move)
+
+    ids = [move['id'] for move in moves]
+    # update() skips auto_now, set the modification time for the change feed ourselves
+    now = timezone.now()
+    with transaction.atomic():
+        moved = 0
+        for state, state_moves in moves_by_state.items():
+            moved += TaskItem.objects.filter(pk__in=[move['id'] for move in state_moves]).update(
+                state=state,
+                position=Case(
+                    *[When(pk=move['id'], then=Value(move['position'])) for move in state_moves],
+                    output_field=IntegerField(),
+                ),
+                updated_at=now,
+            )
+
+        if moved != len(ids):
+            # Only look up which tasks are missing in the error case
+            existing = set(TaskItem.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            transaction.set_rollback(True)
+            return [pk for pk in ids if pk not in existing]
+        bulk_saved.send(sender=TaskItem, ids=ids, created=False)
+    return []
+
@@ -0,0 +1,55 @@
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from join.models import TaskItem, ContactItem, SubTaskItem, Tombstone
+from join.serializers import TaskItemSerializer, ContactItemSerializer, SubTaskItemSerializer
+
+# Response key, model, queryset factory and serializer of every model in the change feed
+CHANGE_FEED = (
+    ('tasks', TaskItem, TaskItem.objects.with_subtask_ids, TaskItemSerializer),
+    ('subtasks', SubTaskItem, SubTaskItem.objects.all, SubTaskItemSerializer),
+    ('contacts', ContactItem, ContactItem.objects.all, ContactItemSerializer),
+)
+
+
+def encode_change_token(moment):
+    """ Change tokens are the microseconds since the epoch, clients should treat them as opaque. """
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_change_token(token):
+    """ Returns the moment of the token or None for a full sync, raises ValueError for invalid tokens. """
+    if not token:
+        return None
+    microseconds = int(token)
+    if microseconds < 0:
+        raise ValueError('Negative change token')
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return epoch + datetime.timedelta(microseconds=microseconds)
+
+
+def get_changes(since):
+    """ Collects all rows created or updated and all rows deleted since the given moment. """
+    until = timezone.now()
+    changes = {}
+    deleted = {}
+    if since is not None:
+        # Writes that were still uncommitted at the previous sync may carry a slightly older timestamp
+        since -= datetime.timedelta(seconds=getattr(settings, 'JOIN_CHANGES_OVERLAP_SECONDS', 2))
+
+    for key, model, get_queryset, serializer_class in CHANGE_FEED:
+        queryset = get_queryset().order_by('updated_at', 'id')
+        tombstones = Tombstone.objects.filter(model=model._meta.label_lower)
+        if since is not None:
+            queryset = queryset.filter(updated_at__gte=since)
+            tombstones = tombstones.filter(deleted_at__gte=since)
+        else:
+            # A full sync returns the current rows, nothing to delete on the client
+            tombstones = tombstones.none()
+        changes[key] = serializer_class(queryset, many=True).data
+        deleted[key] = list(tombstones.order_by('object_id').values_list('object_id', flat=True).distinct())
+
+    changes['deleted'] = deleted
+    changes['next'] = encode_change_token(until)
+    return changes
@@ -0,0 +1,108 @@
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+logger = logging.getLogger('join.db')
+
+# Pragmas stored in the database file, they cannot be set through a read-only connection
+PERSISTENT_PRAGMAS = ('journal_mode',)
+
+
+def is_read_only(settings_dict):
+    return 'mode=ro' in str(settings_dict['NAME'])
+
+
+def apply_pragmas(cursor, pragmas, read_only=False):
+    """ Runs PRAGMA name = value for every configured pragma. """
+    for name, value in pragmas.items():
+        if read_only and name in PERSISTENT_PRAGMAS:
+            continue
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """ Applies JOIN_SQLITE_PRAGMAS to every new SQLite connection. """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, getattr(settings, 'JOIN_SQLITE_PRAGMAS', {}), is_read_only(connection.settings_dict))
+
+
+@contextmanager
+def read_snapshot(connection):
+    """ Runs the enclosed reads of the connection in one read transaction, so they all see the same commit. """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=connection.alias):
+            yield
+        return
+    connection.ensure_connection()
+    # BEGIN DEFERRED takes no write lock, unlike atomic() with the IMMEDIATE transactions of the production
+    # profile. With WAL the snapshot starts at the first read and writers keep going, without WAL they wait.
+    connection.connection.execute('BEGIN DEFERRED')
+    try:
+        yield
+    finally:
+        connection.connection.execute('COMMIT')
+
+
+def snapshot_blocks_writers(connection):
+    """ Whether a read_snapshot() of the connection keeps writers from committing, true for SQLite without WAL. """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0].lower() != 'wal'
+
+
+USER_EMAIL_INDEX = 'join_user_email_uniq'
+
+
+def install_unique_user_email(using=DEFAULT_DB_ALIAS, verbosity=1, stdout=None, **kwargs):
+    """ Adds a unique index on the non-empty user emails, runs after migrate as the user table is not ours. """
+    connection = connections[using]
+    if not connection.features.supports_partial_indexes:
+        return
+    quote = connection.ops.quote_name
+    email = quote(get_user_model()._meta.get_field('email').column)
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            # Users created without an email (e.g. by createsuperuser) all share ''
+            cursor.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(USER_EMAIL_INDEX)} "
+                f"ON {quote(get_user_model()._meta.db_table)} ({email}) WHERE {email} <> ''"
+            )
+    except IntegrityError:
+        message = (f'Not creating {USER_EMAIL_INDEX}: several users share an email, '
+                   f'run migrate again once they are unique.')
+        # Part of the migrate command's output, otherwise logged
+        if stdout is None:
+            logger.warning(message)
+        elif verbosity:
+            stdout.write(message)
+
+
+class ReadReplicaRouter:
+    """ Sends reads outside of transactions to the read-only connection named in JOIN_READ_DATABASE. """
+
+    @property
+    def read_alias(self):
+        return getattr(settings, 'JOIN_READ_DATABASE', 'replica')
+
+    def db_for_read(self, model, **hints):
+        # Reads inside a transaction must see its own uncommitted writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self.read_alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases point to the same database file
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,289 @@
+import asyncio
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from join.models import TaskItem, ContactItem, SubTaskItem
+from join.serializers import TaskItemSerializer, ContactItemSerializer, SubTaskItemSerializer
+from join.streaming import encode_json
+
+# Event name and serializer of every model published to the event stream
+EVENT_MODELS = {
+    TaskItem: ('task', TaskItemSerializer),
+    SubTaskItem: ('subtask', SubTaskItemSerializer),
+    ContactItem: ('contact', ContactItemSerializer),
+}
+
+
+class Subscription:
+    """ Queue of events for one connected event stream. """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=getattr(settings, 'JOIN_EVENTS_QUEUE_SIZE', 1000))
+        self.closed = False
+        # Set by aiter_events(), called from any thread after an event was queued or the subscription closed
+        self.notify = None
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.closed = True
+            raise
+        finally:
+            if self.notify is not None:
+                self.notify()
+
+
+class EventHub:
+    """ In-process pub/sub hub fanning out events to the connected event streams of this worker. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._last_id = 0
+        self.history_size = getattr(settings, 'JOIN_EVENTS_HISTORY', 100)
+        self._history = deque(maxlen=self.history_size)
+
+    def subscribe(self, last_event_id=None):
+        """ Returns a new subscription, pre-filled with the buffered events after last_event_id. """
+        subscription = Subscription()
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event[0] > last_event_id:
+                        subscription.put(event)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def dispatch(self, event_type, payload, event_id=None):
+        """ Delivers an already encoded event to all subscriptions, slow subscribers are closed.
+
+        Events get the next id of this hub unless the broker numbered them already.
+        """
+        with self._lock:
+            self._last_id = self._last_id + 1 if event_id is None else event_id
+            event = (self._last_id, event_type, payload)
+            self._history.append(event)
+            for subscription in list(self._subscriptions):
+                try:
+                    subscription.put(event)
+                except queue.Full:
+                    # The client stopped reading, it resumes from its Last-Event-ID after reconnecting
+                    self._subscriptions.discard(subscription)
+
+
+class InProcessBroker:
+    """ Delivers events to the streams of the current process only, enough for a single worker. """
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        pass
+
+    def wants_events(self):
+        # Skip the serialization of events nobody listens to
+        return self.hub.has_subscribers()
+
+    def publish(self, event_type, payload):
+        self.hub.dispatch(event_type, payload)
+
+
+def read_last_line(file, chunk_size=4096):
+    """ Returns the last complete line of a binary file open for reading, or None for an empty file. """
+    end = file.seek(0, os.SEEK_END)
+    data = b''
+    position = end
+    while position > 0:
+        position = max(0, position - chunk_size)
+        file.seek(position)
+        data = file.read(end - position)
+        # The data ends with the newline of the last line, a newline before it starts the line
+        start = data.rfind(b'\n', 0, len(data) - 1)
+        if start != -1:
+            return data[start + 1:]
+    return data or None
+
+
+class FileBroker:
+    """ Shares events between the workers of one host through an append-only NDJSON file each worker tails.
+
+    Events are numbered in the file while it is locked, so every worker sends the same id for the same event and
+    a client can resume from its Last-Event-ID on any worker.
+    """
+
+    poll_interval = 0.2
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.path = getattr(settings, 'JOIN_EVENTS_FILE', settings.BASE_DIR / 'events.ndjson')
+        self.max_bytes = getattr(settings, 'JOIN_EVENTS_FILE_MAX_BYTES', 10 * 1024 * 1024)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            position = self._load_history()
+        threading.Thread(target=self._tail, args=(position,), name='join-events-tail', daemon=True).start()
+
+    def wants_events(self):
+        # Streams of other workers may be listening
+        return True
+
+    def publish(self, event_type, payload):
+        with open(self.path, 'a+b') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                last_line = read_last_line(file)
+                event_id = json.loads(last_line)[0] + 1 if last_line else 1
+                # Start over once the file gets too large, the tailing workers follow the truncation. The ids
+                # continue from the last line
+                if file.tell() > self.max_bytes:
+                    file.truncate(0)
+                file.write((json.dumps([event_id, event_type, payload]) + '\n').encode())
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _load_history(self):
+        # The recent events of the file, so a worker started after them can still replay them on reconnects
+        open(self.path, 'ab').close()
+        with open(self.path, 'rb') as file:
+            fcntl.flock(file, fcntl.LOCK_SH)
+            try:
+                data = file.read()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+        for line in data.splitlines()[-self.hub.history_size:]:
+            self.hub.dispatch(*self._decode(line))
+        return len(data)
+
+    def _decode(self, line):
+        event_id, event_type, payload = json.loads(line)
+        return event_type, payload, event_id
+
+    def _tail(self, position):
+        with open(self.path, 'rb') as file:
+            file.seek(position)
+            while True:
+                position = file.tell()
+                line = file.readline()
+                if line.endswith(b'\n'):
+                    self.hub.dispatch(*self._decode(line))
+                    continue
+                file.seek(position)
+                if os.path.getsize(self.path) < position:
+                    file.seek(0)
+                time.sleep(self.poll_interval)
+
+
+hub = EventHub()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """ Returns the broker configured in JOIN_EVENTS_BROKER, created on first use. """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            broker_class = import_string(getattr(settings, 'JOIN_EVENTS_BROKER', 'join.events.InProcessBroker'))
+            _broker = broker_class(hub)
+    return _broker
+
+
+def publish_change(model, action, instances=None, ids=None):
+    """ Serializes the changed rows and publishes one event per row once the transaction commits. """
+    broker = get_broker()
+    if not broker.wants_events():
+        return
+    name, serializer_class = EVENT_MODELS[model]
+    if action == 'deleted':
+        events = [{'id': pk} for pk in ids]
+    else:
+        if instances is None:
+            instances = model.objects.filter(pk__in=ids)
+            if model is TaskItem:
+                instances = instances.with_subtask_ids()
+        events = serializer_class(instances, many=True).data
+    event_type = f'{name}.{action}'
+    payloads = [encode_json(event) for event in events]
+
+    def publish():
+        for payload in payloads:
+            broker.publish(event_type, payload)
+
+    # Rolled back changes are never announced
+    transaction.on_commit(publish)
+
+
+def format_event(event):
+    """ Formats an event in the text/event-stream wire format. """
+    event_id, event_type, payload = event
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+def iter_events(subscription):
+    """ Yields the events of the subscription in the text/event-stream format until the stream times out.
+
+    Every stream holds a thread while it waits for events, aiter_events() only holds a task of the event loop.
+    """
+    heartbeat = getattr(settings, 'JOIN_EVENTS_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'JOIN_EVENTS_STREAM_TIMEOUT', 300)
+    try:
+        # Tell EventSource clients how fast to reconnect after the stream ends
+        yield 'retry: 3000\n\n'
+        while not subscription.closed and time.monotonic() < deadline:
+            try:
+                event = subscription.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+
+async def aiter_events(subscription):
+    """ Async version of iter_events() for ASGI servers, waiting for events without blocking a thread. """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    subscription.notify = partial(loop.call_soon_threadsafe, ready.set)
+    heartbeat = getattr(settings, 'JOIN_EVENTS_HEARTBEAT', 15)
+    deadline = loop.time() + getattr(settings, 'JOIN_EVENTS_STREAM_TIMEOUT', 300)
+    try:
+        yield 'retry: 3000\n\n'
+        while not subscription.closed and loop.time() < deadline:
+            try:
+                event = subscription.queue.get_nowait()
+            except queue.Empty:
+                # Events queued from now on set it again once this task waits
+                ready.clear()
+                try:
+                    await asyncio.wait_for(ready.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        subscription.notify = None
+        hub.unsubscribe(subscription)
@@ -0,0 +1,63 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class HashingPoolSaturated(Exception):
+    """ Raised when all hashing workers are busy and the queue is full, the views answer 503. """
+
+
+class HashingPool:
+    """ Runs password hashes on a fixed number of threads, callers beyond workers + queue_size are rejected.
+
+    hashlib releases the GIL while computing PBKDF2, so the hashes run in parallel with the request threads and the
+    number of workers is the number of cores they may take away from other requests.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='join-hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, func, *args):
+        """ Returns func(*args) computed by a worker, waits while the pool is busy or raises HashingPoolSaturated. """
+        if not self.slots.acquire(blocking=False):
+            raise HashingPoolSaturated
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = getattr(settings, 'JOIN_HASHING_WORKERS', None) or max(1, (os.cpu_count() or 2) // 2)
+                _pool = HashingPool(workers, getattr(settings, 'JOIN_HASHING_QUEUE_SIZE', 16))
+    return _pool
+
+
+def reset_hashing_pool():
+    global _pool
+    _pool = None
+
+
+# Threads do not survive a fork, workers of a prefork server start their own pool
+os.register_at_fork(after_in_child=reset_hashing_pool)
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """ PBKDF2PasswordHasher computing every hash on the hashing pool, stored hashes are unchanged. """
+
+    def encode(self, password, salt, iterations=None):
+        return get_hashing_pool().run(super().encode, password, salt, iterations)
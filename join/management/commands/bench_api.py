@@ -0,0 +1,346 @@
+import datetime
+import json
+import logging
+import math
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.authtoken.models import Token
+from join.board_io import BOARD_FORMAT_VERSION
+from join.models import TaskItem, ContactItem, SubTaskItem, ModelVersion, Tombstone
+from join.response_cache import response_cache
+from join.signals import deleting_in_bulk
+
+BENCH_PASSWORD = 'bench-password'
+
+
+# Models whose rows the benchmark creates, deleted again in this order afterwards
+CREATED_MODELS = (SubTaskItem, TaskItem, ContactItem, Tombstone, User)
+
+
+def high_water_marks():
+    # Tokens are keyed by their random key, they are deleted with their bench users
+    return {model: model.objects.aggregate(mark=Max('pk'))['mark'] or 0 for model in CREATED_MODELS}
+
+
+def delete_created_rows(marks):
+    """ Deletes the rows added after high_water_marks() in one transaction, without tombstones or events. """
+    token = deleting_in_bulk.set(True)
+    try:
+        with transaction.atomic():
+            for model, mark in marks.items():
+                model.objects.filter(pk__gt=mark).delete()
+            # Cached responses may still contain the deleted rows
+            for model in (ContactItem, TaskItem, SubTaskItem, User):
+                ModelVersion.bump(model)
+    finally:
+        deleting_in_bulk.reset(token)
+
+
+class Dataset:
+    """ The seeded rows, plus helpers creating fresh rows for the routes that consume one per request. """
+
+    def __init__(self, user, token, tasks, subtasks, contacts):
+        self.user = user
+        self.token = token
+        self.task_ids = [task.pk for task in tasks]
+        self.subtask_ids = [subtask.pk for subtask in subtasks]
+        self.contact_ids = [contact.pk for contact in contacts]
+        self.counter = 0
+
+    def pick(self, ids, i):
+        return ids[i * 7919 % len(ids)]
+
+    def unique(self):
+        self.counter += 1
+        return f'{time.time_ns()}_{self.counter}'
+
+    def new_task(self):
+        return TaskItem.objects.create(title='Bench task', author=self.user).pk
+
+    def new_subtask(self, i):
+        return SubTaskItem.objects.create(title='Bench subtask', task_id=self.pick(self.task_ids, i)).pk
+
+    def new_contact(self):
+        return ContactItem.objects.create(first_name='Bench', last_name='Contact').pk
+
+
+def small_board(rows=10):
+    """ NDJSON board file with the given number of contacts and tasks, and two subtasks per task. """
+    lines = [{'type': 'board', 'version': BOARD_FORMAT_VERSION}]
+    for n in range(1, rows + 1):
+        lines.append({'type': 'contact', 'id': n, 'first_name': 'Imported', 'last_name': f'Contact {n}', 'created_at': '2024-01-01'})
+    for n in range(1, rows + 1):
+        lines.append({'type': 'task', 'id': n, 'title': f'Imported task {n}', 'description': '', 'contact': n,
+                      'author': 'bench_user_0', 'created_at': '2024-01-01', 'priority': 'Low', 'due_date': '2024-02-01',
+                      'state': 'To Do', 'position': n})
+    for n in range(1, 2 * rows + 1):
+        lines.append({'type': 'subtask', 'id': n, 'task': (n + 1) // 2, 'title': f'Imported subtask {n}', 'isDone': False,
+                      'created_at': '2024-01-01'})
+    return ''.join(json.dumps(line) + '\n' for line in lines)
+
+
+# (method, URL pattern, request builder returning (url, body)) of every benchmarked route, string bodies are sent as NDJSON
+ROUTES = [
+    ('POST', 'api/v1/login/', lambda d, i: ('/api/v1/login/', {'username': d.user.username, 'password': BENCH_PASSWORD})),
+    ('POST', 'api/v1/register/', lambda d, i: ('/api/v1/register/', {
+        'username': f'bench_register_{d.unique()}', 'email': f'bench_{d.unique()}@example.com',
+        'password': BENCH_PASSWORD, 'first_name': 'Bench', 'last_name': 'User',
+    })),
+    ('GET', 'api/v1/tasks/', lambda d, i: ('/api/v1/tasks/', None)),
+    ('GET', 'api/v1/tasks/?page_size', lambda d, i: ('/api/v1/tasks/?page_size=50', None)),
+    ('GET', 'api/v1/tasks/?q', lambda d, i: ('/api/v1/tasks/?q=benchmark%2042', None)),
+    ('GET', 'api/v1/tasks/?stream', lambda d, i: ('/api/v1/tasks/?stream=1', None)),
+    ('POST', 'api/v1/tasks/', lambda d, i: ('/api/v1/tasks/', {'title': 'Bench task', 'description': 'Created'})),
+    ('GET', 'api/v1/tasks/<int:pk>/', lambda d, i: (f'/api/v1/tasks/{d.pick(d.task_ids, i)}/', None)),
+    ('PATCH', 'api/v1/tasks/<int:pk>/', lambda d, i: (f'/api/v1/tasks/{d.pick(d.task_ids, i)}/', {'priority': 'High'})),
+    ('DELETE', 'api/v1/tasks/<int:pk>/', lambda d, i: (f'/api/v1/tasks/{d.new_task()}/', None)),
+    ('POST', 'api/v1/tasks/bulk/', lambda d, i: ('/api/v1/tasks/bulk/', [
+        {'title': f'Bulk task {n}', 'description': 'Created in bulk', 'subtasks': [{'title': 'Bulk subtask'}]}
+        for n in range(10)
+    ])),
+    ('PATCH', 'api/v1/tasks/bulk/', lambda d, i: ('/api/v1/tasks/bulk/', [
+        {'id': d.pick(d.task_ids, i + n), 'priority': 'Medium'} for n in range(10)
+    ])),
+    ('DELETE', 'api/v1/tasks/bulk/', lambda d, i: ('/api/v1/tasks/bulk/', {'ids': [d.new_task() for _ in range(10)]})),
+    ('POST', 'api/v1/tasks/move/', lambda d, i: ('/api/v1/tasks/move/', [
+        {'id': d.pick(d.task_ids, i + n), 'state': 'In Progress', 'position': n} for n in range(10)
+    ])),
+    ('GET', 'api/v1/subtasks/', lambda d, i: ('/api/v1/subtasks/', None)),
+    ('POST', 'api/v1/subtasks/', lambda d, i: ('/api/v1/subtasks/', {'title': 'Bench subtask', 'task': d.pick(d.task_ids, i)})),
+    ('GET', 'api/v1/subtasks/<int:pk>/', lambda d, i: (f'/api/v1/subtasks/{d.pick(d.subtask_ids, i)}/', None)),
+    ('PATCH', 'api/v1/subtasks/<int:pk>/', lambda d, i: (f'/api/v1/subtasks/{d.pick(d.subtask_ids, i)}/', {'isDone': True})),
+    ('DELETE', 'api/v1/subtasks/<int:pk>/', lambda d, i: (f'/api/v1/subtasks/{d.new_subtask(i)}/', None)),
+    ('POST', 'api/v1/subtasks/bulk/', lambda d, i: ('/api/v1/subtasks/bulk/', [
+        {'title': f'Bulk subtask {n}', 'task': d.pick(d.task_ids, i + n)} for n in range(10)
+    ])),
+    ('PATCH', 'api/v1/subtasks/bulk/', lambda d, i: ('/api/v1/subtasks/bulk/', [
+        {'id': d.pick(d.subtask_ids, i + n), 'isDone': False} for n in range(10)
+    ])),
+    ('DELETE', 'api/v1/subtasks/bulk/', lambda d, i: ('/api/v1/subtasks/bulk/', {'ids': [d.new_subtask(i) for _ in range(10)]})),
+    ('GET', 'api/v1/tasks/<int:task_id>/subtasks/', lambda d, i: (f'/api/v1/tasks/{d.pick(d.task_ids, i)}/subtasks/', None)),
+    ('GET', 'api/v1/contacts/', lambda d, i: ('/api/v1/contacts/', None)),
+    ('POST', 'api/v1/contacts/', lambda d, i: ('/api/v1/contacts/', {'first_name': 'Bench', 'last_name': 'Contact'})),
+    ('GET', 'api/v1/contacts/search/', lambda d, i: ('/api/v1/contacts/search/?prefix=first%201', None)),
+    ('GET', 'api/v1/contacts/<int:pk>/', lambda d, i: (f'/api/v1/contacts/{d.pick(d.contact_ids, i)}/', None)),
+    ('PATCH', 'api/v1/contacts/<int:pk>/', lambda d, i: (f'/api/v1/contacts/{d.pick(d.contact_ids, i)}/', {'last_name': 'Renamed'})),
+    ('DELETE', 'api/v1/contacts/<int:pk>/', lambda d, i: (f'/api/v1/contacts/{d.new_contact()}/', None)),
+    ('GET', 'api/v1/users/', lambda d, i: ('/api/v1/users/', None)),
+    ('GET', 'api/v1/current_user/', lambda d, i: ('/api/v1/current_user/', None)),
+    ('GET', 'api/v1/board/', lambda d, i: ('/api/v1/board/', None)),
+    ('POST', 'api/v1/board/import/', lambda d, i: ('/api/v1/board/import/', small_board())),
+    ('GET', 'api/v1/board/export/', lambda d, i: ('/api/v1/board/export/', None)),
+    ('GET', 'api/v1/changes/', lambda d, i: ('/api/v1/changes/', None)),
+    # Long-lived stream, JOIN_EVENTS_STREAM_TIMEOUT=0 ends it after its first chunk
+    ('GET', 'api/v1/events/', lambda d, i: ('/api/v1/events/', None)),
+    ('GET', 'metrics', lambda d, i: ('/metrics', None)),
+    ('GET', 'api/v1/async/tasks/', lambda d, i: ('/api/v1/async/tasks/', None)),
+    ('GET', 'api/v1/async/tasks/<int:pk>/', lambda d, i: (f'/api/v1/async/tasks/{d.pick(d.task_ids, i)}/', None)),
+    ('GET', 'api/v1/async/tasks/<int:task_id>/subtasks/', lambda d, i: (f'/api/v1/async/tasks/{d.pick(d.task_ids, i)}/subtasks/', None)),
+    ('GET', 'api/v1/async/subtasks/', lambda d, i: ('/api/v1/async/subtasks/', None)),
+    ('GET', 'api/v1/async/subtasks/<int:pk>/', lambda d, i: (f'/api/v1/async/subtasks/{d.pick(d.subtask_ids, i)}/', None)),
+    ('GET', 'api/v1/async/contacts/', lambda d, i: ('/api/v1/async/contacts/', None)),
+    ('GET', 'api/v1/async/contacts/<int:pk>/', lambda d, i: (f'/api/v1/async/contacts/{d.pick(d.contact_ids, i)}/', None)),
+    ('GET', 'api/v1/async/users/', lambda d, i: ('/api/v1/async/users/', None)),
+]
+
+# Routes left out on purpose
+SKIPPED_PATTERNS = ('admin/',)
+
+
+def iter_patterns(patterns, prefix=''):
+    """ Yields the full pattern string of every route, e.g. "api/v1/tasks/<int:pk>/". """
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern)
+
+
+def percentile(values, percent):
+    # Nearest rank, exact for the small samples of a benchmark run
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def read_content(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = ('Seeds a temporary dataset and records latency, queries and response size of every API route as JSON. '
+            'Run it against a development database, the rows it adds are deleted again by id.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of users to seed.')
+        parser.add_argument('--contacts', type=int, default=1000, help='Number of contacts to seed.')
+        parser.add_argument('--tasks', type=int, default=2000, help='Number of tasks to seed.')
+        parser.add_argument('--subtasks-per-task', type=int, default=3, help='Number of subtasks per task.')
+        parser.add_argument('--requests', type=int, default=20, help='Measured requests per route.')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per route before measuring.')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the response cache between requests instead of measuring the views.')
+        parser.add_argument('--route', action='append', default=[], help='Only run routes containing this text.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare with.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Fail if a p95 latency grows by more than this fraction over the baseline.')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Ignore p95 changes smaller than this, they are noise.')
+
+    def handle(self, *args, **options):
+        self.check_coverage()
+        routes = [route for route in ROUTES if not options['route'] or any(text in f'{route[0]} {route[1]}' for text in options['route'])]
+        if not routes:
+            raise CommandError('No route matches --route.')
+
+        # Expected 4xx responses would otherwise be logged for every request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        # Every route is measured unthrottled, its repeated requests would otherwise exceed the rates. The rates stay
+        # configured, so the time of the throttle check is still part of the measurement
+        unlimited = {scope: '1000000000/day' for scope in getattr(settings, 'JOIN_THROTTLE_RATES', {})}
+        # The requests run in autocommit like in production, so every write pays for its COMMIT and runs its on_commit
+        # handlers. The seeded rows and the rows of the writes are deleted afterwards
+        marks = high_water_marks()
+        try:
+            with override_settings(JOIN_THROTTLE_RATES=unlimited):
+                with transaction.atomic():
+                    dataset = self.seed(options)
+                client = Client(SERVER_NAME='localhost', HTTP_AUTHORIZATION=f'Token {dataset.token.key}')
+                results = {}
+                for method, pattern, build in routes:
+                    results[f'{method} {pattern}'] = self.measure(client, dataset, method, pattern, build, options)
+        finally:
+            request_logger.setLevel(level)
+            delete_created_rows(marks)
+
+        report = {
+            'meta': {
+                'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'dataset': {name: options[name] for name in ('users', 'contacts', 'tasks', 'subtasks_per_task')},
+                'requests': options['requests'],
+                'warm_cache': options['warm_cache'],
+            },
+            'routes': results,
+        }
+        self.print_table(results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}.')
+        if options['baseline']:
+            self.compare(results, options)
+
+    def check_coverage(self):
+        benchmarked = {pattern.split('?')[0] for _, pattern, _ in ROUTES}
+        for pattern in iter_patterns(get_resolver().url_patterns):
+            if pattern not in benchmarked and not pattern.startswith(SKIPPED_PATTERNS):
+                self.stderr.write(self.style.WARNING(f'Route {pattern} is not benchmarked.'))
+
+    def seed(self, options):
+        # Hashing once keeps seeding fast, every bench user shares the password
+        password = make_password(BENCH_PASSWORD)
+        users = User.objects.bulk_create([
+            User(username=f'bench_user_{i}', first_name=f'First {i}', last_name=f'Last {i}',
+                 email=f'bench_user_{i}@example.com', password=password)
+            for i in range(max(options['users'], 1))
+        ])
+        contacts = []
+        for i in range(max(options['contacts'], 1)):
+            contact = ContactItem(first_name=f'First {i}', last_name=f'Last {i}')
+            contact.set_name_keys()
+            contacts.append(contact)
+        contacts = ContactItem.objects.bulk_create(contacts)
+        states = ['To Do', 'In Progress', 'Awaiting Feedback', 'Done']
+        tasks = TaskItem.objects.bulk_create([
+            TaskItem(title=f'Task {i}', description=f'Benchmark task {i}', author=users[i % len(users)],
+                     contact=contacts[i % len(contacts)], priority=['High', 'Medium', 'Low'][i % 3],
+                     state=states[i % len(states)], position=i // len(states))
+            for i in range(max(options['tasks'], 1))
+        ])
+        subtasks = SubTaskItem.objects.bulk_create([
+            SubTaskItem(title=f'Subtask {n} of task {task.pk}', task=task, isDone=n % 2 == 0)
+            for task in tasks for n in range(options['subtasks_per_task'])
+        ])
+        if not subtasks:
+            subtasks = [SubTaskItem.objects.create(title='Subtask', task=tasks[0])]
+        # bulk_create() skips the signal handlers keeping the counters up to date
+        TaskItem.objects.all().recount_subtasks()
+        token = Token.objects.create(user=users[0])
+        return Dataset(users[0], token, tasks, subtasks, contacts)
+
+    def measure(self, client, dataset, method, pattern, build, options):
+        latencies = []
+        queries = []
+        sizes = []
+        statuses = set()
+        for i in range(options['warmup'] + options['requests']):
+            url, body = build(dataset, i)
+            if not options['warm_cache']:
+                response_cache.cache.clear()
+            with CaptureQueriesContext(connection) as context, override_settings(JOIN_EVENTS_STREAM_TIMEOUT=0):
+                start = time.perf_counter()
+                if isinstance(body, str):
+                    response = client.generic(method, url, body, content_type='application/x-ndjson')
+                else:
+                    response = client.generic(method, url, json.dumps(body) if body is not None else '',
+                                              content_type='application/json')
+                size = read_content(response)
+                elapsed = time.perf_counter() - start
+            if i < options['warmup']:
+                continue
+            latencies.append(elapsed * 1000)
+            queries.append(len(context.captured_queries))
+            sizes.append(size)
+            statuses.add(response.status_code)
+        return {
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries': max(queries),
+            'bytes': round(sum(sizes) / len(sizes)),
+            'status': sorted(statuses),
+        }
+
+    def print_table(self, results):
+        self.stdout.write(f'{"route":<52} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"bytes":>10}  status')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<52} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+                f'{result["queries"]:>8} {result["bytes"]:>10}  {",".join(map(str, result["status"]))}'
+            )
+
+    def compare(self, results, options):
+        with open(options['baseline']) as file:
+            baseline = json.load(file)['routes']
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            delta = result['p95_ms'] - before['p95_ms']
+            if delta > options['min_delta_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + options['threshold']):
+                regressions.append(f'{name}: p95 {before["p95_ms"]:.2f} ms -> {result["p95_ms"]:.2f} ms')
+            # Query counts are deterministic, any growth is a regression
+            if result['queries'] > before['queries']:
+                regressions.append(f'{name}: {before["queries"]} -> {result["queries"]} queries')
+        if regressions:
+            raise CommandError('Performance regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
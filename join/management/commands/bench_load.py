@@ -0,0 +1,201 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+from join.models import TaskItem, SubTaskItem
+
+BENCH_USERNAME = 'bench_load_user'
+
+# Module and command line of the compared servers, both are optional dev dependencies (requirements-dev.txt)
+SERVERS = {
+    'wsgi': ('gunicorn', ['join_backend.wsgi:application', '--worker-class', 'gthread', '--workers', '{workers}',
+                          '--threads', '{threads}', '--bind', '127.0.0.1:{port}', '--backlog', '2048']),
+    'asgi': ('uvicorn', ['join_backend.asgi:application', '--workers', '{workers}', '--host', '127.0.0.1',
+                         '--port', '{port}', '--no-access-log', '--log-level', 'warning']),
+}
+
+DEFAULT_PATHS = ['/api/v1/tasks/', '/api/v1/async/tasks/']
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def read_response(reader):
+    """ Reads one HTTP/1.1 response, returns its status and whether the server closes the connection. """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    status = int(lines[0].split(b' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if b':' in line:
+            name, value = line.split(b':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if b'content-length' in headers:
+        await reader.readexactly(int(headers[b'content-length']))
+    elif headers.get(b'transfer-encoding') == b'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            # Every chunk and the last empty one end with CRLF
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    return status, headers.get(b'connection') == b'close'
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+
+
+async def run_client(port, request, measure_from, deadline, timeout, result):
+    """ Sends requests one after another over a keep-alive connection until the deadline. """
+    writer = None
+    try:
+        while time.perf_counter() < deadline:
+            if writer is None:
+                try:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                except OSError:
+                    result.errors += 1
+                    await asyncio.sleep(0.1)
+                    continue
+            start = time.perf_counter()
+            try:
+                writer.write(request)
+                status, closes = await asyncio.wait_for(read_response(reader), timeout)
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                result.errors += 1
+                writer.close()
+                writer = None
+                continue
+            if start >= measure_from:
+                result.latencies.append(time.perf_counter() - start)
+                result.statuses[status] += 1
+            if closes:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run_load(port, path, token, clients, warmup, seconds, timeout):
+    request = (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAuthorization: Token {token}\r\n'
+               f'Accept: application/json\r\n\r\n').encode()
+    result = LoadResult()
+    measure_from = time.perf_counter() + warmup
+    deadline = measure_from + seconds
+    await asyncio.gather(*[
+        run_client(port, request, measure_from, deadline, timeout, result) for _ in range(clients)
+    ])
+    return result
+
+
+class Command(BaseCommand):
+    help = ('Measures requests/s and latency of the task list under a WSGI and an ASGI server with many concurrent '
+            'clients. Needs gunicorn and uvicorn, see requirements-dev.txt.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent keep-alive connections.')
+        parser.add_argument('--seconds', type=float, default=10, help='Measured duration per server and path.')
+        parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds before measuring.')
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes of every server.')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per WSGI worker.')
+        parser.add_argument('--tasks', type=int, default=100, help='Number of tasks to seed, with two subtasks each.')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as an error.')
+        parser.add_argument('--server', choices=sorted(SERVERS), action='append', help='Servers to run, all by default.')
+        parser.add_argument('--path', action='append', help=f'Paths to load, by default {" and ".join(DEFAULT_PATHS)}.')
+
+    def handle(self, *args, **options):
+        servers = options['server'] or sorted(SERVERS, reverse=True)
+        missing = [SERVERS[name][0] for name in servers if importlib.util.find_spec(SERVERS[name][0]) is None]
+        if missing:
+            raise CommandError(f'{", ".join(missing)} not installed, run pip install -r requirements-dev.txt.')
+
+        # Committed rows so the server processes see them, removed again at the end
+        user = User.objects.create_user(username=BENCH_USERNAME)
+        token = Token.objects.create(user=user).key
+        tasks = TaskItem.objects.bulk_create([
+            TaskItem(title=f'Task {i}', description='Benchmark task', author=user) for i in range(options['tasks'])
+        ])
+        SubTaskItem.objects.bulk_create([
+            SubTaskItem(title=f'Subtask {n}', task=task, isDone=n == 0) for task in tasks for n in range(2)
+        ])
+        TaskItem.objects.filter(author=user).recount_subtasks()
+        self.stdout.write(f'{"setup":<6} {"path":<24} {"requests":>9} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} '
+                          f'{"errors":>7}  status')
+        try:
+            for name in servers:
+                for path in options['path'] or DEFAULT_PATHS:
+                    result = self.measure(name, path, token, options)
+                    self.report(name, path, result, options['seconds'])
+        finally:
+            user.delete()
+
+    def measure(self, name, path, token, options):
+        module, arguments = SERVERS[name]
+        port = free_port()
+        command = [sys.executable, '-m', module] + [
+            argument.format(port=port, workers=options['workers'], threads=options['threads']) for argument in arguments
+        ]
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'join_backend.settings'),
+            # Every request renders the list, the async views have no response cache either
+            'JOIN_RESPONSE_CACHE_TIMEOUT': '0',
+        }
+        with tempfile.TemporaryFile() as log:
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=log)
+            try:
+                self.wait_for_port(server, port, log)
+                return asyncio.run(run_load(port, path, token, options['clients'], options['warmup'],
+                                            options['seconds'], options['timeout']))
+            finally:
+                server.terminate()
+                try:
+                    server.wait(10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+
+    def wait_for_port(self, server, port, log, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                log.seek(0)
+                raise CommandError(f'The server exited with {server.returncode}:\n{log.read().decode(errors="replace")}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError(f'The server did not listen on port {port} within {timeout} s.')
+
+    def report(self, name, path, result, seconds):
+        count = len(result.latencies)
+        statuses = ','.join(f'{status}x{number}' for status, number in sorted(result.statuses.items()))
+        self.stdout.write(f'{name:<6} {path:<24} {count:>9} {count / seconds:>9.1f} '
+                          f'{percentile(result.latencies, 0.5):>9.1f} {percentile(result.latencies, 0.99):>9.1f} '
+                          f'{result.errors:>7}  {statuses}')
@@ -0,0 +1,115 @@
+import logging
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+from join.hashing import get_hashing_pool, reset_hashing_pool
+from join.models import TaskItem
+
+BENCH_USERNAME = 'bench_logins_user'
+BENCH_PASSWORD = 'bench-logins-password'
+
+# Hashers of the compared setups, None keeps PASSWORD_HASHERS from the settings
+MODES = {
+    'pooled': None,
+    'unbounded': ['django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+}
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+def reader(token, stop, latencies):
+    client = Client(SERVER_NAME='localhost', HTTP_AUTHORIZATION=f'Token {token}')
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get('/api/v1/tasks/')
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connections.close_all()
+
+
+def login(stop, statuses, latencies):
+    client = Client(SERVER_NAME='localhost')
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.post('/api/v1/login/', {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+            if response.status_code == 503:
+                # Like a client honouring the back-pressure
+                stop.wait(float(response['Retry-After']))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Measures task list latency while a burst of logins hashes passwords, with and without the hashing pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Threads reading the task list.')
+        parser.add_argument('--logins', type=int, default=32, help='Threads logging in concurrently during the burst.')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of every phase.')
+        parser.add_argument('--tasks', type=int, default=200, help='Number of tasks to seed.')
+        parser.add_argument('--mode', choices=sorted(MODES), action='append',
+                            help='Setups to compare, all by default.')
+
+    def handle(self, *args, **options):
+        # Committed rows so every thread's connection sees them, removed again at the end
+        user = User.objects.create_user(username=BENCH_USERNAME, password=BENCH_PASSWORD)
+        token = Token.objects.create(user=user).key
+        TaskItem.objects.bulk_create([
+            TaskItem(title=f'Task {i}', description='Benchmark task', author=user) for i in range(options['tasks'])
+        ])
+        # The rejected logins would otherwise be logged as server errors
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            # Every read renders the list instead of answering from the response cache, and the burst of logins
+            # from one address reaches the hashing pool instead of the login throttle
+            with override_settings(JOIN_RESPONSE_CACHE_TIMEOUT=0, JOIN_SLOW_REQUEST_MS=None, JOIN_THROTTLE_RATES={}):
+                baseline = self.run_phase(token, options['readers'], 0, options['seconds'])
+                self.report('no logins', baseline)
+                for mode in options['mode'] or sorted(MODES, reverse=True):
+                    hashers = {'PASSWORD_HASHERS': MODES[mode]} if MODES[mode] else {}
+                    with override_settings(**hashers):
+                        reset_hashing_pool()
+                        result = self.run_phase(token, options['readers'], options['logins'], options['seconds'])
+                    self.report(f'{mode} ({get_hashing_pool().workers} workers)' if mode == 'pooled' else mode, result)
+        finally:
+            request_logger.setLevel(level)
+            user.delete()
+
+    def run_phase(self, token, readers, logins, seconds):
+        stop = threading.Event()
+        read_latencies, login_latencies, statuses = [], [], []
+        threads = [threading.Thread(target=reader, args=(token, stop, read_latencies)) for _ in range(readers)]
+        threads += [threading.Thread(target=login, args=(stop, statuses, login_latencies)) for _ in range(logins)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return read_latencies, login_latencies, statuses
+
+    def report(self, name, result):
+        read_latencies, login_latencies, statuses = result
+        line = (f'{name:<22} reads {len(read_latencies):>6}  p50 {percentile(read_latencies, 0.5):>7.1f} ms  '
+                f'p99 {percentile(read_latencies, 0.99):>7.1f} ms')
+        if statuses:
+            line += (f'  logins {statuses.count(200):>5} ok {statuses.count(503):>5} busy  '
+                     f'p50 {statistics.median(login_latencies) * 1000:>7.1f} ms')
+        self.stdout.write(line)
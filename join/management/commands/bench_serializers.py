@@ -0,0 +1,69 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from join.fast_serializers import task_reader, subtask_reader, contact_reader, user_reader
+from join.models import TaskItem, ContactItem, SubTaskItem
+from join.serializers import TaskItemSerializer, UserItemSerializer, ContactItemSerializer, SubTaskItemSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares rows/sec of the ModelSerializer and the fast .values() read path on a temporary dataset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of tasks, contacts and users to seed.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path, the best run is reported.')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        try:
+            with transaction.atomic():
+                self.seed(rows)
+                for name, queryset, serializer_class, reader in [
+                    ('tasks', TaskItem.objects.with_subtask_ids(), TaskItemSerializer, task_reader),
+                    ('subtasks', SubTaskItem.objects.all(), SubTaskItemSerializer, subtask_reader),
+                    ('contacts', ContactItem.objects.all(), ContactItemSerializer, contact_reader),
+                    ('users', User.objects.all(), UserItemSerializer, user_reader),
+                ]:
+                    count = queryset.count()
+                    serializer_time = self.best_of(options['repeat'], lambda: serializer_class(queryset.all(), many=True).data)
+                    reader_time = self.best_of(options['repeat'], lambda: reader.read(queryset.all()))
+                    self.stdout.write(
+                        f'{name:<9} {count:>8} rows  serializer {count / serializer_time:>10.0f} rows/s  '
+                        f'fast path {count / reader_time:>10.0f} rows/s  ({serializer_time / reader_time:.1f}x)'
+                    )
+                # The seeded data is only needed for the measurement
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rows):
+        users = User.objects.bulk_create([
+            User(username=f'bench_user_{i}', first_name=f'First {i}', last_name=f'Last {i}', email=f'bench_{i}@example.com')
+            for i in range(rows)
+        ])
+        contacts = ContactItem.objects.bulk_create([
+            ContactItem(first_name=f'First {i}', last_name=f'Last {i}') for i in range(rows)
+        ])
+        tasks = TaskItem.objects.bulk_create([
+            TaskItem(title=f'Task {i}', description='Benchmark task', author=users[i % len(users)],
+                     contact=contacts[i % len(contacts)])
+            for i in range(rows)
+        ])
+        SubTaskItem.objects.bulk_create([
+            SubTaskItem(title=f'Subtask {i}', task=tasks[i % len(tasks)], isDone=i % 2 == 0) for i in range(rows * 2)
+        ])
+
+    def best_of(self, repeat, func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from join.db import apply_pragmas
+
+# (pragmas, BEGIN statement) of the compared database profiles
+PROFILES = {
+    'default': ({}, 'BEGIN'),
+    'production': (None, 'BEGIN IMMEDIATE'),
+}
+
+
+def connect(path, profile, timeout):
+    pragmas, begin = PROFILES[profile]
+    if pragmas is None:
+        pragmas = settings.JOIN_SQLITE_PRODUCTION_PRAGMAS
+    # Autocommit with explicit BEGIN, like Django's SQLite backend
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    apply_pragmas(connection.cursor(), pragmas)
+    return connection, begin
+
+
+def writer(path, profile, timeout, transactions, seed, results):
+    connection, begin = connect(path, profile, timeout)
+    errors = 0
+    latencies = []
+    for i in range(transactions):
+        task_id = (seed * 7919 + i * 104729) % 10000 + 1
+        start = time.perf_counter()
+        try:
+            # Read, then write in the same transaction, like the bulk and move endpoints
+            connection.execute(begin)
+            position, = connection.execute('SELECT position FROM task WHERE id = ?', [task_id]).fetchone()
+            connection.execute('UPDATE task SET position = ? WHERE id = ?', [position + 1, task_id])
+            connection.execute('COMMIT')
+        except sqlite3.OperationalError:
+            errors += 1
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+        latencies.append(time.perf_counter() - start)
+    results.put(('writer', errors, latencies))
+
+
+def reader(path, profile, timeout, stop, results):
+    connection, _ = connect(path, profile, timeout)
+    errors = 0
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            connection.execute('SELECT state, count(*), max(position) FROM task GROUP BY state').fetchall()
+        except sqlite3.OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    results.put(('reader', errors, latencies))
+
+
+class Command(BaseCommand):
+    help = 'Measures concurrent SQLite writers and readers with the default and the production database profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Number of writing processes.')
+        parser.add_argument('--readers', type=int, default=4, help='Number of reading processes.')
+        parser.add_argument('--transactions', type=int, default=50, help='Transactions per writer.')
+        parser.add_argument('--timeout', type=float, default=5, help='Seconds to wait for a lock.')
+
+    def handle(self, *args, **options):
+        for profile in PROFILES:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, profile)
+                self.run_profile(path, profile, options)
+
+    def seed(self, path, profile):
+        connection, _ = connect(path, profile, 5)
+        connection.execute('CREATE TABLE task (id INTEGER PRIMARY KEY, state TEXT, position INTEGER)')
+        connection.execute('BEGIN')
+        connection.executemany('INSERT INTO task (state, position) VALUES (?, 0)',
+                               [(['To Do', 'In Progress', 'Done'][i % 3],) for i in range(10000)])
+        connection.execute('COMMIT')
+        connection.close()
+
+    def run_profile(self, path, profile, options):
+        results = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        start = time.perf_counter()
+        writers = [
+            multiprocessing.Process(target=writer, args=(path, profile, options['timeout'], options['transactions'], seed, results))
+            for seed in range(options['writers'])
+        ]
+        for process in writers:
+            process.start()
+        # Readers run until the last writer is done
+        readers = [
+            multiprocessing.Process(target=reader, args=(path, profile, options['timeout'], stop, results))
+            for _ in range(options['readers'])
+        ]
+        for process in readers:
+            process.start()
+        collected = {'writer': [0, []], 'reader': [0, []]}
+        for index in range(len(writers) + len(readers)):
+            if index == len(writers):
+                stop.set()
+            kind, errors, latencies = results.get()
+            collected[kind][0] += errors
+            collected[kind][1].extend(latencies)
+            if index == len(writers) - 1:
+                elapsed = time.perf_counter() - start
+        for process in writers + readers:
+            process.join()
+
+        for kind in ('writer', 'reader'):
+            errors, latencies = collected[kind]
+            ok = len(latencies) - errors
+            p99 = statistics.quantiles(latencies, n=100)[98] * 1000 if len(latencies) > 1 else 0
+            self.stdout.write(
+                f'{profile:<10} {kind}s: {ok:>7} ok {errors:>6} locked  '
+                f'{ok / elapsed:>9.0f}/s  p99 {p99:>8.1f} ms'
+            )
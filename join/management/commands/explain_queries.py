@@ -0,0 +1,93 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from join.models import TaskItem, ContactItem, SubTaskItem, ModelVersion, Tombstone
+from join.pagination import KeysetPagination
+from join.search import search_tasks
+
+
+def keyset_page(queryset, fields, position):
+    # Same seek filter the paginated list endpoints use
+    paginator = KeysetPagination()
+    paginator.fields = fields
+    return queryset.filter(paginator.get_seek_filter(position)).order_by(*fields)[:50]
+
+
+def get_api_queries():
+    """ Returns (name, queryset, full_table) for the queries run by the API views. """
+    today = datetime.date.today()
+    since = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        # Complete listings read every row on purpose
+        ('tasks: list', TaskItem.objects.all(), True),
+        ('subtasks: list', SubTaskItem.objects.all(), True),
+        ('contacts: list', ContactItem.objects.all(), True),
+        ('users: list', User.objects.all(), True),
+        ('tasks: detail', TaskItem.objects.filter(pk=1), False),
+        ('tasks: subtask ids prefetch', SubTaskItem.objects.filter(task_id__in=[1, 2, 3]).only('id', 'task_id').order_by('id'), False),
+        ('tasks: by state and position', TaskItem.objects.filter(state='To Do').order_by('position', 'id'), False),
+        ('tasks: keyset page by position', keyset_page(TaskItem.objects.all(), ('state', 'position', 'id'), ['To Do', 10, 100]), False),
+        ('tasks: by author', TaskItem.objects.filter(author_id=1), False),
+        ('tasks: by author and state', TaskItem.objects.filter(author_id=1, state='Done'), False),
+        ('tasks: by contact', TaskItem.objects.filter(contact_id=1), False),
+        ('tasks: by due date range', TaskItem.objects.filter(due_date__gte=today, due_date__lte=today + datetime.timedelta(days=7)), False),
+        ('tasks: keyset page by due date', keyset_page(TaskItem.objects.all(), ('due_date', 'id'), [str(today), 100]), False),
+        ('tasks: keyset page by id', keyset_page(TaskItem.objects.all(), ('id',), [100]), False),
+        ('tasks: changed since', TaskItem.objects.filter(updated_at__gte=since), False),
+        ('subtasks: for task', SubTaskItem.objects.filter(task_id=1), False),
+        ('tasks: full-text search', search_tasks(TaskItem.objects.all(), 'report draft'), False),
+        ('contacts: name prefix', ContactItem.objects.filter(name_key__gte='jo', name_key__lt='jo\U0010ffff').order_by('name_key', 'id')[:10], False),
+        ('contacts: reversed name prefix', ContactItem.objects.filter(reversed_name_key__gte='jo', reversed_name_key__lt='jo\U0010ffff').order_by('reversed_name_key', 'id')[:10], False),
+        ('tasks: recount subtasks', TaskItem.objects.filter(pk__in=[1, 2, 3]).with_subtask_drift(), False),
+        ('subtasks: open for task', SubTaskItem.objects.filter(task_id=1, isDone=False), False),
+        ('subtasks: changed since', SubTaskItem.objects.filter(updated_at__gte=since), False),
+        ('contacts: changed since', ContactItem.objects.filter(updated_at__gte=since), False),
+        ('tombstones: deleted since', Tombstone.objects.filter(model='join.taskitem', deleted_at__gte=since), False),
+        ('versions: etag lookup', ModelVersion.objects.filter(name__in=['join.taskitem', 'join.subtaskitem']), False),
+    ]
+
+
+def find_full_scans(plan):
+    """ Returns the plan lines that read a whole table or index instead of searching it. """
+    scans = []
+    for line in plan.splitlines():
+        # SQLite reports "SEARCH <table> USING ..." for index lookups, "SCAN <table> [USING ... INDEX]" reads everything
+        if 'SCAN ' in line and 'CONSTANT ROW' not in line:
+            # Virtual tables are always reported as SCAN, "INDEX 0:M" is the FTS5 MATCH lookup of the full-text index
+            if 'VIRTUAL TABLE INDEX' in line and ':M' in line:
+                continue
+            scans.append(line.strip())
+    return scans
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN QUERY PLAN for every API query and reports the queries doing a full table scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error if an indexed query does a full scan.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('explain_queries only understands SQLite query plans.')
+
+        unexpected = []
+        for name, queryset, full_table in get_api_queries():
+            plan = queryset.explain()
+            scans = find_full_scans(plan)
+            if not scans:
+                self.stdout.write(self.style.SUCCESS(f'OK    {name}'))
+            elif full_table:
+                self.stdout.write(f'FULL  {name} (expected)')
+            else:
+                unexpected.append(name)
+                self.stdout.write(self.style.WARNING(f'SCAN  {name}'))
+            if options['verbosity'] > 1 or (scans and not full_table):
+                for line in plan.splitlines():
+                    self.stdout.write(f'        {line}')
+
+        if unexpected and options['fail_on_scan']:
+            raise CommandError(f'{len(unexpected)} queries do a full table scan: {", ".join(unexpected)}')
+        self.stdout.write(f'{len(unexpected)} unexpected full table scans.')
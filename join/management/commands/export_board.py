@@ -0,0 +1,18 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from join.board_io import iter_board_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Writes all contacts, tasks and subtasks as NDJSON, the input format of import_board.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='File to write, standard output by default.')
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            sys.stdout.writelines(iter_board_ndjson())
+            return
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            file.writelines(iter_board_ndjson())
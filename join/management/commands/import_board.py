@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from join.board_io import BoardImportError, import_board, iter_lines, spool_upload
+
+
+class Command(BaseCommand):
+    help = 'Imports an NDJSON board written by export_board in one transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Board file to import, - for standard input.')
+        parser.add_argument('--author', required=True,
+                            help='Username that becomes the author of tasks whose author does not exist here.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per batch of inserts.')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["author"]}" does not exist.')
+
+        start = time.perf_counter()
+        try:
+            if options['file'] == '-':
+                # A slow producer on the other end of the pipe must not hold up the import transaction
+                with spool_upload(sys.stdin.buffer) as upload:
+                    counts = import_board(iter_lines(upload), author, options['batch_size'])
+            else:
+                with open(options['file'], 'rb') as file:
+                    counts = import_board(iter_lines(file), author, options['batch_size'])
+        except BoardImportError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Imported {counts["contacts"]} contacts, {counts["tasks"]} tasks and {counts["subtasks"]} subtasks '
+            f'in {elapsed:.1f} s.'
+        )
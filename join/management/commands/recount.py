@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from join.models import TaskItem
+
+
+class Command(BaseCommand):
+    help = 'Repairs the denormalized subtask counters of all tasks whose stored counts drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the tasks with wrong counters.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = list(TaskItem.objects.with_subtask_drift().order_by('id').values_list(
+                'id', 'subtask_count', 'subtask_done_count', 'actual_subtask_count', 'actual_subtask_done_count'
+            ))
+            for pk, count, done_count, actual_count, actual_done_count in drifted:
+                self.stdout.write(f'task {pk}: {done_count}/{count} stored, {actual_done_count}/{actual_count} actual')
+            if drifted and not options['dry_run']:
+                # One UPDATE with correlated subqueries for all drifted tasks
+                TaskItem.objects.filter(pk__in=[row[0] for row in drifted]).recount_subtasks()
+        action = 'found' if options['dry_run'] else 'repaired'
+        self.stdout.write(f'{len(drifted)} task(s) with drifted subtask counters {action}.')
@@ -0,0 +1,227 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# File layout: used bytes and values per series, followed by entries of
+# key length, JSON key padded to 8 bytes, then count, sum and one value per bucket (the last one is +Inf)
+HEADER = struct.Struct('<II')
+KEY_LENGTH = struct.Struct('<I')
+DOUBLE = struct.Struct('<d')
+INITIAL_SIZE = 64 * 1024
+
+
+def padded(length):
+    return (length + 7) // 8 * 8
+
+
+def iter_series(data):
+    """ Yields (key, offset of the values, values) of every series in the bytes of a metrics file. """
+    used, value_count = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+    while offset < used:
+        key_length, = KEY_LENGTH.unpack_from(data, offset)
+        key = tuple(json.loads(bytes(data[offset + KEY_LENGTH.size:offset + KEY_LENGTH.size + key_length])))
+        offset += padded(KEY_LENGTH.size + key_length)
+        yield key, offset, struct.unpack_from(f'<{value_count}d', data, offset)
+        offset += value_count * DOUBLE.size
+
+
+class MetricsRegistry:
+    """ Request counts and latency histograms per route, method and status, stored in a memory-mapped file.
+
+    Every worker process writes its own file in the directory, collect() adds up the files of all workers. Without a
+    directory the values live in anonymous memory and only cover the current process.
+    """
+
+    def __init__(self, directory=None, buckets=DEFAULT_BUCKETS):
+        self.directory = directory
+        self.buckets = tuple(buckets)
+        self.value_count = len(self.buckets) + 3
+        self.offsets = {}
+        # Increments are read-modify-write, threaded workers must not lose any
+        self._lock = threading.Lock()
+        self.file = None
+        if directory is None:
+            self.path = None
+            self.map = mmap.mmap(-1, INITIAL_SIZE)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, f'join_metrics_{os.getpid()}.db')
+            self.file = open(self.path, 'a+b')
+            size = os.fstat(self.file.fileno()).st_size
+            if size < INITIAL_SIZE:
+                self.file.truncate(INITIAL_SIZE)
+            self.map = mmap.mmap(self.file.fileno(), max(size, INITIAL_SIZE))
+        used, value_count = HEADER.unpack_from(self.map, 0)
+        if used and value_count == self.value_count:
+            # A file left by an earlier process with the same pid, keep counting from its values
+            self.offsets = {key: offset for key, offset, _ in iter_series(self.map)}
+            self.used = used
+        else:
+            self.used = HEADER.size
+            HEADER.pack_into(self.map, 0, self.used, self.value_count)
+
+    def add_series(self, key):
+        encoded = json.dumps(list(key)).encode()
+        offset = self.used + padded(KEY_LENGTH.size + len(encoded))
+        end = offset + self.value_count * DOUBLE.size
+        if end > len(self.map):
+            size = max(end, len(self.map) * 2)
+            if self.file is not None:
+                self.file.truncate(size)
+            self.map.resize(size)
+        KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + KEY_LENGTH.size:self.used + KEY_LENGTH.size + len(encoded)] = encoded
+        # Readers only look at entries below the used mark, so it is moved after the entry is complete
+        self.used = end
+        HEADER.pack_into(self.map, 0, self.used, self.value_count)
+        self.offsets[key] = offset
+        return offset
+
+    def observe(self, route, method, status, seconds):
+        """ Counts one request and adds its duration to the histogram of its series. """
+        key = (route, method, status)
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            offset = self.offsets.get(key)
+            if offset is None:
+                offset = self.add_series(key)
+            for position, amount in ((0, 1.0), (1, seconds), (2 + bucket, 1.0)):
+                at = offset + position * DOUBLE.size
+                DOUBLE.pack_into(self.map, at, DOUBLE.unpack_from(self.map, at)[0] + amount)
+
+    def collect(self):
+        """ Returns {(route, method, status): [count, sum, per-bucket counts]} summed over all workers. """
+        if self.path is None:
+            sources = [self.map]
+        else:
+            sources = []
+            for path in glob.glob(os.path.join(self.directory, 'join_metrics_*.db')):
+                with open(path, 'rb') as file:
+                    sources.append(file.read())
+        totals = {}
+        for data in sources:
+            if len(data) < HEADER.size or HEADER.unpack_from(data, 0)[1] != self.value_count:
+                continue
+            for key, _, values in iter_series(data):
+                total = totals.setdefault(key, [0.0] * self.value_count)
+                for index, value in enumerate(values):
+                    total[index] += value
+        return totals
+
+    def close(self):
+        self.map.close()
+        if self.file is not None:
+            self.file.close()
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_le(bound):
+    return f'{bound:g}'
+
+
+def render_prometheus(totals, buckets):
+    """ Renders collected series in the Prometheus text exposition format. """
+    lines = [
+        '# HELP join_http_requests_total Requests by route pattern, method and status.',
+        '# TYPE join_http_requests_total counter',
+    ]
+    series = sorted(totals.items())
+    for (route, method, status), values in series:
+        labels = f'route="{escape_label(route)}",method="{escape_label(method)}",status="{status}"'
+        lines.append(f'join_http_requests_total{{{labels}}} {values[0]:.0f}')
+    lines += [
+        '# HELP join_http_request_duration_seconds Request latency by route pattern, method and status.',
+        '# TYPE join_http_request_duration_seconds histogram',
+    ]
+    for (route, method, status), values in series:
+        labels = f'route="{escape_label(route)}",method="{escape_label(method)}",status="{status}"'
+        cumulative = 0.0
+        for bound, count in zip(buckets + (None,), values[2:]):
+            cumulative += count
+            le = '+Inf' if bound is None else format_le(bound)
+            lines.append(f'join_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative:.0f}')
+        lines.append(f'join_http_request_duration_seconds_sum{{{labels}}} {values[1]!r}')
+        lines.append(f'join_http_request_duration_seconds_count{{{labels}}} {values[0]:.0f}')
+    return '\n'.join(lines) + '\n'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """ Returns the registry of this process for the configured JOIN_METRICS_DIR. """
+    global _registry
+    directory = getattr(settings, 'JOIN_METRICS_DIR', None)
+    directory = str(directory) if directory is not None else None
+    registry = _registry
+    if registry is None or registry.directory != directory:
+        with _registry_lock:
+            # Two registries of one process must never map the same file
+            if _registry is None or _registry.directory != directory:
+                _registry = MetricsRegistry(directory, getattr(settings, 'JOIN_METRICS_BUCKETS', DEFAULT_BUCKETS))
+            registry = _registry
+    return registry
+
+
+def reset_registry():
+    global _registry
+    _registry = None
+
+
+# A registry created before a prefork server forks belongs to the parent, each worker opens its own file
+os.register_at_fork(after_in_child=reset_registry)
+
+
+def route_of(request):
+    # URL patterns instead of paths keep the number of series bounded
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None and match.route else 'unmatched'
+
+
+# Methods kept as labels, any other method a client sends is counted as OTHER
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'))
+
+
+def method_of(request):
+    return request.method if request.method in KNOWN_METHODS else 'OTHER'
+
+
+class MetricsMiddleware:
+    """ Records the latency of every request in the metrics registry. """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        get_registry().observe(route_of(request), method_of(request), response.status_code, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        get_registry().observe(route_of(request), method_of(request), response.status_code, time.perf_counter() - start)
+        return response
@@ -0,0 +1,165 @@
+import contextvars
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from join.streaming import encode_json
+
+logger = logging.getLogger('join.performance')
+
+# Metrics of the request being handled, context variables follow the request into sync_to_async() threads
+current_metrics = contextvars.ContextVar('join_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """ Raised in DEBUG when a read-only request runs more queries than the query_budget of its view. """
+
+
+class RequestMetrics:
+    """ Query count, SQL time and view/render timestamps of one request. """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.view_start = None
+        self.view_end = None
+        self.render_end = None
+        self.view_name = None
+        self.query_budget = None
+
+    def durations(self):
+        """ Returns (name, milliseconds, description) of every measured phase. """
+        phases = [('db', self.sql_time, f'{self.queries} queries')]
+        if self.view_start is not None:
+            phases.append(('view', (self.view_end or self.end) - self.view_start, self.view_name))
+        if self.view_end is not None and self.render_end is not None:
+            phases.append(('render', self.render_end - self.view_end, None))
+        phases.append(('total', self.end - self.start, None))
+        return [(name, seconds * 1000, description) for name, seconds, description in phases]
+
+
+def record_query(execute, sql, params, many, context):
+    """ Execute wrapper counting the queries and SQL time of the current request. """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_time += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """ Adds record_query to every new connection, the same wrapper as connection.execute_wrapper() would add. """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def format_server_timing(metrics):
+    entries = []
+    for name, milliseconds, description in metrics.durations():
+        entry = f'{name};dur={milliseconds:.1f}'
+        if description:
+            entry += f';desc="{description}"'
+        entries.append(entry)
+    return ', '.join(entries)
+
+
+def start_view(request, view_func):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        view_class = getattr(view_func, 'view_class', view_func)
+        metrics.view_name = view_class.__name__
+        # Budgets are per method, a write runs its signal handlers on top of the queries of a read
+        metrics.query_budget = getattr(view_class, 'query_budget', {}).get(request.method)
+        metrics.view_start = time.perf_counter()
+
+
+def end_view(response):
+    # Called between the view and rendering of DRF responses
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.view_end = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: setattr(metrics, 'render_end', time.perf_counter()))
+    return response
+
+
+class PerformanceMiddleware:
+    """ Sends the query count, SQL, view and render time of every request as a Server-Timing header.
+
+    Requests slower than JOIN_SLOW_REQUEST_MS are logged to the join.performance logger. Views may set a
+    query_budget per method like {'GET': 6}, exceeding it is logged and raises QueryBudgetExceeded in DEBUG for
+    read-only requests. Writes are only logged as their changes are already committed. Streamed bodies
+    are produced after the response leaves the middleware and are not part of the timings.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django would run sync hooks through sync_to_async() for async requests
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        start_view(request, view_func)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        start_view(request, view_func)
+
+    def process_template_response(self, request, response):
+        return end_view(response)
+
+    async def aprocess_template_response(self, request, response):
+        return end_view(response)
+
+    def finish(self, request, response, metrics):
+        metrics.end = time.perf_counter()
+        if getattr(settings, 'JOIN_SERVER_TIMING', True):
+            response['Server-Timing'] = format_server_timing(metrics)
+
+        over_budget = metrics.query_budget is not None and metrics.queries > metrics.query_budget
+        total_ms = (metrics.end - metrics.start) * 1000
+        threshold = getattr(settings, 'JOIN_SLOW_REQUEST_MS', 500)
+        if over_budget or (threshold is not None and total_ms >= threshold):
+            record = {
+                'method': request.method, 'path': request.get_full_path(), 'status': response.status_code,
+                'view': metrics.view_name, 'queries': metrics.queries, 'query_budget': metrics.query_budget,
+            }
+            record.update((f'{name}_ms', round(milliseconds, 1)) for name, milliseconds, _ in metrics.durations())
+            logger.warning('%s request: %s', 'Over budget' if over_budget else 'Slow', encode_json(record),
+                           extra={'request_metrics': record})
+        if over_budget and settings.DEBUG and request.method in SAFE_METHODS:
+            raise QueryBudgetExceeded(
+                f'{metrics.view_name} ran {metrics.queries} queries, its query_budget is {metrics.query_budget}.'
+            )
+        return response
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+from join.search import normalize_search_text
 import datetime
 
 # Create your models here.
@@ -23,10 +26,82 @@ class ContactItem(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=500)
     created_at = models.DateField(default=datetime.date.today)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Normalized "first last" and "last first" names for the indexed prefix search, set on save
+    name_key = models.CharField(max_length=601, default='', editable=False, db_index=True)
+    reversed_name_key = models.CharField(max_length=601, default='', editable=False, db_index=True)
     
     def __str__(self) -> str:
         return f'({self.id}) - {self.first_name} {self.last_name}'
+
+    def set_name_keys(self):
+        self.name_key = normalize_search_text(f'{self.first_name} {self.last_name}')
+        self.reversed_name_key = normalize_search_text(f'{self.last_name} {self.first_name}')
+
+    def save(self, *args, **kwargs):
+        self.set_name_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'name_key', 'reversed_name_key'}
+        super().save(*args, **kwargs)
     
+class TaskItemQuerySet(models.QuerySet):
+    def with_subtask_ids(self):
+        # Load the subtask ids of all tasks in one extra query instead of one per task
+        return self.prefetch_related(
+            models.Prefetch('subtasks', queryset=SubTaskItem.objects.only('id', 'task_id').order_by('id'))
+        )
+
+    def with_subtasks(self):
+        # Load the complete subtasks of all tasks in one extra query
+        return self.prefetch_related(
+            models.Prefetch('subtasks', queryset=SubTaskItem.objects.order_by('id'))
+        )
+
+    def with_shape(self, fields=None, expand=(), extra_columns=()):
+        # Loads only the columns and relations needed by TaskItemSerializer(fields=..., expand=...)
+        queryset = self.prefetch_related(None)
+        names = set(fields) | set(expand) if fields is not None else None
+        if names is not None:
+            columns = {field.name for field in self.model._meta.concrete_fields} & names
+            queryset = queryset.only('id', *columns, *extra_columns)
+        related = [name for name in ('contact', 'author') if name in expand]
+        if related:
+            queryset = queryset.select_related(*related)
+        if 'subtasks' in expand:
+            return queryset.with_subtasks()
+        if names is None or 'subtask_ids' in names:
+            return queryset.with_subtask_ids()
+        return queryset
+
+    def recount_subtasks(self):
+        # Store the actual subtask counters with one UPDATE, returns the number of updated tasks
+        subtask_count, subtask_done_count = actual_subtask_counts()
+        return self.update(subtask_count=subtask_count, subtask_done_count=subtask_done_count, updated_at=timezone.now())
+
+    def with_subtask_drift(self):
+        # Tasks whose stored subtask counters differ from the actual subtasks
+        subtask_count, subtask_done_count = actual_subtask_counts()
+        return self.annotate(actual_subtask_count=subtask_count, actual_subtask_done_count=subtask_done_count).exclude(
+            subtask_count=models.F('actual_subtask_count'), subtask_done_count=models.F('actual_subtask_done_count')
+        )
+
+
+def actual_subtask_counts():
+    """ Correlated subqueries counting all and the done subtasks of the outer task. """
+    subtasks = SubTaskItem.objects.filter(task=models.OuterRef('pk')).order_by().values('task')
+    count = subtasks.annotate(count=models.Count('pk')).values('count')
+    done_count = subtasks.filter(isDone=True).annotate(count=models.Count('pk')).values('count')
+    return (
+        Coalesce(models.Subquery(count, output_field=models.IntegerField()), 0),
+        Coalesce(models.Subquery(done_count, output_field=models.IntegerField()), 0),
+    )
+
+
+# Denormalized columns of TaskItem that only recount_subtasks() writes
+COUNTER_FIELDS = ('subtask_count', 'subtask_done_count')
+
+
 class TaskItem(models.Model):
     title = models.CharField(max_length=100)
     description = models.CharField(max_length=500)
@@ -36,10 +111,37 @@ class TaskItem(models.Model):
     priority = models.CharField(max_length=10, choices=PRIORITIES, default='Low')
     due_date = models.DateField(default=datetime.date.today)
     state = models.CharField(max_length=20, choices=STATES, default='To Do')
+    # Order of the task within its state column on the board
+    position = models.IntegerField(default=0)
+    # Denormalized subtask progress, kept up to date by the signal handlers in join.signals
+    subtask_count = models.IntegerField(default=0)
+    subtask_done_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TaskItemQuerySet.as_manager()
+
+    class Meta:
+        # Matched to the API access patterns, check them with `manage.py explain_queries`
+        indexes = [
+            models.Index(fields=['state', 'position', 'id'], name='join_task_state_position_idx'),
+            models.Index(fields=['author', 'state'], name='join_task_author_state_idx'),
+            models.Index(fields=['contact', 'state'], name='join_task_contact_state_idx'),
+            models.Index(fields=['due_date', 'id'], name='join_task_due_date_idx'),
+        ]
     
     def __str__(self) -> str:
         return f'({self.id}) - {self.title}'
 
+    def save(self, *args, **kwargs):
+        # The subtask counters are only written by recount_subtasks(), saving the values loaded with the instance
+        # would undo subtask writes committed since then
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     # This allows access to related SubTaskItems via task_item.subtasks
     @property
     def subtasks(self):
@@ -49,8 +151,66 @@ class SubTaskItem(models.Model):
     title = models.CharField(max_length=100)
     created_at = models.DateField(default=datetime.date.today)
     isDone = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     task = models.ForeignKey(TaskItem, related_name='subtasks', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'isDone'], name='join_subtask_task_done_idx'),
+        ]
+
     def __str__(self) -> str:
         return f'({self.id}) -- {self.task} -- {self.title}'
-    
\ No newline at end of file
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded task so moving a subtask also updates the counters of its previous task
+        instance._loaded_task_id = instance.__dict__.get('task_id')
+        return instance
+
+
+class ModelVersion(models.Model):
+    """ Version counter per model, bumped on every change so clients can revalidate cheaply. """
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.name} - {self.version}'
+
+    @classmethod
+    def bump(cls, model):
+        name = model._meta.label_lower
+        if not cls.objects.filter(name=name).update(version=models.F('version') + 1):
+            cls.objects.get_or_create(name=name)
+            cls.objects.filter(name=name).update(version=models.F('version') + 1)
+
+    @classmethod
+    def get_versions(cls, *models):
+        # Single query for all requested models, models that never changed are at version 0
+        names = [model._meta.label_lower for model in models]
+        versions = dict(cls.objects.filter(name__in=names).values_list('name', 'version'))
+        return [versions.get(name, 0) for name in names]
+
+    @classmethod
+    async def aget_versions(cls, *models):
+        names = [model._meta.label_lower for model in models]
+        rows = cls.objects.filter(name__in=names).values_list('name', 'version')
+        versions = {name: version async for name, version in rows}
+        return [versions.get(name, 0) for name in names]
+
+
+class Tombstone(models.Model):
+    """ Record of a deleted row so clients syncing via the change feed can remove it too. """
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='join_tombstone_model_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.model} ({self.object_id}) - {self.deleted_at}'
+
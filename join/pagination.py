@@ -0,0 +1,120 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """ Opt-in cursor pagination that seeks on the ordering columns instead of using OFFSET. """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, orderings=None):
+        # Maps the accepted ?ordering= values to the columns of the keyset, the last one must be unique
+        self.orderings = orderings or {'id': ('id',)}
+        self.default_ordering = next(iter(self.orderings))
+
+    def is_requested(self, request):
+        # Pagination is opt-in so existing clients keep receiving plain lists
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering_name = self.get_ordering_name(request)
+        self.fields = self.orderings[self.ordering_name]
+
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.fields)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position))
+
+        # Fetch one extra row to find out if there is a next page
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'JOIN_PAGE_SIZE', 50)
+        max_page_size = getattr(settings, 'JOIN_MAX_PAGE_SIZE', 500)
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, page_size))
+        except (TypeError, ValueError):
+            pass
+        return max(1, min(page_size, max_page_size))
+
+    def get_ordering_name(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        return ordering if ordering in self.orderings else self.default_ordering
+
+    def get_seek_filter(self, position):
+        # Builds (a > x) OR (a = x AND b > y) ... for the rows after the cursor
+        seek = Q()
+        for index, field in enumerate(self.fields):
+            condition = Q(**{f'{field}__gt': position[index]})
+            for previous_field, previous_value in zip(self.fields[:index], position):
+                condition &= Q(**{previous_field: previous_value})
+            seek |= condition
+        # The redundant range on the first column lets SQLite seek on the index instead of scanning it
+        if len(self.fields) > 1:
+            seek &= Q(**{f'{self.fields[0]}__gte': position[0]})
+        return seek
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [self.get_position_value(last, field) for field in self.fields]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_position_value(self, item, field):
+        value = item[field] if isinstance(item, dict) else getattr(item, field)
+        return value if isinstance(value, int) else str(value)
+
+    def encode_cursor(self, position):
+        payload = json.dumps({'o': self.ordering_name, 'p': position}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            position = payload['p']
+            ordering_name = payload['o']
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.fields) or ordering_name != self.ordering_name:
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [self.clean_position_value(model._meta.get_field(field), value)
+                    for field, value in zip(self.fields, position)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def clean_position_value(self, field, value):
+        # The values are compared with the ordering columns, each one must be a valid value of its field
+        if value is None:
+            raise ValueError('Cursor values cannot be null.')
+        value = field.to_python(value)
+        field.run_validators(value)
+        return value
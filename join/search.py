@@ -0,0 +1,131 @@
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TASK_SEARCH_TABLE = 'join_taskitem_fts'
+
+# FTS5 support per database alias, checked once per process
+_has_fts5 = {}
+
+# External content FTS5 index over the task texts, the triggers keep it in sync with every write to join_taskitem
+# including bulk_update() and update(), which bypass the model signals
+TASK_SEARCH_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TASK_SEARCH_TABLE} USING fts5(
+        title, description, content='join_taskitem', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS join_taskitem_fts_insert AFTER INSERT ON join_taskitem BEGIN
+        INSERT INTO {TASK_SEARCH_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS join_taskitem_fts_delete AFTER DELETE ON join_taskitem BEGIN
+        INSERT INTO {TASK_SEARCH_TABLE}({TASK_SEARCH_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS join_taskitem_fts_update AFTER UPDATE OF title, description ON join_taskitem BEGIN
+        INSERT INTO {TASK_SEARCH_TABLE}({TASK_SEARCH_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {TASK_SEARCH_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+
+def normalize_search_text(text):
+    """ Case, accent and punctuation insensitive form of a name used as prefix search key, e.g. "  Zoë  O'Brien" -> "zoe obrien". """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    # Punctuation is dropped instead of turned into spaces, so "ob" finds "O'Brien" and "annem" finds "Anne-Marie"
+    text = ''.join(char for char in text if char.isalnum() or char.isspace())
+    return ' '.join(text.split())
+
+
+def has_task_search(connection):
+    """ Whether the database supports the FTS5 task index. """
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _has_fts5:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            _has_fts5[connection.alias] = ('ENABLE_FTS5',) in cursor.fetchall()
+    return _has_fts5[connection.alias]
+
+
+def install_task_search(using='default', **kwargs):
+    """ Creates the FTS5 index and its triggers if missing and fills the index from the existing tasks, runs after migrate. """
+    connection = connections[using]
+    # The join tables are missing when migrate runs before makemigrations created the app's migrations
+    if not has_task_search(connection) or 'join_taskitem' not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM sqlite_master WHERE name = %s', [TASK_SEARCH_TABLE])
+        created = cursor.fetchone() is None
+        for sql in TASK_SEARCH_SQL:
+            cursor.execute(sql)
+        if created:
+            cursor.execute(f"INSERT INTO {TASK_SEARCH_TABLE}({TASK_SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def build_match_query(text):
+    """ Turns user input into an FTS5 query matching all words as prefixes, or None without any words. """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    # Quoted strings never clash with the FTS5 query syntax (AND, OR, NEAR, column filters)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_tasks(queryset, text):
+    """ Restricts the task queryset to tasks whose title or description contain all words of the text. """
+    query = build_match_query(text)
+    if query is None:
+        return queryset
+    if not has_task_search(connections[queryset.db]):
+        # Slow fallback for databases without FTS5
+        for word in re.findall(r'\w+', text):
+            queryset = queryset.filter(Q(title__icontains=word) | Q(description__icontains=word))
+        return queryset
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {TASK_SEARCH_TABLE} WHERE {TASK_SEARCH_TABLE} MATCH %s', [query]
+    ))
+
+
+def filter_tasks(queryset, filters):
+    """ Applies the validated TaskFilterSerializer data to the task queryset. """
+    lookups = {
+        'state': 'state', 'priority': 'priority', 'contact': 'contact_id', 'author': 'author_id',
+        'due_date_from': 'due_date__gte', 'due_date_to': 'due_date__lte',
+    }
+    queryset = queryset.filter(**{lookup: filters[name] for name, lookup in lookups.items() if name in filters})
+    if filters.get('q'):
+        queryset = search_tasks(queryset, filters['q'])
+    return queryset
+
+
+def search_contacts(queryset, prefix, limit):
+    """ Returns the first contacts by name whose first name, last name or full name starts with the prefix. """
+    prefix = normalize_search_text(prefix)
+    if not prefix:
+        return []
+    # A range on the indexed keys instead of LIKE, which SQLite cannot run on an index with a case-sensitive column
+    upper = prefix + '\U0010ffff'
+    ids = {}
+    for key in ('name_key', 'reversed_name_key'):
+        # Both ranges are read in the result order, so the top-k of their union is among the first k rows of each.
+        # The reversed range is sorted after the index lookup, SQLite only keeps the best k rows while sorting
+        matches = queryset.filter(**{f'{key}__gte': prefix, f'{key}__lt': upper}).order_by('name_key', 'id')
+        for pk, name_key in matches.values_list('id', 'name_key')[:limit]:
+            ids[pk] = name_key
+    return sorted(ids, key=lambda pk: (ids[pk], pk))[:limit]
+
+
+def backfill_contact_search_keys(using='default', **kwargs):
+    """ Fills the name keys of contacts saved before the keys existed or still holding punctuation, runs after migrate. """
+    from join.models import ContactItem
+
+    if ContactItem._meta.db_table not in connections[using].introspection.table_names():
+        return
+    stale = Q(name_key='') | Q(name_key__regex=r'[^\w ]|_')
+    contacts = list(ContactItem.objects.using(using).filter(stale).exclude(first_name='', last_name=''))
+    for contact in contacts:
+        contact.set_name_keys()
+    ContactItem.objects.using(using).bulk_update(contacts, ['name_key', 'reversed_name_key'], batch_size=1000)
@@ -1,7 +1,10 @@
 from rest_framework import serializers
-from join.models import TaskItem, ContactItem, SubTaskItem
+from join.models import TaskItem, ContactItem, SubTaskItem, STATES, PRIORITIES
 from django.contrib.auth.models import User
 
+# Relations that ?expand= can inline into task responses
+TASK_EXPANSIONS = ['contact', 'author', 'subtasks']
+
 class TaskItemSerializer(serializers.ModelSerializer):
     subtask_ids = serializers.SerializerMethodField()
 
@@ -9,10 +12,24 @@ class TaskItemSerializer(serializers.ModelSerializer):
         model = TaskItem
         # fields = "__all__"  # Keep all existing fields
         # Optionally, specify the exact fields including the new `subtask_ids`
-        fields = ['id', 'title', 'description', 'contact', 'author', 'created_at', 'priority', 'due_date', 'state', 'subtask_ids']
+        fields = ['id', 'title', 'description', 'contact', 'author', 'created_at', 'priority', 'due_date', 'state', 'position', 'subtask_count', 'subtask_done_count', 'subtask_ids']
+        read_only_fields = ['subtask_count', 'subtask_done_count']
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        # fields= keeps only the named fields, expand= replaces the contact/author ids by the objects or adds the subtasks
+        super().__init__(*args, **kwargs)
+        expansions = task_expansions() if expand else {}
+        for name in expand:
+            self.fields[name] = expansions[name]
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
 
     def get_subtask_ids(self, obj):
-        # Retrieve all related subtasks and return their IDs
+        # Use the subtasks prefetched by TaskItem.objects.with_subtask_ids() if available
+        if 'subtasks' in getattr(obj, '_prefetched_objects_cache', {}):
+            return [subtask.id for subtask in obj.subtasks.all()]
+        # Otherwise retrieve all related subtasks and return their IDs
         return list(obj.subtasks.values_list('id', flat=True))
 
 class SubTaskItemSerializer(serializers.ModelSerializer):
@@ -20,12 +37,71 @@ class SubTaskItemSerializer(serializers.ModelSerializer):
         model = SubTaskItem
         fields = "__all__"
 
+class NestedSubTaskItemSerializer(serializers.ModelSerializer):
+    # Subtasks created together with their task, the task is assigned when saving
+    class Meta:
+        model = SubTaskItem
+        fields = ['title', 'isDone']
+
+class TaskMoveSerializer(serializers.Serializer):
+    # One card move on the board, the new column and the new position within it
+    id = serializers.IntegerField()
+    state = serializers.ChoiceField(choices=STATES)
+    position = serializers.IntegerField(min_value=0)
+
+class TaskFilterSerializer(serializers.Serializer):
+    # Query parameters of the task list, all optional and combined with AND
+    state = serializers.ChoiceField(choices=STATES, required=False)
+    priority = serializers.ChoiceField(choices=PRIORITIES, required=False)
+    contact = serializers.IntegerField(required=False)
+    author = serializers.IntegerField(required=False)
+    due_date_from = serializers.DateField(required=False)
+    due_date_to = serializers.DateField(required=False)
+    q = serializers.CharField(required=False, allow_blank=True, max_length=200)
+
+    def validate(self, data):
+        if 'due_date_from' in data and 'due_date_to' in data and data['due_date_from'] > data['due_date_to']:
+            raise serializers.ValidationError({'due_date_to': 'Must not be before due_date_from.'})
+        return data
+
+class TaskShapeSerializer(serializers.Serializer):
+    # ?fields= and ?expand= of the task endpoints, comma separated names
+    fields = serializers.CharField(required=False)
+    expand = serializers.CharField(required=False)
+
+    def validate_fields(self, value):
+        return self.parse_names(value, TaskItemSerializer.Meta.fields)
+
+    def validate_expand(self, value):
+        return self.parse_names(value, TASK_EXPANSIONS)
+
+    def parse_names(self, value, allowed):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise serializers.ValidationError(f'Unknown names {", ".join(unknown)}, expected any of {", ".join(allowed)}.')
+        # Keeps the first occurrence of every name
+        return list(dict.fromkeys(names))
+
+class ContactSearchSerializer(serializers.Serializer):
+    # Query parameters of the contact typeahead
+    prefix = serializers.CharField(max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+class BoardTaskItemSerializer(TaskItemSerializer):
+    # Same shape as TaskItemSerializer with the complete subtasks nested
+    subtasks = SubTaskItemSerializer(many=True, read_only=True)
+
+    class Meta(TaskItemSerializer.Meta):
+        fields = TaskItemSerializer.Meta.fields + ['subtasks']
+
 class ContactItemSerializer(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
 
     class Meta:
         model = ContactItem
-        fields = "__all__"
+        # All fields except the internal search keys
+        exclude = ['name_key', 'reversed_name_key']
     
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}"
@@ -38,4 +114,12 @@ class UserItemSerializer(serializers.ModelSerializer):
         fields = ('id', 'first_name', 'last_name', 'full_name', 'email', 'is_superuser', 'is_staff')
 
     def get_full_name(self, obj):
-        return f"{obj.first_name} {obj.last_name}"
\ No newline at end of file
+        return f"{obj.first_name} {obj.last_name}"
+
+def task_expansions():
+    # Nested serializers for ?expand=, built per call because a field instance can only be bound once
+    return {
+        'contact': ContactItemSerializer(read_only=True),
+        'author': UserItemSerializer(read_only=True),
+        'subtasks': SubTaskItemSerializer(many=True, read_only=True),
+    }
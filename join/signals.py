@@ -0,0 +1,141 @@
+import contextvars
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal
+from rest_framework.authtoken.models import Token
+from join.models import TaskItem, ContactItem, SubTaskItem, ModelVersion, Tombstone
+from join.authentication import token_cache
+from join.events import EVENT_MODELS, publish_change
+
+# Models whose version counter is bumped on every save and delete
+VERSIONED_MODELS = (TaskItem, SubTaskItem, ContactItem, User)
+
+# Sent after bulk_create() / bulk_update() / update() which bypass post_save, with the ids of the affected rows
+# and whether they were created
+bulk_saved = Signal()
+
+# Sent after delete_items() removed rows with the per-row post_delete handlers switched off, with the ids of the
+# deleted rows, and for subtasks the ids of their tasks
+bulk_deleted = Signal()
+
+# Set while delete_items() deletes, the per-row post_delete handlers leave the work to the bulk_deleted handlers
+deleting_in_bulk = contextvars.ContextVar('join_deleting_in_bulk', default=False)
+
+# Models whose deletions are recorded for the change feed
+TOMBSTONED_MODELS = (TaskItem, SubTaskItem, ContactItem)
+
+
+def bump_model_version(sender, **kwargs):
+    """ Bumps the version counter of the changed model, used for the ETags of the API views. """
+    if deleting_in_bulk.get():
+        return
+    ModelVersion.bump(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_model_version, sender=model, dispatch_uid=f'bump_version_save_{model._meta.label_lower}')
+    post_delete.connect(bump_model_version, sender=model, dispatch_uid=f'bump_version_delete_{model._meta.label_lower}')
+    bulk_saved.connect(bump_model_version, sender=model, dispatch_uid=f'bump_version_bulk_{model._meta.label_lower}')
+    bulk_deleted.connect(bump_model_version, sender=model, dispatch_uid=f'bump_version_bulk_delete_{model._meta.label_lower}')
+
+
+def write_tombstone(sender, instance, **kwargs):
+    """ Records the deleted row for the change feed. """
+    if deleting_in_bulk.get():
+        return
+    Tombstone.objects.create(model=sender._meta.label_lower, object_id=instance.pk)
+
+
+def write_bulk_tombstones(sender, ids, **kwargs):
+    """ Records the rows deleted by a bulk delete with one insert. """
+    Tombstone.objects.bulk_create([Tombstone(model=sender._meta.label_lower, object_id=pk) for pk in ids])
+
+
+for model in TOMBSTONED_MODELS:
+    post_delete.connect(write_tombstone, sender=model, dispatch_uid=f'tombstone_{model._meta.label_lower}')
+    bulk_deleted.connect(write_bulk_tombstones, sender=model, dispatch_uid=f'tombstone_bulk_{model._meta.label_lower}')
+
+
+def invalidate_cached_token(sender, instance, **kwargs):
+    """ Removes a deleted token from the authentication cache. """
+    token_cache.invalidate_key(instance.key)
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """ Removes all tokens of a changed or deleted user from the authentication cache. """
+    token_cache.invalidate_user(instance.pk)
+
+
+post_delete.connect(invalidate_cached_token, sender=Token, dispatch_uid='invalidate_cached_token')
+post_save.connect(invalidate_cached_user, sender=User, dispatch_uid='invalidate_cached_user_save')
+post_delete.connect(invalidate_cached_user, sender=User, dispatch_uid='invalidate_cached_user_delete')
+
+
+def publish_saved(sender, instance, created, **kwargs):
+    """ Publishes a created or updated row to the event streams. """
+    publish_change(sender, 'created' if created else 'updated', instances=[instance])
+
+
+def publish_deleted(sender, instance, **kwargs):
+    """ Publishes a deleted row to the event streams. """
+    if deleting_in_bulk.get():
+        return
+    publish_change(sender, 'deleted', ids=[instance.pk])
+
+
+def publish_bulk_deleted(sender, ids, **kwargs):
+    """ Publishes rows removed by bulk deletes to the event streams. """
+    publish_change(sender, 'deleted', ids=ids)
+
+
+def publish_bulk_saved(sender, ids, created, **kwargs):
+    """ Publishes rows written by bulk operations to the event streams. """
+    publish_change(sender, 'created' if created else 'updated', ids=ids)
+
+
+for model in EVENT_MODELS:
+    post_save.connect(publish_saved, sender=model, dispatch_uid=f'publish_save_{model._meta.label_lower}')
+    post_delete.connect(publish_deleted, sender=model, dispatch_uid=f'publish_delete_{model._meta.label_lower}')
+    bulk_saved.connect(publish_bulk_saved, sender=model, dispatch_uid=f'publish_bulk_{model._meta.label_lower}')
+    bulk_deleted.connect(publish_bulk_deleted, sender=model, dispatch_uid=f'publish_bulk_delete_{model._meta.label_lower}')
+
+
+def recount_saved_subtask(sender, instance, **kwargs):
+    """ Updates the subtask counters of the subtask's task, and of its previous task if it was moved. """
+    task_ids = {instance.task_id, getattr(instance, '_loaded_task_id', None)} - {None}
+    TaskItem.objects.filter(pk__in=task_ids).recount_subtasks()
+    instance._loaded_task_id = instance.task_id
+
+
+def recount_deleted_subtask(sender, instance, origin=None, **kwargs):
+    """ Updates the subtask counters of the deleted subtask's task. """
+    if isinstance(origin, TaskItem) or deleting_in_bulk.get():
+        # The task itself is deleted along with its subtasks, or the bulk delete recounts once
+        return
+    TaskItem.objects.filter(pk=instance.task_id).recount_subtasks()
+
+
+def recount_bulk_saved_subtasks(sender, ids, instances=None, **kwargs):
+    """ Updates the subtask counters of all tasks touched by a bulk write with one UPDATE. """
+    if instances is None:
+        task_ids = set(SubTaskItem.objects.filter(pk__in=ids).values_list('task_id', flat=True))
+    else:
+        task_ids = set()
+        for instance in instances:
+            task_ids |= {instance.task_id, getattr(instance, '_loaded_task_id', None)}
+            instance._loaded_task_id = instance.task_id
+        task_ids.discard(None)
+    TaskItem.objects.filter(pk__in=task_ids).recount_subtasks()
+
+
+def recount_bulk_deleted_subtasks(sender, ids, task_ids=(), **kwargs):
+    """ Updates the subtask counters of the tasks that lost subtasks in a bulk delete with one UPDATE. """
+    if task_ids:
+        TaskItem.objects.filter(pk__in=task_ids).recount_subtasks()
+
+
+post_save.connect(recount_saved_subtask, sender=SubTaskItem, dispatch_uid='recount_subtasks_save')
+post_delete.connect(recount_deleted_subtask, sender=SubTaskItem, dispatch_uid='recount_subtasks_delete')
+bulk_saved.connect(recount_bulk_saved_subtasks, sender=SubTaskItem, dispatch_uid='recount_subtasks_bulk')
+bulk_deleted.connect(recount_bulk_deleted_subtasks, sender=SubTaskItem, dispatch_uid='recount_subtasks_bulk_delete')
@@ -0,0 +1,19 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ SQLite backend that can open transactions with BEGIN IMMEDIATE, set with the transaction_mode option. """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Not an argument of sqlite3.connect()
+        params.pop('transaction_mode', None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is None:
+            return super()._start_transaction_under_autocommit()
+        # A deferred transaction that reads first fails with "database is locked" when it later needs the write
+        # lock held by another connection, busy_timeout only helps if the write lock is taken at BEGIN
+        self.cursor().execute(f'BEGIN {mode}')
@@ -0,0 +1,76 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.utils import encoders
+
+
+def is_stream_requested(request):
+    """ Streaming is opt-in via ?stream=1 """
+    return request.query_params.get('stream') in ('1', 'true')
+
+
+def encode_json(data):
+    # Same output format as DRF's JSONRenderer with its default settings, including its escaping of the line and
+    # paragraph separators that are valid in JSON but not in JavaScript string literals
+    text = json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def iter_json_array(queryset, serializer_class, chunk_size=None):
+    """ Yields a JSON array of the serialized queryset chunk by chunk without building the whole list. """
+    chunk_size = chunk_size or getattr(settings, 'JOIN_STREAM_CHUNK_SIZE', 2000)
+    prefix = '['
+    for chunk in iter_chunks(queryset, chunk_size):
+        # One list serializer per chunk, building the fields per row would dominate the runtime
+        data = serializer_class(chunk, many=True).data
+        yield prefix + ','.join(encode_json(item) for item in data)
+        prefix = ','
+    yield ']' if prefix == ',' else '[]'
+
+
+def iter_chunks(queryset, chunk_size):
+    chunk = []
+    for item in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def is_asgi_request(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+async def iter_async(iterator):
+    """ Runs every step of a sync iterator in the thread of the sync views and yields its items. """
+    done = object()
+    next_item = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (item := await next_item(iterator, done)) is not done:
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close, thread_sensitive=True)()
+
+
+def streaming_response(request, iterator, **kwargs):
+    """ Returns a StreamingHttpResponse that sends every item of the iterator as soon as it is produced.
+
+    Django consumes sync iterators of streaming responses completely before sending anything under ASGI, so
+    ASGI requests get an async iterator instead.
+    """
+    if is_asgi_request(request) and not hasattr(iterator, '__aiter__'):
+        iterator = iter_async(iterator)
+    return StreamingHttpResponse(iterator, **kwargs)
+
+
+def streaming_json_response(request, queryset, serializer_class, chunk_size=None):
+    """ Returns the serialized queryset as a streamed JSON array with flat memory usage. """
+    return streaming_response(
+        request, iter_json_array(queryset, serializer_class, chunk_size), content_type='application/json',
+    )
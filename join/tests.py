@@ -1,10 +1,43 @@
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, Client, AsyncClient, override_settings
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token  # Import Token model
 from django.contrib.auth.models import User
-from join.models import TaskItem, ContactItem, SubTaskItem
+from join.models import TaskItem, ContactItem, SubTaskItem, ModelVersion, Tombstone
 from join.serializers import TaskItemSerializer, ContactItemSerializer, SubTaskItemSerializer
+from join.authentication import token_cache
+from join.response_cache import response_cache
+from join.events import EventHub, FileBroker, hub
+from join.fast_serializers import task_reader, subtask_reader, contact_reader, user_reader
+from join.serializers import UserItemSerializer
+from rest_framework.renderers import JSONRenderer
 from rest_framework import status
+from django.db import IntegrityError, connection, transaction
+from django.core.cache import cache
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command, CommandError
+from io import BytesIO, StringIO
+from asgiref.sync import sync_to_async
+from join.db import configure_sqlite_connection, install_unique_user_email, read_snapshot, ReadReplicaRouter, USER_EMAIL_INDEX
+from join.board_io import BoardImporter, iter_board_download, iter_board_ndjson, iter_lines
+from join.changes import get_changes
+from join.search import backfill_contact_search_keys, install_task_search, search_contacts
+from join.middleware import QueryBudgetExceeded
+from join.metrics import MetricsRegistry, get_registry, reset_registry
+from join.hashing import HashingPool, HashingPoolSaturated
+from join.throttling import reset_throttle_backend
+from join.views import ListTasks, TaskSubtasksView
+from join.sqlite_backend.base import DatabaseWrapper as SQLiteImmediateWrapper
+import asyncio
+import base64
+import datetime
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import mock
 
 
 class LoginTest(TestCase):
@@ -93,6 +126,7 @@ class TaskAPITest(TestCase):
     # Tests for task listing and creation
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username='test_user', password='test_password', email='test@example.com')
@@ -174,10 +208,138 @@ class TaskAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(TaskItem.objects.filter(pk=task.pk).exists())
 
+    # Test that listing tasks does not run one subtask query per task.
+
+    def test_list_tasks_query_count(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        self._create_tasks_with_subtasks(2)
+        with CaptureQueriesContext(connection) as few_tasks:
+            response = self.client.get('/api/v1/tasks/')
+        self.assertEqual(len(response.data), 2)
+
+        self._create_tasks_with_subtasks(20)
+        with CaptureQueriesContext(connection) as many_tasks:
+            response = self.client.get('/api/v1/tasks/')
+        self.assertEqual(len(response.data), 22)
+
+        # Query count must not grow with the number of tasks
+        self.assertEqual(len(few_tasks), len(many_tasks))
+        for task in response.data:
+            expected_ids = list(SubTaskItem.objects.filter(task_id=task['id']).order_by('id').values_list('id', flat=True))
+            self.assertEqual(task['subtask_ids'], expected_ids)
+
+    # Test that loading a single task uses the prefetched subtask ids.
+
+    def test_task_detail_query_count(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        task = self._create_tasks_with_subtasks(1)[0]
+
+        # One query each for the ETag versions, the task and its subtask ids
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/v1/tasks/{task.pk}/')
+        self.assertEqual(len(response.data[0]['subtask_ids']), 3)
+
+    # Test walking all tasks page by page with the keyset cursor.
+
+    def test_list_tasks_paginated(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        for i in range(5):
+            TaskItem.objects.create(title=f'Task {i}', author=self.user, due_date=f'2024-09-0{5 - i}')
+
+        titles = []
+        url = '/api/v1/tasks/?page_size=2&ordering=due_date'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            titles += [task['title'] for task in response.data['results']]
+            url = response.data['next']
+
+        # Ordered by due date, every task exactly once
+        self.assertEqual(titles, ['Task 4', 'Task 3', 'Task 2', 'Task 1', 'Task 0'])
+
+    # Test that a tampered cursor is rejected.
+
+    def test_list_tasks_invalid_cursor(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        response = self.client.get('/api/v1/tasks/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Well-formed cursors whose values do not fit the ordering columns
+        for ordering, position in [('id', ['abc']), ('id', [None]), ('id', [[1]]), ('id', [2 ** 70]),
+                                   ('due_date', ['not-a-date', 1]), ('due_date', [{}, 1])]:
+            cursor = base64.urlsafe_b64encode(json.dumps({'o': ordering, 'p': position}).encode()).decode()
+            response = self.client.get(f'/api/v1/tasks/?ordering={ordering}&cursor={cursor}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+            self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+    # Test that the streamed task list matches the regular response.
+
+    def test_list_tasks_stream(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        self._create_tasks_with_subtasks(5)
+
+        response = self.client.get('/api/v1/tasks/')
+        streamed = self.client.get('/api/v1/tasks/?stream=1')
+
+        self.assertEqual(streamed.status_code, status.HTTP_200_OK)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b''.join(streamed.streaming_content), response.content)
+
+    # Test that the streamed and async task lists escape line and paragraph separators like JSONRenderer.
+
+    def test_list_tasks_line_separators(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        TaskItem.objects.create(title='Line\u2028Paragraph\u2029', description='', author=self.user)
+        expected = JSONRenderer().render(TaskItemSerializer(TaskItem.objects.all(), many=True).data)
+        self.assertIn(b'\\u2028', expected)
+
+        streamed = self.client.get('/api/v1/tasks/?stream=1')
+        self.assertEqual(b''.join(streamed.streaming_content), expected)
+        response = self.client.get('/api/v1/async/tasks/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.content, expected)
+
+    # Test that unchanged tasks are answered with 304 Not Modified.
+
+    def test_list_tasks_etag(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        self._create_tasks_with_subtasks(2)
+
+        response = self.client.get('/api/v1/tasks/')
+        etag = response['ETag']
+
+        # Without a cached response only the version lookup runs, neither the rows nor the serializer are touched
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Changing a subtask invalidates the task list
+        SubTaskItem.objects.filter(task__title='Task 0').first().delete()
+        response = self.client.get('/api/v1/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    # Test that the ETag differs between query strings.
+
+    def test_list_tasks_etag_per_query(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        response = self.client.get('/api/v1/tasks/')
+        paginated = self.client.get('/api/v1/tasks/?page_size=10')
+        self.assertNotEqual(response['ETag'], paginated['ETag'])
+
+    def _create_tasks_with_subtasks(self, count):
+        tasks = [TaskItem.objects.create(title=f'Task {i}', author=self.user) for i in range(count)]
+        for task in tasks:
+            for i in range(3):
+                SubTaskItem.objects.create(title=f'Subtask {i}', task=task)
+        return tasks
+
 class SubTaskAPITest(TestCase):
     # Tests for subtask listing and creation
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username='test_user', password='test_password', email='test@example.com')
@@ -332,6 +494,7 @@ class ContactAPITest(TestCase):
     # Tests for contacts listing and creation
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username='test_user', password='test_password', email='test@example.com')
@@ -383,6 +546,22 @@ class ContactAPITest(TestCase):
         self.assertEqual(response.data[0]['first_name'], 'First Name')
         self.assertEqual(response.data[0]['last_name'], 'Last Name')
 
+    # Test that the contact detail is revalidated after an update.
+
+    def test_contact_detail_etag(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        contact = ContactItem.objects.create(
+            first_name='First Name', last_name='Last Name')
+        etag = self.client.get(f'/api/v1/contacts/{contact.pk}/')['ETag']
+
+        response = self.client.get(f'/api/v1/contacts/{contact.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(f'/api/v1/contacts/{contact.pk}/', {'first_name': 'Updated'}, format='json')
+        response = self.client.get(f'/api/v1/contacts/{contact.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['first_name'], 'Updated')
+
     # Test deleting a single contact.
 
     def test_delete_contact(self):
@@ -396,3 +575,1503 @@ class ContactAPITest(TestCase):
         # Assert response status and ensure contact is deleted
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(ContactItem.objects.filter(pk=contact.pk).exists())
+
+
+class BoardAPITest(TestCase):
+    # Tests for the combined board snapshot
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.contact = ContactItem.objects.create(
+            first_name='First Name', last_name='Last Name')
+
+    # Test that the board contains the same shapes as the single endpoints.
+
+    def test_board_snapshot(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        task = TaskItem.objects.create(title='Test Task', author=self.user, contact=self.contact)
+        SubTaskItem.objects.create(title='Subtask 1', task=task)
+        SubTaskItem.objects.create(title='Subtask 2', task=task)
+
+        response = self.client.get('/api/v1/board/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['current_user'], {'id': self.user.id})
+        self.assertEqual(response.data['contacts'], self.client.get('/api/v1/contacts/').data)
+        self.assertEqual(response.data['users'], self.client.get('/api/v1/users/').data)
+
+        board_task = response.data['tasks'][0]
+        subtasks = board_task.pop('subtasks')
+        self.assertEqual(board_task, self.client.get('/api/v1/tasks/').data[0])
+        self.assertEqual(subtasks, self.client.get(f'/api/v1/tasks/{task.id}/subtasks/').data)
+
+    # Test that the board needs a fixed number of queries.
+
+    def test_board_query_count(self):
+        self.client.force_authenticate(user=self.user, token=self.token)
+        for i in range(10):
+            task = TaskItem.objects.create(title=f'Task {i}', author=self.user, contact=self.contact)
+            SubTaskItem.objects.create(title=f'Subtask {i}', task=task)
+
+        # ETag versions, tasks, subtasks, contacts and users
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/v1/board/')
+        self.assertEqual(len(response.data['tasks']), 10)
+
+    # Test that the board requires authentication.
+
+    def test_board_unauthenticated(self):
+        response = self.client.get('/api/v1/board/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(JOIN_CHANGES_OVERLAP_SECONDS=0)
+class ChangesAPITest(TestCase):
+    # Tests for the incremental change feed
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+
+    # Test that a request without token returns everything.
+
+    def test_changes_full_sync(self):
+        task = TaskItem.objects.create(title='Test Task', author=self.user)
+        SubTaskItem.objects.create(title='Test SubTask', task=task)
+
+        response = self.client.get('/api/v1/changes/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['tasks']), 1)
+        self.assertEqual(len(response.data['subtasks']), 1)
+        self.assertEqual(response.data['deleted'], {'tasks': [], 'subtasks': [], 'contacts': []})
+        self.assertTrue(response.data['next'])
+
+    # Test that only rows changed after the token are returned, including deletions.
+
+    def test_changes_since_token(self):
+        unchanged = TaskItem.objects.create(title='Unchanged Task', author=self.user)
+        updated = TaskItem.objects.create(title='Updated Task', author=self.user)
+        deleted = TaskItem.objects.create(title='Deleted Task', author=self.user)
+        subtask = SubTaskItem.objects.create(title='Deleted SubTask', task=deleted)
+        token = self.client.get('/api/v1/changes/').data['next']
+
+        self.client.patch(f'/api/v1/tasks/{updated.pk}/', {'title': 'New Title'}, format='json')
+        self.client.delete(f'/api/v1/tasks/{deleted.pk}/')
+        contact = ContactItem.objects.create(first_name='First Name', last_name='Last Name')
+
+        response = self.client.get(f'/api/v1/changes/?since={token}')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([task['title'] for task in response.data['tasks']], ['New Title'])
+        self.assertEqual([item['id'] for item in response.data['contacts']], [contact.pk])
+        self.assertEqual(response.data['deleted']['tasks'], [deleted.pk])
+        # Cascaded deletions are recorded as well
+        self.assertEqual(response.data['deleted']['subtasks'], [subtask.pk])
+        self.assertNotIn(unchanged.pk, [task['id'] for task in response.data['tasks']])
+
+        # Nothing changed since the latest token
+        response = self.client.get(f'/api/v1/changes/?since={response.data["next"]}')
+        self.assertEqual(response.data['tasks'], [])
+        self.assertEqual(response.data['deleted']['tasks'], [])
+
+    # Test that an invalid token is rejected.
+
+    def test_changes_invalid_token(self):
+        response = self.client.get('/api/v1/changes/?since=yesterday')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkAPITest(TestCase):
+    # Tests for the bulk task and subtask endpoints
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+
+    # Test creating tasks together with their subtasks.
+
+    def test_bulk_create_tasks_with_subtasks(self):
+        tasks_data = [
+            {'title': 'Task 1', 'description': 'Description 1', 'subtasks': [{'title': f'Subtask {i}'} for i in range(8)]},
+            {'title': 'Task 2', 'description': 'Description 2', 'priority': 'High'},
+        ]
+
+        response = self.client.post('/api/v1/tasks/bulk/', tasks_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([task['title'] for task in response.data], ['Task 1', 'Task 2'])
+        self.assertEqual(len(response.data[0]['subtasks']), 8)
+        self.assertEqual(response.data[0]['subtask_ids'], [subtask['id'] for subtask in response.data[0]['subtasks']])
+        self.assertEqual(response.data[1]['author'], self.user.id)
+        self.assertEqual(SubTaskItem.objects.filter(task_id=response.data[0]['id']).count(), 8)
+
+    # Test that one invalid item rejects the whole batch with errors per item.
+
+    def test_bulk_create_tasks_invalid_item(self):
+        tasks_data = [
+            {'title': 'Valid Task', 'description': 'Description'},
+            {'title': 'Invalid Task', 'description': 'Description', 'priority': 'Urgent'},
+            {'title': 'Invalid Subtask', 'description': 'Description', 'subtasks': [{'title': ''}]},
+        ]
+
+        response = self.client.post('/api/v1/tasks/bulk/', tasks_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('priority', response.data[1])
+        self.assertIn('subtasks', response.data[2])
+        self.assertFalse(TaskItem.objects.exists())
+
+    # Test updating many tasks at once.
+
+    def test_bulk_update_tasks(self):
+        task1 = TaskItem.objects.create(title='Task 1', author=self.user)
+        task2 = TaskItem.objects.create(title='Task 2', author=self.user)
+
+        response = self.client.patch('/api/v1/tasks/bulk/', [
+            {'id': task1.pk, 'state': 'Done'},
+            {'id': task2.pk, 'title': 'Updated Task 2'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task1.refresh_from_db()
+        task2.refresh_from_db()
+        self.assertEqual(task1.state, 'Done')
+        self.assertEqual(task2.title, 'Updated Task 2')
+
+        # Unknown ids are reported for their item
+        response = self.client.patch('/api/v1/tasks/bulk/', [{'id': 9999, 'state': 'Done'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.data[0])
+
+    # Test updating and deleting many subtasks at once.
+
+    def test_bulk_update_and_delete_subtasks(self):
+        task = TaskItem.objects.create(title='Task', author=self.user)
+        response = self.client.post('/api/v1/subtasks/bulk/', [
+            {'title': f'Subtask {i}', 'task': task.pk} for i in range(3)
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ids = [subtask['id'] for subtask in response.data]
+
+        response = self.client.patch('/api/v1/subtasks/bulk/', [{'id': pk, 'isDone': True} for pk in ids], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(SubTaskItem.objects.filter(isDone=True).count(), 3)
+
+        # Nothing is deleted if one of the ids does not exist
+        response = self.client.delete('/api/v1/subtasks/bulk/', {'ids': ids + [9999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['missing'], [9999])
+        self.assertEqual(SubTaskItem.objects.count(), 3)
+
+        response = self.client.delete('/api/v1/subtasks/bulk/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(SubTaskItem.objects.exists())
+
+    # Test that bulk deletes write tombstones, versions and recounts once per batch, not once per row.
+
+    def test_bulk_delete_once_per_batch(self):
+        def delete_tasks(count):
+            tasks = TaskItem.objects.bulk_create([TaskItem(title=f'Task {i}', author=self.user) for i in range(count)])
+            SubTaskItem.objects.bulk_create([SubTaskItem(title='Subtask', task=task) for task in tasks for _ in range(2)])
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete('/api/v1/tasks/bulk/', {'ids': [task.pk for task in tasks]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            return len(queries)
+
+        # The first bump of a model creates its version row
+        delete_tasks(1)
+        versions = ModelVersion.get_versions(TaskItem, SubTaskItem)
+        self.assertEqual(delete_tasks(10), delete_tasks(50))
+        self.assertEqual(ModelVersion.get_versions(TaskItem, SubTaskItem), [version + 2 for version in versions])
+        self.assertEqual(Tombstone.objects.filter(model='join.taskitem').count(), 61)
+        self.assertEqual(Tombstone.objects.filter(model='join.subtaskitem').count(), 122)
+        self.assertFalse(SubTaskItem.objects.exists())
+
+        task = TaskItem.objects.create(title='Task', author=self.user)
+        subtasks = SubTaskItem.objects.bulk_create([SubTaskItem(title='Subtask', task=task, isDone=i == 0) for i in range(3)])
+        response = self.client.delete('/api/v1/subtasks/bulk/', {'ids': [subtasks[0].pk, subtasks[1].pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        task.refresh_from_db()
+        self.assertEqual((task.subtask_count, task.subtask_done_count), (1, 0))
+
+    # Test moving cards between columns with one UPDATE per target state.
+
+    def test_move_tasks(self):
+        tasks = [TaskItem.objects.create(title=f'Task {i}', author=self.user) for i in range(4)]
+        moves = [
+            {'id': tasks[0].pk, 'state': 'Done', 'position': 1},
+            {'id': tasks[1].pk, 'state': 'Done', 'position': 0},
+            {'id': tasks[2].pk, 'state': 'In Progress', 'position': 0},
+            {'id': tasks[3].pk, 'state': 'Done', 'position': 2},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/tasks/move/', moves, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "join_taskitem"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual([(task['title'], task['state'], task['position']) for task in response.data], [
+            ('Task 1', 'Done', 0), ('Task 0', 'Done', 1), ('Task 3', 'Done', 2), ('Task 2', 'In Progress', 0),
+        ])
+
+    # Test that moves with unknown tasks are rolled back completely.
+
+    def test_move_tasks_missing(self):
+        task = TaskItem.objects.create(title='Task', author=self.user)
+        moves = [
+            {'id': task.pk, 'state': 'Done', 'position': 0},
+            {'id': 9999, 'state': 'Done', 'position': 1},
+        ]
+
+        response = self.client.post('/api/v1/tasks/move/', moves, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['missing'], [9999])
+        task.refresh_from_db()
+        self.assertEqual(task.state, 'To Do')
+
+        # Invalid states and duplicate moves are reported per item
+        response = self.client.post('/api/v1/tasks/move/', [
+            {'id': task.pk, 'state': 'Done', 'position': 0},
+            {'id': task.pk, 'state': 'Archived', 'position': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('state', response.data[1])
+
+
+class ExplainQueriesTest(TestCase):
+    # Tests for the query plan check
+
+    def test_api_queries_use_indexes(self):
+        out = StringIO()
+        call_command('explain_queries', '--fail-on-scan', stdout=out)
+        self.assertIn('0 unexpected full table scans.', out.getvalue())
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    # Tests for the cached token authentication
+
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    # Test that repeated requests with the same token skip the token query.
+
+    def test_token_cached(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/current_user/')
+        self.assertEqual(response.data['id'], self.user.id)
+
+        # The saved token and user query is the only query this view needs
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/current_user/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.hits, 1)
+
+    # Test that deleted tokens are rejected right away.
+
+    def test_deleted_token_invalidated(self):
+        self.client.get('/api/v1/current_user/')
+        self.token.delete()
+
+        response = self.client.get('/api/v1/current_user/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # Test that deactivated users are rejected right away.
+
+    def test_changed_user_invalidated(self):
+        self.client.get('/api/v1/current_user/')
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get('/api/v1/current_user/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # Test that expired entries are resolved again.
+
+    @override_settings(JOIN_TOKEN_CACHE_TTL=0)
+    def test_token_cache_ttl(self):
+        self.client.get('/api/v1/current_user/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/v1/current_user/')
+
+
+class AsyncReadAPITest(TestCase):
+    # Tests for the async read endpoints
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.async_client = AsyncClient()
+        self.auth_headers = {'Authorization': f'Token {self.token.key}'}
+        task = TaskItem.objects.create(title='Test Task', author=self.user)
+        SubTaskItem.objects.create(title='Subtask 1', task=task)
+        SubTaskItem.objects.create(title='Subtask 2', task=task)
+        ContactItem.objects.create(first_name='First Name', last_name='Last Name')
+        self.task = task
+
+    # Test that the async endpoints return the same bytes as the sync ones.
+
+    async def test_async_matches_sync(self):
+        for path in ['tasks/', f'tasks/{self.task.pk}/', f'tasks/{self.task.pk}/subtasks/',
+                     'subtasks/', 'contacts/', 'users/']:
+            response = await self.async_client.get(f'/api/v1/async/{path}', headers=self.auth_headers)
+            expected = await self.sync_get(f'/api/v1/{path}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, path)
+            self.assertEqual(response.content, expected, path)
+
+    # Test that requests with query parameters get the same answer as from the sync endpoints.
+
+    async def test_async_query_parameters(self):
+        for path in ['tasks/?page_size=1', 'tasks/?fields=id,title', 'tasks/?q=Test', 'tasks/?stream=1',
+                     f'tasks/{self.task.pk}/?expand=subtasks', 'contacts/?page_size=1']:
+            response = await self.async_client.get(f'/api/v1/async/{path}', headers=self.auth_headers)
+            content = b''.join([chunk async for chunk in response]) if response.streaming else response.content
+            self.assertEqual(content, await self.sync_get(f'/api/v1/{path}'), path)
+
+    # Test that unchanged rows are answered with 304 Not Modified and a change revalidates them.
+
+    async def test_async_etag(self):
+        response = await self.async_client.get('/api/v1/async/subtasks/', headers=self.auth_headers)
+        etag = response['ETag']
+        response = await self.async_client.get('/api/v1/async/subtasks/', headers={**self.auth_headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        await sync_to_async(SubTaskItem.objects.create)(title='Subtask 3', task=self.task)
+        response = await self.async_client.get('/api/v1/async/subtasks/', headers={**self.auth_headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    # Test that the async list endpoints require a valid token.
+
+    async def test_async_requires_token(self):
+        response = await self.async_client.get('/api/v1/async/tasks/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = await self.async_client.get('/api/v1/async/tasks/', headers={'Authorization': 'Token invalid'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    # Test that streamed lists are sent chunk by chunk under ASGI instead of being collected first.
+
+    async def test_stream_asgi(self):
+        await sync_to_async(SubTaskItem.objects.create)(title='Subtask 3', task=self.task)
+        with self.settings(JOIN_STREAM_CHUNK_SIZE=1):
+            response = await self.async_client.get('/api/v1/subtasks/?stream=1', headers=self.auth_headers)
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b''.join(chunks), await self.sync_get('/api/v1/subtasks/'))
+
+    async def sync_get(self, path):
+        response = await sync_to_async(self.client.get)(path)
+        if response.streaming:
+            return await sync_to_async(b''.join)(response.streaming_content)
+        return response.content
+
+
+class EventsAPITest(TestCase):
+    # Tests for the Server-Sent Events stream
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+
+    # Test that created, updated and deleted tasks are streamed with their data.
+
+    def test_events_stream(self):
+        response = self.client.get('/api/v1/events/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        self.assertEqual(next(events), b'retry: 3000\n\n')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post('/api/v1/tasks/', {'title': 'Test Task', 'description': 'Test'}, format='json')
+        event = next(events).decode()
+        self.assertIn('event: task.created\n', event)
+        self.assertIn(f'"id":{created.data["id"]}', event)
+        self.assertIn('"title":"Test Task"', event)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/v1/tasks/{created.data["id"]}/')
+        event = next(events).decode()
+        self.assertIn('event: task.deleted\n', event)
+        self.assertIn(f'data: {{"id":{created.data["id"]}}}', event)
+        response.close()
+
+    # Test that events are only published once the transaction commits.
+
+    def test_events_published_on_commit(self):
+        response = self.client.get('/api/v1/events/')
+        events = iter(response.streaming_content)
+        next(events)
+
+        last_event_id = hub._last_id
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            TaskItem.objects.create(title='Test Task', author=self.user)
+        self.assertEqual(hub._last_id, last_event_id)
+
+        for callback in callbacks:
+            callback()
+        self.assertIn(b'event: task.created\n', next(events))
+        response.close()
+
+    # Test that the file broker numbers events in the shared file, the same for every worker and across truncations.
+
+    def test_file_broker_event_ids(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(JOIN_EVENTS_FILE=os.path.join(directory, 'events.ndjson')):
+            first, second = FileBroker(EventHub()), FileBroker(EventHub())
+            first.publish('task.created', '{"id":1}')
+            second.publish('task.updated', '{"id":1}')
+            first.publish('task.deleted', '{"id":1}')
+
+            # A worker started later replays them with the same ids
+            late = EventHub()
+            FileBroker(late)._load_history()
+            subscription = late.subscribe(last_event_id=1)
+            events = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+            self.assertEqual(events, [(2, 'task.updated', '{"id":1}'), (3, 'task.deleted', '{"id":1}')])
+
+            second.max_bytes = 0
+            second.publish('task.created', '{"id":2}')
+            with open(first.path, 'rb') as file:
+                self.assertEqual(file.read().splitlines(), [b'[4, "task.created", "{\\"id\\":2}"]'])
+
+    # Test that ASGI requests get an async stream that sends every event as soon as it is published.
+
+    async def test_events_stream_asgi(self):
+        response = await AsyncClient().get('/api/v1/events/', headers={'Authorization': f'Token {self.token.key}'})
+        self.assertTrue(response.is_async)
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'retry: 3000\n\n')
+
+        # Published from another thread like the file broker's tail thread
+        threading.Thread(target=hub.dispatch, args=('task.created', '{"id":1}')).start()
+        event = await asyncio.wait_for(anext(events), 5)
+        self.assertIn(b'event: task.created\ndata: {"id":1}\n\n', event)
+        await events.aclose()
+
+    # Test that the stream requires authentication.
+
+    def test_events_unauthenticated(self):
+        response = APIClient().get('/api/v1/events/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ResponseCacheTest(TestCase):
+    # Tests for the cached list responses
+
+    def setUp(self):
+        cache.clear()
+        response_cache.reset_stats()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+
+    # Test that a cache hit only reads the model versions and returns the same bytes.
+
+    def test_cache_hit(self):
+        TaskItem.objects.create(title='Test Task', author=self.user)
+        response = self.client.get('/api/v1/tasks/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(1):
+            cached = self.client.get('/api/v1/tasks/')
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(response_cache.stats(), {'hits': 1, 'misses': 1})
+
+        # Conditional requests are answered from the same versions query
+        with self.assertNumQueries(1):
+            not_modified = self.client.get('/api/v1/tasks/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    # Test that saving a model invalidates only the lists containing it.
+
+    def test_cache_invalidation(self):
+        self.client.get('/api/v1/tasks/')
+        self.client.get('/api/v1/users/')
+
+        self.client.post('/api/v1/subtasks/', {'title': 'Test SubTask', 'task': TaskItem.objects.create(title='Task', author=self.user).pk}, format='json')
+
+        response = self.client.get('/api/v1/tasks/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(self.client.get('/api/v1/users/')['X-Cache'], 'HIT')
+
+    # Test that a version bump by another worker, which never touches this worker's cache, invalidates it too.
+
+    def test_cache_invalidation_by_other_worker(self):
+        task = TaskItem.objects.create(title='Before', author=self.user)
+        self.client.get('/api/v1/tasks/')
+        # A queryset update sends no signals, like a write handled by another process
+        TaskItem.objects.filter(pk=task.pk).update(title='After')
+        ModelVersion.bump(TaskItem)
+        response = self.client.get('/api/v1/tasks/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data[0]['title'], 'After')
+
+    # Test that cached responses carry the ETag of the requesting user.
+
+    def test_cache_hit_etag_per_user(self):
+        other = APIClient()
+        other.force_authenticate(user=User.objects.create_user(username='other_user', password='test_password'))
+        response = self.client.get('/api/v1/tasks/')
+        cached = other.get('/api/v1/tasks/')
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertNotEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(other.get('/api/v1/tasks/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, status.HTTP_200_OK)
+
+    # Test that query strings are cached separately.
+
+    def test_cache_per_query_string(self):
+        self.client.get('/api/v1/contacts/')
+        response = self.client.get('/api/v1/contacts/?page_size=10')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'], [])
+
+
+class FastSerializerTest(TestCase):
+    # Tests that the fast read path renders exactly like the serializers
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com', first_name='Jürgen', last_name='Ødegård')
+        User.objects.create_user(username='empty_user', password='test_password')
+        contact = ContactItem.objects.create(first_name='Zoë', last_name='O\'Brien "Quote"')
+        ContactItem.objects.create(first_name='', last_name='')
+        with_contact = TaskItem.objects.create(title='Task ✓', description='Line\nbreak', author=self.user, contact=contact,
+                                               priority='High', due_date='2024-09-01', state='Done', position=3)
+        TaskItem.objects.create(title='Task without contact or subtasks', author=self.user)
+        SubTaskItem.objects.create(title='Open', task=with_contact)
+        SubTaskItem.objects.create(title='Done', task=with_contact, isDone=True)
+
+    def assertSameBytes(self, reader, serializer_class, queryset):
+        renderer = JSONRenderer()
+        expected = renderer.render(serializer_class(queryset, many=True).data)
+        self.assertEqual(renderer.render(reader.read(queryset)), expected)
+
+    def test_tasks_equivalent(self):
+        self.assertSameBytes(task_reader, TaskItemSerializer, TaskItem.objects.all())
+        self.assertSameBytes(task_reader, TaskItemSerializer, TaskItem.objects.filter(contact__isnull=True))
+
+    def test_subtasks_equivalent(self):
+        self.assertSameBytes(subtask_reader, SubTaskItemSerializer, SubTaskItem.objects.all())
+
+    def test_contacts_equivalent(self):
+        self.assertSameBytes(contact_reader, ContactItemSerializer, ContactItem.objects.all())
+
+    def test_users_equivalent(self):
+        self.assertSameBytes(user_reader, UserItemSerializer, User.objects.all())
+
+    # Test that the subtask ids of all tasks are loaded with one grouped query.
+
+    def test_tasks_query_count(self):
+        with self.assertNumQueries(2):
+            task_reader.read(TaskItem.objects.all())
+
+
+
+class SubtaskCounterTest(TestCase):
+    # Tests that the denormalized subtask counters follow every subtask write
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+        self.task = TaskItem.objects.create(title='Test Task', author=self.user)
+        self.other_task = TaskItem.objects.create(title='Other Task', author=self.user)
+
+    def get_counters(self, task):
+        response = self.client.get(f'/api/v1/tasks/{task.id}/')
+        return response.data[0]['subtask_count'], response.data[0]['subtask_done_count']
+
+    # Test that creating, toggling and deleting subtasks updates the counters.
+
+    def test_counters_follow_subtask_api(self):
+        response = self.client.post('/api/v1/subtasks/', {'title': 'One', 'task': self.task.id}, format='json')
+        self.client.post('/api/v1/subtasks/', {'title': 'Two', 'task': self.task.id}, format='json')
+        self.assertEqual(self.get_counters(self.task), (2, 0))
+
+        subtask_id = response.data['id']
+        self.client.patch(f'/api/v1/subtasks/{subtask_id}/', {'isDone': True}, format='json')
+        self.assertEqual(self.get_counters(self.task), (2, 1))
+
+        self.client.delete(f'/api/v1/subtasks/{subtask_id}/')
+        self.assertEqual(self.get_counters(self.task), (1, 0))
+
+    # Test that moving a subtask to another task updates both tasks.
+
+    def test_counters_follow_moved_subtask(self):
+        subtask = SubTaskItem.objects.create(title='Moved', task=self.task, isDone=True)
+        self.client.patch(f'/api/v1/subtasks/{subtask.id}/', {'task': self.other_task.id}, format='json')
+        self.assertEqual(self.get_counters(self.task), (0, 0))
+        self.assertEqual(self.get_counters(self.other_task), (1, 1))
+
+    # Test that the bulk endpoints update the counters.
+
+    def test_counters_follow_bulk_api(self):
+        response = self.client.post('/api/v1/subtasks/bulk/', [
+            {'title': 'One', 'task': self.task.id}, {'title': 'Two', 'task': self.task.id, 'isDone': True},
+        ], format='json')
+        self.assertEqual(self.get_counters(self.task), (2, 1))
+
+        ids = [item['id'] for item in response.data]
+        self.client.patch('/api/v1/subtasks/bulk/', [{'id': ids[0], 'task': self.other_task.id}], format='json')
+        self.assertEqual(self.get_counters(self.task), (1, 1))
+        self.assertEqual(self.get_counters(self.other_task), (1, 0))
+
+    # Test that the counters are read-only in the API.
+
+    def test_counters_read_only(self):
+        self.client.patch(f'/api/v1/tasks/{self.task.id}/', {'subtask_count': 5}, format='json')
+        self.assertEqual(self.get_counters(self.task), (0, 0))
+
+    # Test that saving a task loaded before a subtask write keeps the counters of that write.
+
+    def test_counters_survive_stale_task_save(self):
+        stale = TaskItem.objects.get(pk=self.task.pk)
+        SubTaskItem.objects.create(title='Concurrent', task=self.task)
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertEqual(self.get_counters(self.task), (1, 0))
+        self.assertEqual(TaskItem.objects.get(pk=self.task.pk).title, 'Renamed')
+
+    # Test that the recount command finds and repairs drifted counters.
+
+    def test_recount_command(self):
+        SubTaskItem.objects.bulk_create([SubTaskItem(title='Raw', task=self.task, isDone=True)])
+        out = StringIO()
+        call_command('recount', '--dry-run', stdout=out)
+        self.assertIn('1 task(s) with drifted subtask counters found.', out.getvalue())
+        self.assertEqual(self.get_counters(self.task), (0, 0))
+
+        call_command('recount', stdout=StringIO())
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.subtask_count, self.task.subtask_done_count), (1, 1))
+        self.assertFalse(TaskItem.objects.with_subtask_drift().exists())
+
+
+class TaskFilterAPITest(TestCase):
+    # Tests for the filters and the full-text search of the task list
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.other_user = User.objects.create_user(username='other_user', password='test_password')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+        self.contact = ContactItem.objects.create(first_name='John', last_name='Doe')
+        self.report = TaskItem.objects.create(title='Quarterly report', description='Draft the numbers', author=self.user,
+                                              contact=self.contact, priority='High', due_date='2024-09-01', state='To Do')
+        self.review = TaskItem.objects.create(title='Code review', description='Review the reporting module',
+                                              author=self.other_user, priority='Low', due_date='2024-09-15', state='Done')
+        self.cafe = TaskItem.objects.create(title='Café meeting', description='', author=self.user,
+                                            priority='Medium', due_date='2024-10-01', state='In Progress')
+
+    def get_ids(self, query):
+        response = self.client.get('/api/v1/tasks/' + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(task['id'] for task in response.data)
+
+    # Test that every filter restricts the list.
+
+    def test_filters(self):
+        self.assertEqual(self.get_ids('?state=Done'), [self.review.id])
+        self.assertEqual(self.get_ids('?priority=High'), [self.report.id])
+        self.assertEqual(self.get_ids(f'?contact={self.contact.id}'), [self.report.id])
+        self.assertEqual(self.get_ids(f'?author={self.user.id}'), [self.report.id, self.cafe.id])
+        self.assertEqual(self.get_ids('?due_date_from=2024-09-10&due_date_to=2024-09-30'), [self.review.id])
+        self.assertEqual(self.get_ids(f'?author={self.user.id}&state=In%20Progress'), [self.cafe.id])
+
+    # Test that invalid filter values are rejected.
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get('/api/v1/tasks/?state=Later').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/v1/tasks/?due_date_from=tomorrow').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/v1/tasks/?due_date_from=2024-10-01&due_date_to=2024-09-01')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('due_date_to', response.data)
+
+    # Test the full-text search over title and description.
+
+    def test_search(self):
+        self.assertEqual(self.get_ids('?q=report'), [self.report.id, self.review.id])
+        self.assertEqual(self.get_ids('?q=report%20draft'), [self.report.id])
+        self.assertEqual(self.get_ids('?q=cafe'), [self.cafe.id])
+        self.assertEqual(self.get_ids('?q=REVIEW&state=Done'), [self.review.id])
+        # Query syntax is treated as plain words
+        self.assertEqual(self.get_ids('?q=%22report%22%20OR%20NEAR('), [])
+        self.assertEqual(self.get_ids('?q=%20'), [self.report.id, self.review.id, self.cafe.id])
+
+    # Test that the search index follows updates, bulk updates and deletes.
+
+    def test_search_index_follows_writes(self):
+        self.client.patch(f'/api/v1/tasks/{self.cafe.id}/', {'title': 'Budget planning'}, format='json')
+        self.assertEqual(self.get_ids('?q=cafe'), [])
+        self.assertEqual(self.get_ids('?q=budget'), [self.cafe.id])
+
+        TaskItem.objects.filter(pk=self.review.id).update(description='Nothing')
+        self.assertEqual(self.get_ids('?q=reporting'), [])
+
+        self.client.delete(f'/api/v1/tasks/{self.report.id}/')
+        self.assertEqual(self.get_ids('?q=report'), [])
+
+    # Test that the post_migrate handlers skip a database without the join tables, e.g. before makemigrations.
+
+    def test_post_migrate_without_tables(self):
+        with mock.patch.object(connection.introspection, 'table_names', return_value=['auth_user']), \
+                CaptureQueriesContext(connection) as context:
+            install_task_search()
+            backfill_contact_search_keys()
+        self.assertFalse([query for query in context.captured_queries if 'join_' in query['sql']])
+
+
+class ContactSearchAPITest(TestCase):
+    # Tests for the contact prefix search
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+        self.john = ContactItem.objects.create(first_name='John', last_name='Doe')
+        self.joanna = ContactItem.objects.create(first_name='Joanna', last_name='Smith')
+        self.zoe = ContactItem.objects.create(first_name='Zoë', last_name='Johnson')
+        self.other = ContactItem.objects.create(first_name='Max', last_name='Mustermann')
+
+    def search(self, query):
+        response = self.client.get('/api/v1/contacts/search/' + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [contact['id'] for contact in response.data]
+
+    # Test matching first name, last name and full name prefixes, ordered by full name.
+
+    def test_prefix_matches(self):
+        self.assertEqual(self.search('?prefix=jo'), [self.joanna.id, self.john.id, self.zoe.id])
+        self.assertEqual(self.search('?prefix=JOHN'), [self.john.id, self.zoe.id])
+        self.assertEqual(self.search('?prefix=john%20%20d'), [self.john.id])
+        self.assertEqual(self.search('?prefix=zoe'), [self.zoe.id])
+        self.assertEqual(self.search('?prefix=smith%20j'), [self.joanna.id])
+        self.assertEqual(self.search('?prefix=xyz'), [])
+
+    # Test that the limit caps the number of results.
+
+    def test_limit(self):
+        self.assertEqual(self.search('?prefix=jo&limit=2'), [self.joanna.id, self.john.id])
+        response = self.client.get('/api/v1/contacts/search/?prefix=jo&limit=500')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/v1/contacts/search/').status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that a limit of one returns the first match by full name, also when it matched on the last name.
+
+    def test_limit_ranks_by_full_name(self):
+        zed = ContactItem.objects.create(first_name='Zed', last_name='Smith')
+        bob = ContactItem.objects.create(first_name='Bob', last_name='Smithers')
+        self.assertEqual(search_contacts(ContactItem.objects.all(), 'smith', 1), [bob.id])
+        self.assertEqual(search_contacts(ContactItem.objects.all(), 'smith', 10), [bob.id, self.joanna.id, zed.id])
+
+    # Test that results have the ContactItemSerializer shape without the search keys.
+
+    def test_result_shape(self):
+        response = self.client.get('/api/v1/contacts/search/?prefix=max')
+        self.assertEqual(response.data, ContactItemSerializer(ContactItem.objects.filter(pk=self.other.id), many=True).data)
+        self.assertNotIn('name_key', response.data[0])
+
+    # Test that punctuation in names and prefixes is ignored.
+
+    def test_punctuation(self):
+        obrien = ContactItem.objects.create(first_name='Anne-Marie', last_name="O'Brien")
+        self.assertEqual(self.search('?prefix=ob'), [obrien.id])
+        self.assertEqual(self.search("?prefix=o'b"), [obrien.id])
+        self.assertEqual(self.search('?prefix=annem'), [obrien.id])
+
+        # Keys stored before punctuation was dropped are recomputed after migrate
+        ContactItem.objects.filter(pk=obrien.pk).update(name_key="anne-marie o'brien", reversed_name_key="o'brien anne-marie")
+        backfill_contact_search_keys()
+        self.assertEqual(search_contacts(ContactItem.objects.all(), 'ob', 10), [obrien.id])
+
+    # Test that renamed contacts are found by their new name.
+
+    def test_renamed_contact(self):
+        self.client.patch(f'/api/v1/contacts/{self.other.id}/', {'last_name': 'Power'}, format='json')
+        self.assertEqual(self.search('?prefix=power'), [self.other.id])
+        self.assertEqual(self.search('?prefix=muster'), [])
+
+
+class DatabaseProfileTest(TestCase):
+    # Tests for the SQLite connection hook and the immediate transaction backend
+
+    # Test that the configured pragmas are applied to a connection.
+
+    @override_settings(JOIN_SQLITE_PRAGMAS={'cache_size': -1234, 'busy_timeout': 1234})
+    def test_pragmas_applied(self):
+        try:
+            configure_sqlite_connection(sender=None, connection=connection)
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -1234)
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 1234)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size = -2000')
+                cursor.execute('PRAGMA busy_timeout = 5000')
+
+    # Test that a read snapshot sees one commit and takes no write lock, even with IMMEDIATE transactions.
+
+    def test_read_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.sqlite3')
+            other = sqlite3.connect(path, timeout=0, isolation_level=None)
+            other.execute('PRAGMA journal_mode = WAL')
+            other.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+            other.execute('INSERT INTO item DEFAULT VALUES')
+            settings_dict = {**connection.settings_dict, 'NAME': path, 'OPTIONS': {'transaction_mode': 'IMMEDIATE'}}
+            wrapper = SQLiteImmediateWrapper(settings_dict, alias='snapshot')
+            try:
+                with read_snapshot(wrapper), wrapper.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM item')
+                    self.assertEqual(cursor.fetchone(), (1,))
+                    other.execute('INSERT INTO item DEFAULT VALUES')
+                    cursor.execute('SELECT COUNT(*) FROM item')
+                    self.assertEqual(cursor.fetchone(), (1,))
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM item')
+                    self.assertEqual(cursor.fetchone(), (2,))
+            finally:
+                other.close()
+                wrapper.close()
+
+    # Test that transactions of the backend take the write lock at BEGIN.
+
+    def test_immediate_transactions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'immediate.sqlite3')
+            settings_dict = {**connection.settings_dict, 'NAME': path, 'OPTIONS': {'transaction_mode': 'IMMEDIATE'}}
+            wrapper = SQLiteImmediateWrapper(settings_dict, alias='immediate')
+            wrapper.ensure_connection()
+            other = sqlite3.connect(path, timeout=0, isolation_level=None)
+            try:
+                wrapper._start_transaction_under_autocommit()
+                with self.assertRaises(sqlite3.OperationalError):
+                    other.execute('BEGIN IMMEDIATE')
+                wrapper.connection.execute('ROLLBACK')
+                other.execute('BEGIN IMMEDIATE')
+                other.execute('ROLLBACK')
+            finally:
+                other.close()
+                wrapper.close()
+
+
+class ReadReplicaRouterTest(SimpleTestCase):
+    # Tests for the routing of reads to the read-only connection
+
+    # Test that reads go to the replica outside of transactions only.
+
+    def test_routing(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(TaskItem), 'replica')
+        self.assertEqual(router.db_for_write(TaskItem), 'default')
+        connection.in_atomic_block = True
+        try:
+            self.assertEqual(router.db_for_read(TaskItem), 'default')
+        finally:
+            connection.in_atomic_block = False
+        self.assertTrue(router.allow_migrate('default', 'join'))
+        self.assertFalse(router.allow_migrate('replica', 'join'))
+
+
+class BenchApiCommandTest(TransactionTestCase):
+    # Tests for the API benchmark command, its requests commit like in production
+
+    def run_bench(self, *args):
+        call_command('bench_api', '--users=2', '--contacts=2', '--tasks=3', '--subtasks-per-task=1', '--requests=2',
+                     '--warmup=0', '--route=api/v1/tasks/<int:pk>/', *args, stdout=StringIO(), stderr=StringIO())
+
+    # Test that the results are written as JSON and only the rows of the benchmark are deleted afterwards.
+
+    def test_output(self):
+        user = User.objects.create_user(username='test_user', password='test_password')
+        task = TaskItem.objects.create(title='Kept task', author=user)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            self.run_bench(f'--output={path}')
+            with open(path) as file:
+                report = json.load(file)
+        self.assertEqual(set(report['routes']), {'GET api/v1/tasks/<int:pk>/', 'PATCH api/v1/tasks/<int:pk>/', 'DELETE api/v1/tasks/<int:pk>/'})
+        result = report['routes']['GET api/v1/tasks/<int:pk>/']
+        self.assertEqual(result['status'], [200])
+        self.assertGreater(result['queries'], 0)
+        self.assertGreater(result['bytes'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(list(TaskItem.objects.all()), [task])
+        self.assertEqual(list(User.objects.all()), [user])
+        self.assertFalse(Tombstone.objects.exists())
+
+    # Test that more queries than in the baseline fail the command.
+
+    def test_regression(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            self.run_bench(f'--output={path}')
+            with open(path) as file:
+                report = json.load(file)
+            report['routes']['GET api/v1/tasks/<int:pk>/']['queries'] -= 1
+            with open(path, 'w') as file:
+                json.dump(report, file)
+            with self.assertRaisesMessage(CommandError, 'GET api/v1/tasks/<int:pk>/'):
+                self.run_bench(f'--baseline={path}', '--threshold=1000')
+
+    # Test that the repeated requests of a route are not throttled.
+
+    @override_settings(JOIN_THROTTLE_RATES={'write': '1/hour'})
+    def test_unthrottled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            self.run_bench(f'--output={path}')
+            with open(path) as file:
+                report = json.load(file)
+        self.assertEqual(report['routes']['PATCH api/v1/tasks/<int:pk>/']['status'], [200])
+        self.assertEqual(report['routes']['DELETE api/v1/tasks/<int:pk>/']['status'], [204])
+
+
+class BoardExportImportTest(TestCase):
+    # Tests for the NDJSON board export and import
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user, token=self.token)
+        self.author = User.objects.create_user(username='author', password='test_password')
+        self.contact = ContactItem.objects.create(first_name='John', last_name='Doe')
+        self.task = TaskItem.objects.create(
+            title='Task', description='Description', author=self.author, contact=self.contact,
+            priority='High', state='In Progress', due_date='2024-05-01', position=3)
+        SubTaskItem.objects.create(title='First', task=self.task, isDone=True)
+        SubTaskItem.objects.create(title='Second', task=self.task)
+
+    def export(self):
+        response = self.client.get('/api/v1/board/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return b''.join(response.streaming_content)
+
+    def post_import(self, content):
+        return self.client.post('/api/v1/board/import/', content, content_type='application/x-ndjson')
+
+    # Test that an exported board imports as new rows with remapped foreign keys and counters.
+
+    def test_round_trip(self):
+        content = self.export()
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['board', 'contact', 'task', 'subtask', 'subtask'])
+        self.assertEqual(lines[2]['author'], 'author')
+
+        response = self.post_import(content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'contacts': 1, 'tasks': 1, 'subtasks': 2})
+        task = TaskItem.objects.exclude(pk=self.task.pk).get()
+        contact = ContactItem.objects.exclude(pk=self.contact.pk).get()
+        self.assertEqual(task.contact_id, contact.id)
+        self.assertEqual(task.author, self.author)
+        self.assertEqual((task.priority, task.state, str(task.due_date), task.position), ('High', 'In Progress', '2024-05-01', 3))
+        self.assertEqual((task.subtask_count, task.subtask_done_count), (2, 1))
+        self.assertEqual(sorted(task.subtasks.values_list('title', 'isDone')), [('First', True), ('Second', False)])
+        self.assertEqual(contact.name_key, 'john doe')
+
+    # Test that tasks of authors missing in this database belong to the importing user.
+
+    def test_unknown_author(self):
+        content = self.export().replace(b'"author":"author"', b'"author":"missing"')
+        self.assertEqual(self.post_import(content).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(TaskItem.objects.exclude(pk=self.task.pk).get().author, self.user)
+
+    # Test that an invalid line rolls back the whole import and reports its line number.
+
+    def test_invalid_line(self):
+        content = self.export() + b'{"type":"subtask","id":9,"task":12345,"title":"x","isDone":false,"created_at":"2024-01-01"}\n'
+        response = self.post_import(content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['line'], 6)
+        self.assertEqual(TaskItem.objects.count(), 1)
+        self.assertEqual(ContactItem.objects.count(), 1)
+        response = self.post_import(b'{"type":"contact"}\n')
+        self.assertEqual((response.status_code, response.data['line']), (status.HTTP_400_BAD_REQUEST, 1))
+
+    # Test that values the serializers would reject are not imported.
+
+    def test_invalid_values(self):
+        header = b'{"type":"board","version":1}\n'
+        task = {'type': 'task', 'id': 1, 'title': 'Task', 'description': '', 'contact': None, 'author': 'author',
+                'created_at': '2024-01-01', 'priority': 'Low', 'due_date': '2024-01-01', 'state': 'To Do', 'position': 0}
+        subtask = {'type': 'subtask', 'id': 1, 'task': 1, 'title': 'Subtask', 'isDone': False, 'created_at': '2024-01-01'}
+        for line in [{**task, 'title': 'x' * 101}, {**task, 'description': 5}, {**task, 'position': '1'},
+                     {**task, 'position': 2 ** 70}, {**subtask, 'isDone': 'no'}, {**subtask, 'isDone': 1},
+                     {'type': 'contact', 'id': 1, 'first_name': None, 'last_name': 'Doe', 'created_at': '2024-01-01'}]:
+            content = header + json.dumps(task).encode() + b'\n' + json.dumps(line).encode() + b'\n'
+            response = self.post_import(content)
+            self.assertEqual((response.status_code, response.data['line']), (status.HTTP_400_BAD_REQUEST, 3), line)
+        self.assertEqual(TaskItem.objects.count(), 1)
+
+    # Test that without WAL the download is spooled, so the snapshot is not held while the client reads.
+
+    def test_export_spooled_without_wal(self):
+        savepoints = len(connection.savepoint_ids)
+        chunks = iter_board_download()
+        # The first chunk is only sent once the whole file is written and the snapshot is closed
+        self.assertEqual(next(chunks), ''.join(iter_board_ndjson()))
+        self.assertEqual(len(connection.savepoint_ids), savepoints)
+        self.assertEqual(list(chunks), [])
+
+    # Test that imported rows are stamped when the import finishes, not when it started.
+
+    def test_import_stamps_rows_at_the_end(self):
+        lines = list(iter_lines(BytesIO(self.export())))
+        importer = BoardImporter(self.user)
+        # Like an import that started an hour ago
+        an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        importer.now = connection.ops.adapt_datetimefield_value(an_hour_ago)
+        for model in (ContactItem, TaskItem, SubTaskItem):
+            model.objects.update(updated_at=an_hour_ago)
+        since = timezone.now()
+        importer.run(lines)
+        changes = get_changes(since)
+        self.assertEqual([len(changes[key]) for key in ('contacts', 'tasks', 'subtasks')], [1, 1, 2])
+
+    # Test the export_board and import_board commands.
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'board.ndjson')
+            call_command('export_board', f'--output={path}')
+            out = StringIO()
+            call_command('import_board', path, '--author=test_user', '--batch-size=1', stdout=out)
+        self.assertIn('Imported 1 contacts, 1 tasks and 2 subtasks', out.getvalue())
+        self.assertEqual(SubTaskItem.objects.count(), 4)
+        self.assertFalse(TaskItem.objects.with_subtask_drift().exists())
+        with self.assertRaisesMessage(CommandError, 'does not exist'):
+            call_command('import_board', path, '--author=missing')
+
+
+class PerformanceMiddlewareTest(TestCase):
+    # Tests for the Server-Timing header, the slow request log and the query budgets
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.task = TaskItem.objects.create(title='Test Task', author=self.user)
+        SubTaskItem.objects.create(title='Subtask 1', task=self.task)
+
+    def timings(self, response):
+        timings = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            timings[name] = dict(param.split('=', 1) for param in params)
+        return timings
+
+    # Test that the header reports the queries of the request and the view, render and total time.
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/tasks/')
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'db', 'view', 'render', 'total'})
+        self.assertEqual(timings['db']['desc'], f'"{len(context.captured_queries)} queries"')
+        self.assertEqual(timings['view']['desc'], '"ListTasks"')
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['view']['dur']))
+
+        with self.settings(JOIN_SERVER_TIMING=False):
+            self.assertFalse(self.client.get('/api/v1/tasks/').has_header('Server-Timing'))
+
+    # Test that the queries of async views are counted as well.
+
+    async def test_async_view(self):
+        response = await AsyncClient().get('/api/v1/async/tasks/', headers={'Authorization': f'Token {self.token.key}'})
+        timings = self.timings(response)
+        self.assertNotEqual(timings['db']['desc'], '"0 queries"')
+        self.assertEqual(timings['view']['desc'], '"AsyncListTasks"')
+
+    # Test that requests above the threshold are logged with their metrics.
+
+    def test_slow_request_log(self):
+        with self.settings(JOIN_SLOW_REQUEST_MS=0), self.assertLogs('join.performance', 'WARNING') as logs:
+            self.client.get(f'/api/v1/tasks/{self.task.pk}/subtasks/')
+        record = logs.records[0].request_metrics
+        self.assertEqual((record['view'], record['status'], record['query_budget']), ('TaskSubtasksView', 200, 5))
+        self.assertIn('total_ms', record)
+        self.assertTrue(logs.output[0].startswith('WARNING:join.performance:Slow request: {'))
+
+    # Test that exceeding the query budget raises in DEBUG and is only logged otherwise.
+
+    def test_query_budget(self):
+        with mock.patch.object(ListTasks, 'query_budget', {'GET': 1}):
+            with self.assertLogs('join.performance', 'WARNING') as logs:
+                self.assertEqual(self.client.get('/api/v1/tasks/').status_code, status.HTTP_200_OK)
+            self.assertIn('Over budget request', logs.output[0])
+            cache.clear()
+            with self.settings(DEBUG=True), self.assertRaisesMessage(QueryBudgetExceeded, 'query_budget is 1'):
+                self.client.get('/api/v1/tasks/')
+        cache.clear()
+        with self.settings(JOIN_SLOW_REQUEST_MS=None), self.assertNoLogs('join.performance'):
+            self.client.get('/api/v1/tasks/')
+
+    # Test that the budget covers the queries of a session authenticated request.
+
+    @override_settings(DEBUG=True)
+    def test_query_budget_with_session(self):
+        client = APIClient()
+        client.force_login(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f'/api/v1/tasks/{self.task.pk}/subtasks/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(context.captured_queries), TaskSubtasksView.query_budget['GET'])
+
+    # Test that the budgets only apply to their method and that a committed write never turns into an error.
+
+    @override_settings(DEBUG=True)
+    def test_query_budget_of_writes(self):
+        response = self.client.post('/api/v1/tasks/', {'title': 'Plain task', 'description': 'No subtasks'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with mock.patch.object(ListTasks, 'query_budget', {'GET': 6, 'POST': 1}):
+            with self.assertLogs('join.performance', 'WARNING') as logs:
+                response = self.client.post('/api/v1/tasks/', {'title': 'Over budget', 'description': 'Still saved'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('Over budget request', logs.output[0])
+        self.assertTrue(TaskItem.objects.filter(title='Over budget').exists())
+
+
+def observe_in_worker(directory, requests):
+    registry = MetricsRegistry(directory)
+    for _ in range(requests):
+        registry.observe('api/v1/tasks/', 'GET', 200, 0.02)
+    registry.close()
+
+
+class MetricsTest(TestCase):
+    # Tests for the metrics registry and the /metrics endpoint
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(reset_registry)
+        self.user = User.objects.create_user(username='test_user', password='test_password')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    # Test that the files of several worker processes add up.
+
+    def test_workers_add_up(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=observe_in_worker, args=(self.directory.name, 100)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        registry = MetricsRegistry(self.directory.name)
+        registry.observe('api/v1/tasks/', 'GET', 200, 3.0)
+        values = registry.collect()[('api/v1/tasks/', 'GET', 200)]
+        self.assertEqual(len(os.listdir(self.directory.name)), 4)
+        self.assertEqual(values[0], 301)
+        self.assertAlmostEqual(values[1], 9.0)
+        # 0.02 s falls into the 0.025 bucket, 3 s into the 5 s bucket
+        self.assertEqual(values[2:], [0, 0, 300, 0, 0, 0, 0, 0, 0, 1, 0, 0])
+
+    # Test that a registry reopening the file of an earlier process keeps its values and grows the file as needed.
+
+    def test_reopen_and_grow(self):
+        registry = MetricsRegistry(self.directory.name)
+        for index in range(1000):
+            registry.observe(f'route/{index}/', 'GET', 200, 0.001)
+        registry.close()
+        registry = MetricsRegistry(self.directory.name)
+        registry.observe('route/0/', 'GET', 200, 0.001)
+        totals = registry.collect()
+        self.assertEqual(len(totals), 1000)
+        self.assertEqual(totals[('route/0/', 'GET', 200)][0], 2)
+
+    # Test the Prometheus output of /metrics with route patterns as labels.
+
+    def test_metrics_endpoint(self):
+        task = TaskItem.objects.create(title='Test Task', author=self.user)
+        with self.settings(JOIN_METRICS_DIR=self.directory.name):
+            self.client.get(f'/api/v1/tasks/{task.pk}/')
+            self.client.get('/api/v1/tasks/0/subtasks/')
+            self.client.get('/missing/')
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE join_http_request_duration_seconds histogram', text)
+        self.assertIn('join_http_requests_total{route="api/v1/tasks/<int:pk>/",method="GET",status="200"} 1', text)
+        self.assertIn('join_http_requests_total{route="api/v1/tasks/<int:task_id>/subtasks/",method="GET",status="404"} 1', text)
+        self.assertIn('join_http_requests_total{route="unmatched",method="GET",status="404"} 1', text)
+        self.assertIn('join_http_request_duration_seconds_bucket{route="api/v1/tasks/<int:pk>/",method="GET",status="200",le="+Inf"} 1', text)
+        self.assertEqual(get_registry().directory, None)
+
+    # Test that methods made up by clients share one series.
+
+    def test_unknown_methods(self):
+        with self.settings(JOIN_METRICS_DIR=self.directory.name):
+            for index in range(5):
+                self.client.generic(f'XMETHOD{index}', '/missing/')
+            totals = get_registry().collect()
+        self.assertEqual(list(totals), [('unmatched', 'OTHER', 404)])
+        self.assertEqual(totals[('unmatched', 'OTHER', 404)][0], 5)
+
+
+class PasswordHashingPoolTest(TestCase):
+    # Tests for the bounded password hashing pool and the unique emails
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+
+    def saturated_pool(self):
+        pool = HashingPool(workers=1, queue_size=0)
+        pool.slots.acquire()
+        return mock.patch('join.hashing.get_hashing_pool', return_value=pool)
+
+    # Test that hashes run on the pool threads and callers beyond the queue are rejected.
+
+    def test_pool(self):
+        pool = HashingPool(workers=1, queue_size=1)
+        self.assertTrue(pool.run(lambda: threading.current_thread().name).startswith('join-hashing'))
+        pool.slots.acquire()
+        pool.slots.acquire()
+        with self.assertRaises(HashingPoolSaturated):
+            pool.run(str, 'x')
+        self.assertTrue(self.user.check_password('test_password'))
+
+    # Test that logins and registrations answer 503 with Retry-After while the pool is saturated.
+
+    def test_saturated(self):
+        with self.saturated_pool():
+            response = self.client.post('/api/v1/login/', {'username': 'test_user', 'password': 'test_password'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            response = self.client.post(
+                '/api/v1/register/', {'username': 'new_user', 'email': 'new@example.com', 'password': 'new_password'})
+            self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(username='new_user').exists())
+
+    # Test that duplicates are found with one query and rejected by the unique email index.
+
+    def test_unique_email(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                '/api/v1/register/', {'username': 'new_user', 'email': 'test@example.com', 'password': 'new_password'})
+        self.assertEqual(response.data, {'error': 'Email already exists.'})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='other_user', email='test@example.com')
+        User.objects.create_user(username='no_email_1')
+        User.objects.create_user(username='no_email_2')
+
+    # Test that duplicate emails keep the index from being created and are reported in the migrate output or the log.
+
+    def test_unique_email_duplicates(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {USER_EMAIL_INDEX}')
+        User.objects.create_user(username='other_user', email='test@example.com')
+        out = StringIO()
+        install_unique_user_email(stdout=out)
+        self.assertIn(f'Not creating {USER_EMAIL_INDEX}', out.getvalue())
+        with self.assertLogs('join.db', 'WARNING') as logs:
+            install_unique_user_email()
+        self.assertIn('several users share an email', logs.output[0])
+
+
+class ThrottlingTest(TestCase):
+    # Tests for the sliding window throttling
+
+    def setUp(self):
+        cache.clear()
+        reset_throttle_backend()
+        self.addCleanup(reset_throttle_backend)
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def login(self, address):
+        return Client(REMOTE_ADDR=address).post('/api/v1/login/', {'username': 'test_user', 'password': 'test_password'})
+
+    # Test that logins are limited per IP address and answered with 429 and Retry-After.
+
+    @override_settings(JOIN_THROTTLE_RATES={'login': '2/min'})
+    def test_login_per_ip(self):
+        self.assertEqual(self.login('10.0.0.1').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login('10.0.0.1').status_code, status.HTTP_200_OK)
+        response = self.login('10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 120)
+        self.assertEqual(self.login('10.0.0.2').status_code, status.HTTP_200_OK)
+
+    # Test that writes are limited per user while reads are not.
+
+    @override_settings(JOIN_THROTTLE_RATES={'write': '2/min'})
+    def test_writes_per_user(self):
+        for expected in [status.HTTP_201_CREATED, status.HTTP_201_CREATED, status.HTTP_429_TOO_MANY_REQUESTS]:
+            response = self.client.post('/api/v1/contacts/', {'first_name': 'A', 'last_name': 'B'}, format='json')
+            self.assertEqual(response.status_code, expected)
+        self.assertEqual(self.client.get('/api/v1/contacts/').status_code, status.HTTP_200_OK)
+        other = User.objects.create_user(username='other_user', password='test_password', email='other@example.com')
+        self.client.force_authenticate(user=other)
+        response = self.client.post('/api/v1/contacts/', {'first_name': 'A', 'last_name': 'B'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    # Test that the previous window counts in proportion to its overlap with the sliding window.
+
+    @override_settings(JOIN_THROTTLE_RATES={'login': '4/min'})
+    def test_sliding_window(self):
+        with mock.patch('join.throttling.time.time', return_value=6000.0):
+            statuses = [self.login('10.0.0.1').status_code for _ in range(5)]
+        self.assertEqual(statuses.count(status.HTTP_200_OK), 4)
+        # Half-way through the next window the 4 earlier logins still count as 2
+        with mock.patch('join.throttling.time.time', return_value=6090.0):
+            statuses = [self.login('10.0.0.1').status_code for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            self.assertEqual(self.login('10.0.0.1')['Retry-After'], '15')
+
+    # Test that the cache backend shares the counters between backend instances, like between workers.
+
+    @override_settings(JOIN_THROTTLE_RATES={'login': '1/min'}, JOIN_THROTTLE_BACKEND='join.throttling.CacheBackend')
+    def test_cache_backend(self):
+        self.assertEqual(self.login('10.0.0.1').status_code, status.HTTP_200_OK)
+        reset_throttle_backend()
+        self.assertEqual(self.login('10.0.0.1').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class TaskShapeAPITest(TestCase):
+    # Tests for ?fields= and ?expand= of the task endpoints
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test@example.com', first_name='Test')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.contact = ContactItem.objects.create(first_name='John', last_name='Doe')
+        self.task = self.create_task()
+
+    def create_task(self):
+        task = TaskItem.objects.create(title='Task', description='Description', author=self.user, contact=self.contact)
+        SubTaskItem.objects.create(title='Subtask', task=task, isDone=True)
+        return task
+
+    # Test that ?fields= returns only the named fields and loads only their columns.
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/tasks/?fields=id,title,subtask_ids')
+        self.assertEqual(response.data, [{'id': self.task.id, 'title': 'Task', 'subtask_ids': [self.task.subtasks.get().id]}])
+        task_queries = [query['sql'] for query in context.captured_queries if 'FROM "join_taskitem"' in query['sql']]
+        self.assertNotIn('description', task_queries[0])
+
+        response = self.client.get(f'/api/v1/tasks/{self.task.id}/?fields=state')
+        self.assertEqual(response.data, [{'state': 'To Do'}])
+
+    # Test that ?expand= inlines the related objects with a query count independent of the number of tasks.
+
+    def test_expand(self):
+        url = '/api/v1/tasks/?expand=contact,author,subtasks'
+        response = self.client.get(url)
+        task = response.data[0]
+        self.assertEqual(task['contact'], ContactItemSerializer(self.contact).data)
+        self.assertEqual(task['author']['full_name'], 'Test ')
+        self.assertEqual([subtask['title'] for subtask in task['subtasks']], ['Subtask'])
+        self.assertEqual(task['subtask_count'], 1)
+
+        with CaptureQueriesContext(connection) as few_tasks:
+            self.client.get(url + '&page_size=50')
+        for _ in range(5):
+            self.create_task()
+        with CaptureQueriesContext(connection) as more_tasks:
+            response = self.client.get(url + '&page_size=50')
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(len(few_tasks.captured_queries), len(more_tasks.captured_queries))
+
+        response = self.client.get(f'/api/v1/tasks/{self.task.id}/?fields=id&expand=contact')
+        self.assertEqual(response.data, [{'id': self.task.id, 'contact': ContactItemSerializer(self.contact).data}])
+
+    # Test that sparse fields work with keyset pagination on columns that are not requested.
+
+    def test_fields_with_pagination(self):
+        self.create_task()
+        response = self.client.get('/api/v1/tasks/?fields=title&page_size=1&ordering=due_date')
+        self.assertEqual(response.data['results'], [{'title': 'Task'}])
+        # The model versions of the ETag and the page, the cursor needs no query for deferred columns
+        with self.assertNumQueries(2):
+            response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'title': 'Task'}])
+        self.assertIsNone(response.data['next'])
+
+    # Test that unknown names are rejected.
+
+    def test_unknown_names(self):
+        response = self.client.get('/api/v1/tasks/?fields=id,secret&expand=subtasks,contact')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('secret', str(response.data['fields']))
+        response = self.client.get(f'/api/v1/tasks/{self.task.id}/?expand=description')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that changing the user refreshes cached and revalidated responses expanding the author.
+
+    def test_expand_author_after_user_change(self):
+        urls = ['/api/v1/tasks/?expand=author', f'/api/v1/tasks/{self.task.id}/?expand=author']
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.user.first_name = 'Changed'
+        self.user.save()
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(self.client.get(url).content)[0]['author']['first_name'], 'Changed')
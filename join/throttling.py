@@ -0,0 +1,145 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """ Turns DRF style rates like '10/min' or '1000/day' into (number of requests, window seconds). """
+    count, period = rate.split('/')
+    return int(count), DURATIONS[period[0]]
+
+
+class InProcessBackend:
+    """ Counters of the previous and current window per key in a dict, only covers the current process. """
+
+    # The least recently hit keys are dropped beyond this, their counts are at most one window old anyway
+    max_keys = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> (window, previous window count, current window count)
+        self.counters = {}
+
+    def counts(self, key, window):
+        entry = self.counters.get(key)
+        if entry is None or entry[0] < window - 1:
+            return 0, 0
+        if entry[0] == window - 1:
+            return entry[2], 0
+        return entry[1], entry[2]
+
+    def add(self, key, window, duration):
+        with self._lock:
+            previous, current = self.counts(key, window)
+            # Re-inserting keeps the dict ordered from least to most recently hit
+            self.counters.pop(key, None)
+            self.counters[key] = (window, previous, current + 1)
+            if len(self.counters) > self.max_keys:
+                del self.counters[next(iter(self.counters))]
+
+
+class CacheBackend:
+    """ Counters in the Django cache named by JOIN_THROTTLE_CACHE_ALIAS, shared by all workers using that cache.
+
+    Only memcached, redis, database and file caches are shared between processes, a LocMemCache is not. Cache
+    increments are atomic for memcached and redis, other backends may lose concurrent hits.
+    """
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'JOIN_THROTTLE_CACHE_ALIAS', 'default')]
+
+    def counts(self, key, window):
+        keys = [f'join:throttle:{key}:{window - 1}', f'join:throttle:{key}:{window}']
+        values = self.cache.get_many(keys)
+        return values.get(keys[0], 0), values.get(keys[1], 0)
+
+    def add(self, key, window, duration):
+        cache_key = f'join:throttle:{key}:{window}'
+        # Kept for two windows so the next window can still weigh it
+        if not self.cache.add(cache_key, 1, timeout=2 * duration):
+            try:
+                self.cache.incr(cache_key)
+            except ValueError:
+                self.cache.set(cache_key, 1, timeout=2 * duration)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_throttle_backend():
+    """ Returns the backend configured in JOIN_THROTTLE_BACKEND, created on first use. """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(getattr(settings, 'JOIN_THROTTLE_BACKEND', 'join.throttling.InProcessBackend'))()
+    return _backend
+
+
+def reset_throttle_backend():
+    global _backend
+    _backend = None
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """ Limits requests per user, or per IP address for anonymous requests, with a sliding window counter.
+
+    The scope is the view's throttle_scope, otherwise 'write' for unsafe methods, and its rate is looked up in
+    JOIN_THROTTLE_RATES. The number of requests in the last window is estimated from the counts of the current
+    and the previous fixed window, so a check reads two counters whatever the rate.
+    """
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None and request.method not in SAFE_METHODS:
+            scope = 'write'
+        return scope
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = getattr(settings, 'JOIN_THROTTLE_RATES', {}).get(scope)
+        if rate is None:
+            return True
+        limit, duration = parse_rate(rate)
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        key = f'{scope}:{ident}'
+
+        now = time.time()
+        window, elapsed = divmod(now, duration)
+        window = int(window)
+        backend = get_throttle_backend()
+        previous, current = backend.counts(key, window)
+        weight = 1 - elapsed / duration
+        if previous * weight + current + 1 > limit:
+            self.retry_after = self.get_retry_after(previous, current, limit, duration, elapsed)
+            return False
+        backend.add(key, window, duration)
+        return True
+
+    def get_retry_after(self, previous, current, limit, duration, elapsed):
+        # Time until the estimate leaves room for one more request
+        if limit < 1:
+            return duration
+        if current + 1 > limit:
+            # Only the next window helps, by then this window's count is the one fading out
+            return duration - elapsed + duration * (1 - (limit - 1) / current)
+        return duration * (1 - (limit - 1 - current) / previous) - elapsed
+
+    def wait(self):
+        return None if self.retry_after is None else max(1, math.ceil(self.retry_after))
@@ -1,3 +1,5 @@
+from functools import partial
+
 from django.shortcuts import render, redirect
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
@@ -6,20 +8,55 @@ from rest_framework.views import APIView
 from rest_framework import status
 from django.contrib.auth import logout
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.views import View
+from django.http import HttpResponse
 from join.models import TaskItem, ContactItem, SubTaskItem
-from join.serializers import TaskItemSerializer, UserItemSerializer, ContactItemSerializer, SubTaskItemSerializer
-from rest_framework.authentication import TokenAuthentication
+from join.etags import etag_for
+from join.response_cache import cache_response
+from join.fast_serializers import task_reader, subtask_reader, contact_reader, user_reader
+from join.serializers import TaskItemSerializer, UserItemSerializer, ContactItemSerializer, SubTaskItemSerializer, BoardTaskItemSerializer, TaskFilterSerializer, TaskShapeSerializer, ContactSearchSerializer
+from join.search import filter_tasks, search_contacts
+from join.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from join.pagination import KeysetPagination
+from join.streaming import is_asgi_request, is_stream_requested, streaming_json_response, streaming_response
+from join.changes import decode_change_token, get_changes
+from join.board_io import BoardImportError, import_board, iter_board_download, iter_lines, spool_upload
+from join.events import aiter_events, get_broker, hub, iter_events
+from join.metrics import get_registry, render_prometheus
+from join.hashing import HashingPoolSaturated
+from join.throttling import SlidingWindowThrottle
+from join.bulk import check_bulk_items, check_bulk_ids, validate_tasks_with_subtasks, create_tasks_with_subtasks, create_items, update_items, delete_items, validate_moves, move_tasks
+
+# Keysets accepted by the paginated task list, each one ends with the unique id
+TASK_ORDERINGS = {
+    'id': ('id',),
+    'due_date': ('due_date', 'id'),
+    'position': ('state', 'position', 'id'),
+}
+
+
+def hashing_busy_response():
+    return Response({"error": "Too many logins in progress, please try again."},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
 
 
 class LoginView(ObtainAuthToken):
     """ View to login a user """
 
+    # ObtainAuthToken turns off the default throttles
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'login'
+
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data,
                                            context={'request': request})
-        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except HashingPoolSaturated:
+            return hashing_busy_response()
         user = serializer.validated_data['user']
         token, created = Token.objects.get_or_create(user=user)
         return Response({
@@ -32,6 +69,8 @@ class LoginView(ObtainAuthToken):
 class RegisterView(APIView):
     """ View to register a user including error responses. """
 
+    throttle_scope = 'register'
+
     def post(self, request, *args, **kwargs):
         username = request.data.get('username')
         first_name = request.data.get('first_name')
@@ -42,18 +81,26 @@ class RegisterView(APIView):
         if not username or not email or not password:
             return Response({"error": "All fields are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if User.objects.filter(username=username).exists():
+        # One query for both checks, runs before hashing so duplicates never cost a hash
+        taken = list(User.objects.filter(Q(username=username) | Q(email=email)).values_list('username', flat=True)[:2])
+        if username in taken:
             return Response({"error": "Username already exists."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if User.objects.filter(email=email).exists():
+        if taken:
             return Response({"error": "Email already exists."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             # Create the user
-            user = User.objects.create_user(
-            username=username, email=email, password=password, first_name=first_name, last_name=last_name)
+            with transaction.atomic():
+                user = User.objects.create_user(
+                username=username, email=email, password=password, first_name=first_name, last_name=last_name)
 
             return Response({"message": "User created successfully."}, status=status.HTTP_201_CREATED)
+        except HashingPoolSaturated:
+            return hashing_busy_response()
+        except IntegrityError:
+            # A concurrent registration won the unique username or email index
+            return Response({"error": "Username or email already exists."}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -61,14 +108,41 @@ class RegisterView(APIView):
 class ListTasks(APIView):
     """ View to load all tasks from the database """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # Checked by join.middleware.PerformanceMiddleware, the query count must not grow with the number of tasks
+    query_budget = {'GET': 6}
 
+    # User is part of ?expand=author
+    @etag_for(TaskItem, SubTaskItem, ContactItem, User)
+    @cache_response(TaskItem, SubTaskItem, ContactItem, User)
     def get(self, request, format=None):
-        tasks = TaskItem.objects.all() # option to show all tasks for all users
+        filters = TaskFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        shape = TaskShapeSerializer(data=request.query_params)
+        if not shape.is_valid():
+            return Response(shape.errors, status=status.HTTP_400_BAD_REQUEST)
+        tasks = TaskItem.objects.with_subtask_ids() # option to show all tasks for all users
         # tasks = TaskItem.objects.filter(author=request.user) # option to show only the user tasks for the current user
-        serializer = TaskItemSerializer(tasks, many=True)
-        return Response(serializer.data)
+        tasks = filter_tasks(tasks, filters.validated_data)
+        paginator = KeysetPagination(orderings=TASK_ORDERINGS)
+        serializer_class = TaskItemSerializer
+        if shape.validated_data:
+            # The keyset pagination reads its ordering columns from the last row
+            ordering = TASK_ORDERINGS[paginator.get_ordering_name(request)]
+            tasks = tasks.with_shape(**shape.validated_data, extra_columns=ordering)
+            serializer_class = partial(TaskItemSerializer, **shape.validated_data)
+        if is_stream_requested(request):
+            return streaming_json_response(request, tasks, serializer_class)
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(tasks, request, view=self)
+            serializer = serializer_class(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        if shape.validated_data:
+            return Response(serializer_class(tasks, many=True).data)
+        # Same output as TaskItemSerializer without instantiating a model and serializer fields per row
+        return Response(task_reader.read(tasks))
 
     def post(self, request, format=None):
         data = request.data.copy()  # Make a copy of the request data
@@ -84,9 +158,13 @@ class ListTasks(APIView):
 class TaskDetailView(APIView):
     """ View to load a single tasks by its ID from the database. """
     
+    @etag_for(TaskItem, SubTaskItem, ContactItem, User)
     def get(self, request, pk):
-        task = TaskItem.objects.filter(id=pk)
-        serializer = TaskItemSerializer(task, many=True)
+        shape = TaskShapeSerializer(data=request.query_params)
+        if not shape.is_valid():
+            return Response(shape.errors, status=status.HTTP_400_BAD_REQUEST)
+        task = TaskItem.objects.filter(id=pk).with_shape(**shape.validated_data)
+        serializer = TaskItemSerializer(task, many=True, **shape.validated_data)
         return Response(serializer.data)
 
     def delete(self, request, pk):
@@ -113,13 +191,22 @@ class TaskDetailView(APIView):
 class ListSubTasks(APIView):
     """ View to load all subtasks from the database """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @etag_for(SubTaskItem)
+    @cache_response(SubTaskItem)
     def get(self, request, format=None):
         subtasks = SubTaskItem.objects.all()
-        serializer = SubTaskItemSerializer(subtasks, many=True)
-        return Response(serializer.data)
+        if is_stream_requested(request):
+            return streaming_json_response(request, subtasks, SubTaskItemSerializer)
+        paginator = KeysetPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(subtasks, request, view=self)
+            serializer = SubTaskItemSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        # Same output as SubTaskItemSerializer without instantiating a model and serializer fields per row
+        return Response(subtask_reader.read(subtasks))
 
     def post(self, request, format=None):
        # Extract the task and title from the request data
@@ -146,6 +233,7 @@ class ListSubTasks(APIView):
 class SubTaskDetailView(APIView):
     """ View to load a single subtasks by its ID from the database. """
     
+    @etag_for(SubTaskItem)
     def get(self, request, pk):
         subtask = SubTaskItem.objects.filter(id=pk)
         serializer = SubTaskItemSerializer(subtask, many=True)
@@ -175,6 +263,10 @@ class SubTaskDetailView(APIView):
 class TaskSubtasksView(APIView):
     """View to list all subtasks for a specific task."""
 
+    # Version, exists and select, plus the session and user lookups of DRF's default session authentication
+    query_budget = {'GET': 5}
+
+    @etag_for(SubTaskItem)
     def get(self, request, task_id, format=None):
         subtasks = SubTaskItem.objects.filter(task_id=task_id)
         
@@ -187,18 +279,27 @@ class TaskSubtasksView(APIView):
 class ListUsers(APIView):
     """ View to load all users from the database. """
     
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
+    @etag_for(User)
+    @cache_response(User)
     def get(self, request, format=None):
         users = User.objects.all() 
-        serializer = UserItemSerializer(users, many=True)
-        return Response(serializer.data)
+        if is_stream_requested(request):
+            return streaming_json_response(request, users, UserItemSerializer)
+        paginator = KeysetPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(users, request, view=self)
+            serializer = UserItemSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        # Same output as UserItemSerializer without instantiating a model and serializer fields per row
+        return Response(user_reader.read(users))
     
 class CurrentUserView(APIView):
     """ View to load the current logged in user from the database. """
     
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -210,13 +311,22 @@ class CurrentUserView(APIView):
 class ListContacts(APIView):
     """ View to load all contacts from the database """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @etag_for(ContactItem)
+    @cache_response(ContactItem)
     def get(self, request, format=None):
         contacts = ContactItem.objects.all()
-        serializer = ContactItemSerializer(contacts, many=True)
-        return Response(serializer.data)
+        if is_stream_requested(request):
+            return streaming_json_response(request, contacts, ContactItemSerializer)
+        paginator = KeysetPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(contacts, request, view=self)
+            serializer = ContactItemSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        # Same output as ContactItemSerializer without instantiating a model and serializer fields per row
+        return Response(contact_reader.read(contacts))
 
     def post(self, request, format=None):
         data = {
@@ -232,9 +342,27 @@ class ListContacts(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ContactSearchView(APIView):
+    """ View to find the first contacts whose name starts with a prefix, for the contact typeahead. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @etag_for(ContactItem)
+    @cache_response(ContactItem)
+    def get(self, request, format=None):
+        params = ContactSearchSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        ids = search_contacts(ContactItem.objects.all(), params.validated_data['prefix'], params.validated_data['limit'])
+        contacts = {contact['id']: contact for contact in contact_reader.read(ContactItem.objects.filter(pk__in=ids))}
+        return Response([contacts[pk] for pk in ids])
+
+
 class ContactDetailView(APIView):
     """ View to load a single contact by its ID from the database. """
     
+    @etag_for(ContactItem)
     def get(self, request, pk):
         contact = ContactItem.objects.filter(id=pk)
         serializer = ContactItemSerializer(contact, many=True)
@@ -259,4 +387,218 @@ class ContactDetailView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BoardView(APIView):
+    """ View to load tasks with their subtasks, contacts, users and the current user in one request. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @etag_for(TaskItem, SubTaskItem, ContactItem, User)
+    def get(self, request, format=None):
+        # One query per table, independent of the board size
+        tasks = TaskItem.objects.with_subtasks()
+        contacts = ContactItem.objects.all()
+        users = User.objects.all()
+        return Response({
+            'tasks': BoardTaskItemSerializer(tasks, many=True).data,
+            'contacts': ContactItemSerializer(contacts, many=True).data,
+            'users': UserItemSerializer(users, many=True).data,
+            'current_user': {
+                'id': request.user.id
+            },
+        })
+
+
+class BoardExportView(APIView):
+    """ View to download all contacts, tasks and subtasks as a streamed NDJSON board file. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        response = streaming_response(request, iter_board_download(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="board.ndjson"'
+        return response
+
+
+class BoardImportView(APIView):
+    """ View to import an NDJSON board file in one transaction, tasks of unknown authors belong to the current user. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        # Read the body line by line instead of parsing it into request.data, spooled before the import starts
+        if request.stream is None:
+            return Response({"error": "The board file is empty."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with spool_upload(request.stream) as upload:
+                counts = import_board(iter_lines(upload), request.user)
+        except BoardImportError as error:
+            return Response({"error": error.message, "line": error.line_number}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(counts, status=status.HTTP_201_CREATED)
+
+
+class MetricsView(View):
+    """ View to expose the request counts and latency histograms of all workers in the Prometheus text format. """
+
+    def get(self, request):
+        registry = get_registry()
+        return HttpResponse(render_prometheus(registry.collect(), registry.buckets),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ChangesView(APIView):
+    """ View to load the tasks, subtasks and contacts created, updated or deleted since a change token. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        try:
+            since = decode_change_token(request.query_params.get('since'))
+        except (ValueError, OverflowError):
+            return Response({'since': 'Invalid change token.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_changes(since))
+
+
+class BulkTasksView(APIView):
+    """ View to create (optionally with subtasks), update or delete many tasks in one transaction. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        error = check_bulk_items(request.data)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        tasks, subtasks, errors = validate_tasks_with_subtasks(request.data, request.user)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        tasks = create_tasks_with_subtasks(tasks, subtasks)
+        created = TaskItem.objects.filter(pk__in=[task.pk for task in tasks]).with_subtasks().order_by('id')
+        serializer = BoardTaskItemSerializer(created, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, format=None):
+        error = check_bulk_items(request.data)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        tasks, errors = update_items(TaskItem, TaskItemSerializer, request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        updated = TaskItem.objects.filter(pk__in=[task.pk for task in tasks]).with_subtask_ids().order_by('id')
+        serializer = TaskItemSerializer(updated, many=True)
+        return Response(serializer.data)
+
+    def delete(self, request, format=None):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        error = check_bulk_ids(ids)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        missing = delete_items(TaskItem, ids)
+        if missing:
+            return Response({'missing': missing}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkSubTasksView(APIView):
+    """ View to create, update or delete many subtasks in one transaction. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        error = check_bulk_items(request.data)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        subtasks, errors = create_items(SubTaskItem, SubTaskItemSerializer, request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = SubTaskItemSerializer(subtasks, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, format=None):
+        error = check_bulk_items(request.data)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        subtasks, errors = update_items(SubTaskItem, SubTaskItemSerializer, request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = SubTaskItemSerializer(subtasks, many=True)
+        return Response(serializer.data)
+
+    def delete(self, request, format=None):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        error = check_bulk_ids(ids)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        missing = delete_items(SubTaskItem, ids)
+        if missing:
+            return Response({'missing': missing}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MoveTasksView(APIView):
+    """ View to move many tasks to new states and positions on the board in one transaction. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        error = check_bulk_items(request.data)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        moves, errors = validate_moves(request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        missing = move_tasks(moves)
+        if missing:
+            return Response({'missing': missing}, status=status.HTTP_404_NOT_FOUND)
+
+        moved = TaskItem.objects.filter(pk__in=[move['id'] for move in moves]).with_subtask_ids().order_by('state', 'position', 'id')
+        serializer = TaskItemSerializer(moved, many=True)
+        return Response(serializer.data)
+
+
+class EventsView(APIView):
+    """ View to stream task, subtask and contact changes as Server-Sent Events. """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # EventSource asks for text/event-stream, errors are still rendered as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, format=None):
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_event_id = None
+
+        get_broker().start()
+        # Subscribe before returning so no event between now and the first read is lost
+        subscription = hub.subscribe(last_event_id)
+        # Under ASGI the stream waits for events on the event loop instead of holding a thread
+        events = aiter_events(subscription) if is_asgi_request(request) else iter_events(subscription)
+        response = streaming_response(request, events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
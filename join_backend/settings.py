@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First so their timings cover the other middleware as well
+    'join.metrics.MetricsMiddleware',
+    'join.middleware.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -84,6 +88,82 @@ DATABASES = {
     }
 }
 
+# Pragmas run on every new SQLite connection by join.db.configure_sqlite_connection
+JOIN_SQLITE_PRAGMAS = {}
+JOIN_SQLITE_PRODUCTION_PRAGMAS = {
+    # Readers no longer block writers and the other way around
+    'journal_mode': 'WAL',
+    # Durable against application crashes, a power loss may only lose the last commits
+    'synchronous': 'NORMAL',
+    # Negative values are KiB, 64 MB page cache per connection
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+# Production profile for several gunicorn workers sharing one SQLite file, enabled with JOIN_DATABASE_PROFILE=production
+if os.environ.get('JOIN_DATABASE_PROFILE') == 'production':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'join.sqlite_backend',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Keep the connection and its page cache between requests
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds to wait for the write lock, taken at BEGIN so waiting actually helps
+                'timeout': 5,
+                'transaction_mode': 'IMMEDIATE',
+            },
+        },
+    }
+    JOIN_SQLITE_PRAGMAS = JOIN_SQLITE_PRODUCTION_PRAGMAS
+    if os.environ.get('JOIN_DATABASE_READ_REPLICA') == '1':
+        # Separate read-only connection for reads outside of transactions, see join.db.ReadReplicaRouter
+        DATABASES['replica'] = {
+            'ENGINE': 'join.sqlite_backend',
+            'NAME': f'file:{BASE_DIR / "db.sqlite3"}?mode=ro',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'timeout': 5},
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_ROUTERS = ['join.db.ReadReplicaRouter']
+        JOIN_READ_DATABASE = 'replica'
+
+
+# Password hashing, PBKDF2 runs on a bounded pool of JOIN_HASHING_WORKERS threads (default: half the cores)
+# and logins/registrations beyond the workers plus JOIN_HASHING_QUEUE_SIZE waiting ones are answered with 503
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+
+PASSWORD_HASHERS = [
+    'join.hashing.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+JOIN_HASHING_WORKERS = None
+JOIN_HASHING_QUEUE_SIZE = 16
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ['join.throttling.SlidingWindowThrottle'],
+    # Client IPs are taken from REMOTE_ADDR, set to the number of proxies in front of the app to use X-Forwarded-For
+    'NUM_PROXIES': 0,
+}
+
+# Requests per user (per IP address before login) and window, by view throttle_scope, 'write' covers the unsafe
+# methods of all other views. Counters are kept per process, use 'join.throttling.CacheBackend' with a cache that
+# is actually shared (JOIN_THROTTLE_CACHE_ALIAS), e.g. memcached, redis or a FileBasedCache, to count across workers.
+# A LocMemCache is per process as well.
+JOIN_THROTTLE_RATES = {
+    'login': '30/min',
+    'register': '20/hour',
+    'write': '600/min',
+}
+JOIN_THROTTLE_BACKEND = 'join.throttling.InProcessBackend'
+JOIN_THROTTLE_CACHE_ALIAS = 'default'
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -129,4 +209,55 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:4200",  
-]
\ No newline at end of file
+]
+
+# Keyset pagination for the list endpoints (opt-in via ?page_size= or ?cursor=)
+
+JOIN_PAGE_SIZE = 50
+JOIN_MAX_PAGE_SIZE = 500
+
+# Rows fetched per database round-trip for ?stream=1 responses
+JOIN_STREAM_CHUNK_SIZE = 2000
+
+# Safety margin for /api/v1/changes/ so rows committed late are not skipped (clients may see them twice)
+JOIN_CHANGES_OVERLAP_SECONDS = 2
+
+# Maximum number of items accepted by the bulk endpoints
+JOIN_BULK_MAX_ITEMS = 1000
+
+# In-process cache of resolved auth tokens, entries changed by another worker expire after the TTL (seconds)
+JOIN_TOKEN_CACHE_SIZE = 1024
+JOIN_TOKEN_CACHE_TTL = 60
+
+# Server-Sent Events at /api/v1/events/, use 'join.events.FileBroker' to share events between the workers of one host.
+# Under WSGI every open stream holds a worker thread until it times out, serve them with ASGI where an idle stream only
+# holds a task of the event loop
+JOIN_EVENTS_BROKER = 'join.events.InProcessBroker'
+JOIN_EVENTS_FILE = BASE_DIR / 'events.ndjson'
+JOIN_EVENTS_HEARTBEAT = 15
+JOIN_EVENTS_STREAM_TIMEOUT = 300
+
+# Cache used for the rendered list responses, entries are keyed by the model versions in the database so every
+# worker sees writes of the others right away, a shared backend only lets workers reuse each other's entries
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+JOIN_RESPONSE_CACHE_ALIAS = 'default'
+# Seconds, 0 turns the cache off (used by manage.py bench_load for the server processes)
+JOIN_RESPONSE_CACHE_TIMEOUT = int(os.environ.get('JOIN_RESPONSE_CACHE_TIMEOUT', 300))
+
+# Server-Timing header of every response and the slow request log of join.middleware.PerformanceMiddleware
+# (join.performance logger, None disables it), views may also set a query_budget
+JOIN_SERVER_TIMING = True
+JOIN_SLOW_REQUEST_MS = 500
+
+# Request metrics served at /metrics. With several worker processes every worker writes a memory-mapped file to
+# JOIN_METRICS_DIR and /metrics adds them up, empty the directory before starting the server. Without a directory
+# the metrics only cover the process answering /metrics.
+JOIN_METRICS_DIR = os.environ.get('JOIN_METRICS_DIR')
+JOIN_METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
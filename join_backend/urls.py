@@ -14,8 +14,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
-from join.views import LoginView, RegisterView, ListTasks, TaskDetailView, ListUsers, CurrentUserView, ListContacts, ContactDetailView, ListSubTasks, SubTaskDetailView, TaskSubtasksView
+from django.urls import path, include
+from join.views import LoginView, RegisterView, ListTasks, TaskDetailView, ListUsers, CurrentUserView, ListContacts, ContactDetailView, ContactSearchView, ListSubTasks, SubTaskDetailView, TaskSubtasksView, BoardView, BoardExportView, BoardImportView, ChangesView, BulkTasksView, BulkSubTasksView, MoveTasksView, EventsView, MetricsView
+from join.async_views import AsyncListTasks, AsyncTaskDetailView, AsyncListSubTasks, AsyncSubTaskDetailView, AsyncTaskSubtasksView, AsyncListContacts, AsyncContactDetailView, AsyncListUsers
+
+# Async variants of the read endpoints for ASGI deployments (join_backend.asgi)
+async_urlpatterns = [
+    path('tasks/', AsyncListTasks.as_view()),
+    path('tasks/<int:pk>/', AsyncTaskDetailView.as_view()),
+    path('tasks/<int:task_id>/subtasks/', AsyncTaskSubtasksView.as_view()),
+    path('subtasks/', AsyncListSubTasks.as_view()),
+    path('subtasks/<int:pk>/', AsyncSubTaskDetailView.as_view()),
+    path('contacts/', AsyncListContacts.as_view()),
+    path('contacts/<int:pk>/', AsyncContactDetailView.as_view()),
+    path('users/', AsyncListUsers.as_view()),
+]
 
 
 urlpatterns = [
@@ -24,11 +37,23 @@ urlpatterns = [
     path('api/v1/register/', RegisterView.as_view()),
     path('api/v1/tasks/', ListTasks.as_view()),
     path('api/v1/tasks/<int:pk>/', TaskDetailView.as_view()),
+    path('api/v1/tasks/bulk/', BulkTasksView.as_view()),
+    path('api/v1/tasks/move/', MoveTasksView.as_view()),
     path('api/v1/subtasks/', ListSubTasks.as_view()),
     path('api/v1/subtasks/<int:pk>/', SubTaskDetailView.as_view()),
+    path('api/v1/subtasks/bulk/', BulkSubTasksView.as_view()),
     path('api/v1/tasks/<int:task_id>/subtasks/', TaskSubtasksView.as_view(), name='task-subtasks'),
     path('api/v1/contacts/', ListContacts.as_view()),
+    path('api/v1/contacts/search/', ContactSearchView.as_view()),
     path('api/v1/contacts/<int:pk>/', ContactDetailView.as_view()),
     path('api/v1/users/', ListUsers.as_view()),
     path('api/v1/current_user/', CurrentUserView.as_view()),
+    path('api/v1/board/', BoardView.as_view()),
+    path('api/v1/board/export/', BoardExportView.as_view()),
+    path('api/v1/board/import/', BoardImportView.as_view()),
+    path('api/v1/changes/', ChangesView.as_view()),
+    path('api/v1/events/', EventsView.as_view()),
+    # Prometheus scrape target
+    path('metrics', MetricsView.as_view()),
+    path('api/v1/async/', include(async_urlpatterns)),
 ]